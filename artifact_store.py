@@ -0,0 +1,272 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# The field of a record whose value is not a dict and is stored in one piece
+WHOLE_RECORD = "\x00"
+
+_store = None
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+def _rows(value) -> list:
+    """
+    Splits a record into (field, compressed value) rows: one per key of a non-empty dict, one for anything else.
+    """
+    if isinstance(value, dict) and value:
+        return [(field, _pack(field_value)) for field, field_value in value.items()]
+    return [(WHOLE_RECORD, _pack(value))]
+
+
+class ArtifactStore:
+    """
+    Stores the {key: record} artifacts of an organization (website map, captions, audits, output reports)
+    in a single SQLite file instead of one indented JSON file each.
+
+    Every record is indexed by artifact name and key (a URL), dict records are further split into one
+    row per field (a stakeholder, or 'text'/'links'), and every row is zlib-compressed JSON. Artifacts
+    are read through StoredMapping, which loads a record only when it is accessed.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): The SQLite file. Parent folders are created if needed.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS artifacts (name TEXT PRIMARY KEY)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "artifact TEXT NOT NULL, key TEXT NOT NULL, field TEXT NOT NULL, position INTEGER NOT NULL, "
+            "value BLOB NOT NULL, PRIMARY KEY (artifact, key, field))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS records_position ON records (artifact, position)")
+        self._conn.commit()
+
+    def exists(self, name: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM artifacts WHERE name = ?", (name,)).fetchone() is not None
+
+    def names(self) -> list:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT name FROM artifacts ORDER BY name")]
+
+    def mapping(self, name: str):
+        """
+        Returns a lazy view of an artifact, or None if the store does not hold it.
+        """
+        return StoredMapping(self, name) if self.exists(name) else None
+
+    def keys(self, name: str) -> list:
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT key FROM records WHERE artifact = ? GROUP BY key ORDER BY MIN(position)", (name,))]
+
+    def count(self, name: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(DISTINCT key) FROM records WHERE artifact = ?", (name,)).fetchone()[0]
+
+    def contains(self, name: str, key: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM records WHERE artifact = ? AND key = ? LIMIT 1",
+                                      (name, key)).fetchone() is not None
+
+    def get(self, name: str, key: str):
+        """
+        Loads one record. Raises KeyError if the artifact has no record under key.
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT field, value FROM records WHERE artifact = ? AND key = ? ORDER BY rowid",
+                                      (name, key)).fetchall()
+        if not rows:
+            raise KeyError(key)
+        if rows[0][0] == WHOLE_RECORD:
+            return _unpack(rows[0][1])
+        return {field: _unpack(value) for field, value in rows}
+
+    def put(self, name: str, key: str, value):
+        """
+        Writes one record, keeping its position if it replaces an existing one.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT MIN(position) FROM records WHERE artifact = ? AND key = ?",
+                                     (name, key)).fetchone()
+            position = row[0]
+            if position is None:
+                position = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM records WHERE artifact = ?",
+                                              (name,)).fetchone()[0]
+            self._conn.execute("INSERT OR IGNORE INTO artifacts (name) VALUES (?)", (name,))
+            self._conn.execute("DELETE FROM records WHERE artifact = ? AND key = ?", (name, key))
+            self._conn.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?)",
+                                   [(name, key, field, position, blob) for field, blob in _rows(value)])
+            self._conn.commit()
+
+    def delete(self, name: str, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM records WHERE artifact = ? AND key = ?", (name, key))
+            self._conn.commit()
+
+    def replace(self, name: str, data):
+        """
+        Replaces a whole artifact with the records of a mapping, in one transaction.
+        """
+        if isinstance(data, StoredMapping) and data.store is self and data.name == name:
+            # Already written record by record
+            return
+        rows = [(name, key, field, position, blob)
+                for position, (key, value) in enumerate(data.items()) for field, blob in _rows(value)]
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO artifacts (name) VALUES (?)", (name,))
+            self._conn.execute("DELETE FROM records WHERE artifact = ?", (name,))
+            self._conn.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def import_json(self, name: str, path: str):
+        """
+        Loads an artifact from its JSON file. A list of single-entry dicts (the old captions format) is merged into one dict.
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {key: value for entry in data for key, value in entry.items()}
+        self.replace(name, data)
+
+    def export_json(self, name: str, path: str):
+        """
+        Writes an artifact to a JSON file in the format the stages wrote before the store existed.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(StoredMapping(self, name).to_dict(), f, indent=4, ensure_ascii=False)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class StoredMapping(MutableMapping):
+    """
+    A dict-like view of one artifact of an ArtifactStore. Records are loaded when they are accessed
+    (with a small cache of recently used ones) and written through on assignment.
+    """
+
+    def __init__(self, store: ArtifactStore, name: str, cache_size: int = 128):
+        self.store = store
+        self.name = name
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        value = self.store.get(self.name, key)
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.put(self.name, key, value)
+        self._cache.pop(key, None)
+
+    def __delitem__(self, key):
+        if not self.store.contains(self.name, key):
+            raise KeyError(key)
+        self.store.delete(self.name, key)
+        self._cache.pop(key, None)
+
+    def __contains__(self, key):
+        return key in self._cache or self.store.contains(self.name, key)
+
+    def __iter__(self):
+        return iter(self.store.keys(self.name))
+
+    def __len__(self):
+        return self.store.count(self.name)
+
+    def to_dict(self) -> dict:
+        return {key: self.store.get(self.name, key) for key in self}
+
+
+def configure_artifact_store(path: str) -> ArtifactStore:
+    """
+    Routes every load_artifact/save_artifact call to an ArtifactStore at path.
+    """
+    global _store
+    _store = ArtifactStore(path)
+    return _store
+
+
+def get_artifact_store():
+    return _store
+
+
+def artifact_name(path: str) -> str:
+    """
+    Returns the name of the artifact stored in place of a JSON file, e.g. HillelSv/website_audit.json -> website_audit.
+    """
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def load_artifact(path: str):
+    """
+    Loads the artifact of a JSON file path: lazily from the configured store (importing the JSON file the first
+    time it is asked for), or from the JSON file itself when no store is configured.
+    Returns:
+        The artifact as a mapping, or None if it does not exist.
+    """
+    if _store is None:
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    name = artifact_name(path)
+    if not _store.exists(name) and os.path.exists(path):
+        _store.import_json(name, path)
+    return _store.mapping(name)
+
+
+def save_artifact(path: str, data):
+    """
+    Saves the artifact of a JSON file path to the configured store, or to the JSON file when no store is configured.
+    """
+    if _store is None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+    else:
+        _store.replace(artifact_name(path), data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy an organization's artifacts between its store and JSON files.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("org_name", help="The folder holding artifacts.sqlite and the JSON files.")
+    args = parser.parse_args()
+    store = ArtifactStore(os.path.join(args.org_name, "artifacts.sqlite"))
+    if args.command == "import":
+        for json_file in sorted(os.listdir(args.org_name)):
+            if json_file.endswith(".json"):
+                store.import_json(artifact_name(json_file), os.path.join(args.org_name, json_file))
+                print(f"Imported {json_file}")
+    else:
+        for name in store.names():
+            store.export_json(name, os.path.join(args.org_name, f"{name}.json"))
+            print(f"Exported {name}.json")
@@ -1,9 +1,34 @@
-import json
+import asyncio
+from typing import List
+
+from langchain_core.messages import AIMessage
+from pydantic import BaseModel, Field
+
+from audit_parser import parse_audit_text
+from boilerplate import SITE_CHROME
+from call_planner import CallPlanner
+from incremental import IncrementalArtifact, content_hash, page_hash
+from llm_executor import LLMExecutor
+from model_router import get_model_router
+from near_duplicates import near_duplicate_representatives
+from telemetry import traced
+
+# The audit of an empty page or of a page without images, answered without calling the model
+EMPTY_AUDIT = AIMessage(content="")
+
+
+def is_tagged_audit(response) -> bool:
+    """
+    Returns True if an audit answer has benefit/drawback sections, or a grouped answer has at least one audit;
+    others are escalated to a larger model.
+    """
+    if isinstance(response, MultiStakeholderAudit):
+        return bool(response.audits)
+    return parse_audit_text(response.content) is not None
 
-from langchain_openai import ChatOpenAI
 
 def summarize_content(webpage_content, system_prompt):
-    llm = ChatOpenAI(model='gpt-4o')
+    llm = get_model_router().model("mission_statement")
     response = llm.invoke(system_prompt + webpage_content)
     return response
 
@@ -13,11 +38,8 @@ def generate_mission_statement(homepage_text:str) -> str:
     return summarize_content(webpage_content=homepage_text, system_prompt=system_prompt).content
 
 
-def audit_website(website_map:dict, stakeholders:dict,mission_statement:str,output_map_path:str=None):
-    output_map = {}
-    for page, data in website_map.items():
-        for stakeholder, description in stakeholders.items():
-            system_prompt = """
+def website_audit_prompt(stakeholder: str, description: str, mission_statement: str) -> str:
+    return """
                  "Tags refer to opening and closing XML tags.
                  All benefits and drawbacks sit inside {stakeholder} tags.
                  Cover the benefits and drawbacks from the perspective of {stakeholder}: {description}.
@@ -29,28 +51,10 @@ def audit_website(website_map:dict, stakeholders:dict,mission_statement:str,outp
                  Provide no introduction, no precursor and no post cursor.\n"
                  """.format(stakeholder=stakeholder, description=description,
                             mission_statement=mission_statement.replace("\n", " "))
-            summary = summarize_content(data['text'], system_prompt)
-            if not page in output_map:
-                output_map[page] = {stakeholder: summary.content}
-            else:
-                output_map[page][stakeholder] = summary.content
-    if output_map_path:
-        with open(output_map_path, 'w') as f:
-            json.dump(output_map, f, indent=4)
-    return output_map
 
 
-
-def audit_images(captions, website_map,base_url,stakeholders,output_map_path=None):
-    # captions_dict = {k: v for caption in captions for k, v in caption.items()}
-    summaries_map = {}
-    for url, data in website_map.items():
-        links = data['links']
-        if url.startswith(base_url):
-            image_captions = [captions[link] for link in links if link.startswith(base_url) and (link.endswith('.jpg') or link.endswith('.png'))]
-            images_text = "\n".join(image_captions)
-            for stakeholder, description in stakeholders.items():
-                system_prompt = """
+def images_audit_prompt(stakeholder: str, description: str) -> str:
+    return """
                      "Tags refer to opening and closing XML tags.
                      All benefits and drawbacks sit inside {stakeholder} tags.
                      Cover the benefits and drawbacks from the perspective of {stakeholder}: {description}.
@@ -60,19 +64,265 @@ def audit_images(captions, website_map,base_url,stakeholders,output_map_path=Non
                      List all benefits first and then all drawbacks second.
                      Provide no introduction, no precursor and no post cursor.\n"
                      """.format(stakeholder=stakeholder, description=description)
-                try:
-                    summary = summarize_content(images_text, system_prompt)
-                    if not url in summaries_map:
-                        summaries_map[url] = {stakeholder: summary.content}
-                    else:
-                        summaries_map[url][stakeholder] = summary.content
-                except Exception as e:
-                    summary = ""
-                    if not url in summaries_map:
-                        summaries_map[url] = {stakeholder: summary}
-                    else:
-                        summaries_map[url][stakeholder] = summary
-    if output_map_path:
-        with open(output_map_path, 'w') as f:
-            json.dump(summaries_map, f, indent=4)
-    return summaries_map
\ No newline at end of file
+
+
+def multi_stakeholder_prompt(stakeholders: dict, subject: str, mission_statement: str = None) -> str:
+    stakeholder_lines = "\n".join(f"- {stakeholder}: {description}" for stakeholder, description in stakeholders.items())
+    prompt = (f"Cover the benefits and drawbacks of {subject} from the perspective of each of these stakeholders:\n"
+              f"{stakeholder_lines}\n"
+              "Provide specific examples as to how the content affects or informs each stakeholder.\n")
+    if mission_statement:
+        prompt += "Keep this in the lens of the mission statement {}.\n".format(mission_statement.replace("\n", " "))
+    return prompt + ("Return exactly one entry per stakeholder, using the stakeholder names exactly as given.\n"
+                     "Provide no introduction, no precursor and no post cursor.\n")
+
+
+class StakeholderAudit(BaseModel):
+    stakeholder: str = Field(description="The stakeholder name, exactly as given.")
+    benefits: List[str] = Field(description="The benefits of the content for the stakeholder, with specific examples.")
+    drawbacks: List[str] = Field(description="The drawbacks of the content for the stakeholder, with specific examples.")
+
+
+class MultiStakeholderAudit(BaseModel):
+    audits: List[StakeholderAudit] = Field(description="One audit per stakeholder.")
+
+
+def format_audit(stakeholder: str, audit: StakeholderAudit) -> str:
+    """
+    Renders a structured audit in the same tagged text format as the per-stakeholder audit prompts produce.
+    """
+    benefits = "\n".join(f"<benefit>{benefit}</benefit>" for benefit in audit.benefits)
+    drawbacks = "\n".join(f"<drawback>{drawback}</drawback>" for drawback in audit.drawbacks)
+    return f"<{stakeholder}>\n{benefits}\n{drawbacks}\n</{stakeholder}>"
+
+
+async def _audit_cells(name: str, cells: list, artifact: IncrementalArtifact, llm, executor: LLMExecutor, single_prompt,
+                       group_prompt, group_size: int = None, return_exceptions: bool = False):
+    """
+    Runs the LLM calls for every stale cell and stores the results in the artifact.
+    The calls are planned first: cells with empty content get an empty audit without a call, and cells
+    whose prompt and content are identical share a single call.
+    Args:
+        name (str): The name of the audit in the printed call-plan report.
+        cells (list): (page, stakeholder, description, cell_hash, content) tuples, in output order.
+        artifact (IncrementalArtifact): The artifact the results are stored in.
+        llm: The chat model to use.
+        executor (LLMExecutor): The concurrency cap, rate limiter and retry policy of the calls.
+        single_prompt (callable): Builds the prompt of one stakeholder from (stakeholder, description).
+        group_prompt (callable): Builds the prompt of several stakeholders from a {stakeholder: description} dict.
+        group_size (int, optional): Send each page once for up to group_size stakeholders instead of once per stakeholder.
+        return_exceptions (bool): Store an empty, unhashed cell for calls that failed instead of raising.
+    """
+    singles = cells
+    if group_size:
+        # Empty pages are answered with an empty audit by the single-stakeholder plan, without a call
+        singles = [cell for cell in cells if not cell[4].strip()]
+        groups = {}
+        for cell in cells:
+            if not cell[4].strip():
+                continue
+            page_groups = groups.setdefault(cell[0], [[]])
+            if len(page_groups[-1]) == group_size:
+                page_groups.append([])
+            page_groups[-1].append(cell)
+        batches = [batch for page_groups in groups.values() for batch in page_groups]
+        planner = CallPlanner(f"{name} (grouped)", empty_result=EMPTY_AUDIT)
+        for batch in batches:
+            planner.add(group_prompt({cell[1]: cell[2] for cell in batch}), batch[0][4])
+        structured_llm = llm.with_structured_output(MultiStakeholderAudit)
+        labels = [{"stakeholder": sorted({cell[1] for slot in planner.slots_for(index) for cell in batches[slot]})}
+                  for index in range(len(planner.calls))]
+        responses = await executor.map(structured_llm, [prompt + content for prompt, content in planner.calls],
+                                       return_exceptions=True, labels=labels)
+        planner.report()
+        for batch, response in zip(batches, planner.fan_out(responses)):
+            audits = {} if not isinstance(response, MultiStakeholderAudit) else {
+                " ".join(audit.stakeholder.split()).lower(): audit for audit in response.audits
+            }
+            for cell in batch:
+                page, stakeholder, _, cell_hash, _ = cell
+                audit = audits.get(" ".join(stakeholder.split()).lower())
+                if audit is None:
+                    # Fall back to a single-stakeholder call for anything the grouped answer left out
+                    singles.append(cell)
+                else:
+                    artifact.set(page, stakeholder, format_audit(stakeholder, audit), cell_hash)
+    planner = CallPlanner(name, empty_result=EMPTY_AUDIT)
+    for _, stakeholder, description, _, content in singles:
+        planner.add(single_prompt(stakeholder, description), content)
+    labels = [{"stakeholder": sorted({singles[slot][1] for slot in planner.slots_for(index)})}
+              for index in range(len(planner.calls))]
+    summaries = await executor.map(llm, [prompt + content for prompt, content in planner.calls],
+                                   return_exceptions=return_exceptions, labels=labels)
+    planner.report()
+    for (page, stakeholder, _, cell_hash, _), summary in zip(singles, planner.fan_out(summaries)):
+        if isinstance(summary, Exception):
+            # Stored without a hash so the cell is retried on the next run
+            artifact.set(page, stakeholder, "")
+        else:
+            artifact.set(page, stakeholder, summary.content, cell_hash)
+
+
+@traced("website_audit", count=len)
+async def audit_website_async(website_map:dict, stakeholders:dict,mission_statement:str,output_map_path:str=None,
+                              llm=None, executor:LLMExecutor=None, group_size:int=None,
+                              near_duplicate_threshold:float=None, artifact:IncrementalArtifact=None):
+    """
+    Audits every page of the website for every stakeholder, running the LLM calls concurrently.
+    If output_map_path already holds a previous audit, only the page/stakeholder cells whose page text,
+    stakeholder description or mission statement changed are recomputed; the others are reused.
+    Args:
+        website_map (dict): The content map of the website, keyed by URL.
+        stakeholders (dict): The stakeholder descriptions, keyed by stakeholder name.
+        mission_statement (str): The mission statement of the organization.
+        output_map_path (str, optional): The JSON file to merge the audit into.
+        llm (optional): The chat model to use. Defaults to the model the router picks for the stage.
+        executor (LLMExecutor, optional): The concurrency cap, rate limiter and retry policy of the calls.
+        group_size (int, optional): Audit up to group_size stakeholders with a single structured call per page,
+            instead of one call per stakeholder. The output has the same shape either way.
+        near_duplicate_threshold (float, optional): Audit each cluster of pages whose texts are at least this
+            similar (SimHash) once, through its first page, and attribute the result to every page of the cluster.
+        artifact (IncrementalArtifact, optional): Store the cells in this artifact instead of one opened from
+            output_map_path; the caller saves it. Lets the pipeline audit a site in several batches.
+    Returns:
+        dict: The audit text for each page and stakeholder.
+    """
+    llm = llm or get_model_router().model("website_audit", validate=is_tagged_audit)
+    executor = executor or LLMExecutor()
+    owns_artifact = artifact is None
+    if owns_artifact:
+        artifact = IncrementalArtifact(output_map_path)
+    representatives = near_duplicate_representatives(website_map, near_duplicate_threshold) if near_duplicate_threshold else {}
+    cells = []
+    for page in website_map:
+        # Near-duplicates are audited with the text of their representative, so the call planner collapses them
+        data = website_map[representatives.get(page, page)]
+        for stakeholder, description in stakeholders.items():
+            cell_hash = content_hash(page_hash(data), stakeholder, description, mission_statement)
+            if artifact.is_fresh(page, stakeholder, cell_hash):
+                continue
+            artifact.reserve(page, stakeholder)
+            cells.append((page, stakeholder, description, cell_hash, data['text']))
+    await _audit_cells("audit_website", cells, artifact, llm, executor,
+                       lambda stakeholder, description: website_audit_prompt(stakeholder, description, mission_statement),
+                       lambda group: multi_stakeholder_prompt(group, "this web page content", mission_statement),
+                       group_size)
+    if owns_artifact:
+        artifact.save()
+    return artifact.results
+
+
+def audit_website(website_map:dict, stakeholders:dict,mission_statement:str,output_map_path:str=None,
+                  llm=None, executor:LLMExecutor=None, group_size:int=None, near_duplicate_threshold:float=None):
+    """
+    Synchronous entry point of audit_website_async.
+    """
+    return asyncio.run(audit_website_async(website_map, stakeholders, mission_statement, output_map_path, llm, executor,
+                                           group_size, near_duplicate_threshold))
+
+
+@traced("site_chrome_audit")
+async def audit_site_chrome_async(site_chrome: str, stakeholders: dict, mission_statement: str,
+                                  output_map_path: str = None, llm=None, executor: LLMExecutor = None,
+                                  group_size: int = None):
+    """
+    Audits the site chrome (the header, nav menu and footer stripped from every page, see boilerplate.py) once
+    for every stakeholder, instead of once per page. Only the stakeholders whose cell changed are recomputed.
+    Args:
+        site_chrome (str): The site chrome text.
+        stakeholders (dict): The stakeholder descriptions, keyed by stakeholder name.
+        mission_statement (str): The mission statement of the organization.
+        output_map_path (str, optional): The JSON file to merge the audit into, e.g. site_chrome_audit.json.
+        llm (optional): The chat model to use. Defaults to the model the router picks for the website audit.
+        executor (LLMExecutor, optional): The concurrency cap, rate limiter and retry policy of the calls.
+        group_size (int, optional): Audit up to group_size stakeholders with a single structured call.
+    Returns:
+        dict: The audit text for each stakeholder.
+    """
+    llm = llm or get_model_router().model("website_audit", validate=is_tagged_audit)
+    executor = executor or LLMExecutor()
+    artifact = IncrementalArtifact(output_map_path)
+    content = "The header, navigation menu and footer shown on every page of the website:\n" + site_chrome
+    cells = []
+    for stakeholder, description in stakeholders.items():
+        cell_hash = content_hash(site_chrome, stakeholder, description, mission_statement)
+        if artifact.is_fresh(SITE_CHROME, stakeholder, cell_hash):
+            continue
+        artifact.reserve(SITE_CHROME, stakeholder)
+        cells.append((SITE_CHROME, stakeholder, description, cell_hash, content if site_chrome else ""))
+    await _audit_cells("audit_site_chrome", cells, artifact, llm, executor,
+                       lambda stakeholder, description: website_audit_prompt(stakeholder, description, mission_statement),
+                       lambda group: multi_stakeholder_prompt(group, "the header, navigation menu and footer",
+                                                              mission_statement),
+                       group_size, return_exceptions=True)
+    artifact.save()
+    return dict(artifact.results.get(SITE_CHROME, {}))
+
+
+def audit_site_chrome(site_chrome: str, stakeholders: dict, mission_statement: str, output_map_path: str = None,
+                      llm=None, executor: LLMExecutor = None, group_size: int = None):
+    """
+    Synchronous entry point of audit_site_chrome_async.
+    """
+    return asyncio.run(audit_site_chrome_async(site_chrome, stakeholders, mission_statement, output_map_path, llm,
+                                               executor, group_size))
+
+
+@traced("images_audit", count=len)
+async def audit_images_async(captions, website_map,base_url,stakeholders,output_map_path=None,
+                             llm=None, executor:LLMExecutor=None, group_size:int=None,
+                             artifact:IncrementalArtifact=None):
+    """
+    Audits the captions of the images linked from every page for every stakeholder, running the LLM calls concurrently.
+    If output_map_path already holds a previous audit, only the page/stakeholder cells whose captions
+    or stakeholder description changed are recomputed; the others are reused.
+    Args:
+        captions (dict): The caption of each image, keyed by image URL.
+        website_map (dict): The content map of the website, keyed by URL.
+        base_url (str): The base URL of the website.
+        stakeholders (dict): The stakeholder descriptions, keyed by stakeholder name.
+        output_map_path (str, optional): The JSON file to merge the audit into.
+        llm (optional): The chat model to use. Defaults to the model the router picks for the stage.
+        executor (LLMExecutor, optional): The concurrency cap, rate limiter and retry policy of the calls.
+        group_size (int, optional): Audit up to group_size stakeholders with a single structured call per page,
+            instead of one call per stakeholder. The output has the same shape either way.
+        artifact (IncrementalArtifact, optional): Store the cells in this artifact instead of one opened from
+            output_map_path; the caller saves it.
+    Returns:
+        dict: The audit text for each page and stakeholder.
+    """
+    # captions_dict = {k: v for caption in captions for k, v in caption.items()}
+    llm = llm or get_model_router().model("images_audit", validate=is_tagged_audit)
+    executor = executor or LLMExecutor()
+    owns_artifact = artifact is None
+    if owns_artifact:
+        artifact = IncrementalArtifact(output_map_path)
+    cells = []
+    for url, data in website_map.items():
+        links = data['links']
+        if url.startswith(base_url):
+            # Images whose download or captioning failed have no caption and are left out
+            image_captions = [captions[link] for link in links if link.startswith(base_url) and (link.endswith('.jpg') or link.endswith('.png'))
+                              and link in captions]
+            images_text = "\n".join(image_captions)
+            for stakeholder, description in stakeholders.items():
+                cell_hash = content_hash(images_text, stakeholder, description)
+                if artifact.is_fresh(url, stakeholder, cell_hash):
+                    continue
+                artifact.reserve(url, stakeholder)
+                cells.append((url, stakeholder, description, cell_hash, images_text))
+    await _audit_cells("audit_images", cells, artifact, llm, executor, images_audit_prompt,
+                       lambda group: multi_stakeholder_prompt(group, "the images described below"),
+                       group_size, return_exceptions=True)
+    if owns_artifact:
+        artifact.save()
+    return artifact.results
+
+
+def audit_images(captions, website_map,base_url,stakeholders,output_map_path=None,
+                 llm=None, executor:LLMExecutor=None, group_size:int=None):
+    """
+    Synchronous entry point of audit_images_async.
+    """
+    return asyncio.run(audit_images_async(captions, website_map, base_url, stakeholders, output_map_path, llm, executor,
+                                          group_size))
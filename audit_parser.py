@@ -0,0 +1,70 @@
+import re
+from typing import Optional
+
+SECTION_KINDS = {
+    "benefit": "benefits", "benefits": "benefits", "advantage": "benefits", "advantages": "benefits",
+    "pro": "benefits", "pros": "benefits", "strength": "benefits", "strengths": "benefits",
+    "drawback": "drawbacks", "drawbacks": "drawbacks", "disadvantage": "drawbacks", "disadvantages": "drawbacks",
+    "con": "drawbacks", "cons": "drawbacks", "weakness": "drawbacks", "weaknesses": "drawbacks",
+}
+_KIND_NAMES = "|".join(sorted(SECTION_KINDS, key=len, reverse=True))
+# <benefit>, </benefit>, <Benefits class="x">, [drawback], ...
+TAG_PATTERN = re.compile(rf"[<\[]\s*(/?)\s*({_KIND_NAMES})\b[^<>\[\]\n]*[>\]]", re.IGNORECASE)
+# "Benefits:", "## Drawbacks", "**Benefits**" on a line of their own
+HEADING_PATTERN = re.compile(rf"^[ \t]*(?:#+[ \t]*)?\**[ \t]*({_KIND_NAMES})[ \t]*\**[ \t]*:?[ \t]*\**[ \t]*$",
+                             re.IGNORECASE | re.MULTILINE)
+BULLET_PATTERN = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+ANY_TAG_PATTERN = re.compile(r"</?[^<>\n]{1,80}>")
+
+
+def _split_items(section: str) -> list:
+    """
+    Splits the text of a section into findings: one per bullet or numbered line (continuation lines are
+    appended to the previous finding), or the whole section if it has no bullets.
+    """
+    section = ANY_TAG_PATTERN.sub(" ", section)
+    lines = [line for line in section.splitlines() if line.strip()]
+    items = []
+    if any(BULLET_PATTERN.match(line) for line in lines):
+        for line in lines:
+            if BULLET_PATTERN.match(line) or not items:
+                items.append(BULLET_PATTERN.sub("", line))
+            else:
+                items[-1] += " " + line.strip()
+    elif lines:
+        items.append(" ".join(line.strip() for line in lines))
+    items = [" ".join(item.replace("**", "").split()) for item in items]
+    return [item for item in items if item]
+
+
+def parse_audit_text(text: str) -> Optional[tuple]:
+    """
+    Extracts benefits and drawbacks from the tagged text the audit prompts ask the model for.
+    It tolerates singular or plural tags, square-bracket tags, missing closing tags, stakeholder wrapper tags,
+    bulleted or numbered lists inside a tag, and plain "Benefits:"/"Drawbacks:" headings.
+    Args:
+        text (str): The audit text of one page and stakeholder.
+    Returns:
+        tuple or None: The (benefits, drawbacks) lists, or None if the text has no recognisable sections
+                       or no findings in them. Empty text parses to two empty lists.
+    """
+    if not text or not text.strip():
+        return [], []
+    markers = [(match.start(), match.end(), match.group(1) == "/", SECTION_KINDS[match.group(2).lower()])
+               for match in TAG_PATTERN.finditer(text)]
+    if not markers:
+        markers = [(match.start(), match.end(), False, SECTION_KINDS[match.group(1).lower()])
+                   for match in HEADING_PATTERN.finditer(text)]
+    if not markers:
+        return None
+    findings = {"benefits": [], "drawbacks": []}
+    for index, (_, end, closing, kind) in enumerate(markers):
+        if closing:
+            continue
+        section_end = markers[index + 1][0] if index + 1 < len(markers) else len(text)
+        for item in _split_items(text[end:section_end]):
+            if item not in findings[kind]:
+                findings[kind].append(item)
+    if not findings["benefits"] and not findings["drawbacks"]:
+        return None
+    return findings["benefits"], findings["drawbacks"]
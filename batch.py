@@ -0,0 +1,178 @@
+import argparse
+import contextlib
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.managers import BaseManager
+
+from incremental import content_hash
+from llm_executor import RateBudget, SharedRateLimiter, configure_rate_limiter
+
+STATE_NAME = "batch_state.jsonl"
+LOG_NAME = "run.log"
+
+
+class BudgetManager(BaseManager):
+    """
+    Serves one RateBudget to every worker process of a batch.
+    """
+
+
+BudgetManager.register("RateBudget", RateBudget)
+
+
+def load_manifest(path: str) -> list:
+    """
+    Reads the organizations of a batch from a JSON or JSON Lines file.
+    Every entry holds org_name, base_url, mission_statement and stakeholders, and optionally 'options',
+    keyword arguments passed to main.main. A JSON file may also be an object with the default 'stakeholders'
+    and 'options' of its 'organizations'.
+    Returns:
+        list: The entries, with the defaults filled in.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            manifest = [json.loads(line) for line in f if line.strip()]
+        else:
+            manifest = json.load(f)
+    defaults = {}
+    if isinstance(manifest, dict):
+        defaults = {key: manifest[key] for key in ("stakeholders", "options") if key in manifest}
+        manifest = manifest["organizations"]
+    entries = []
+    for entry in manifest:
+        entry = {**defaults, **entry}
+        missing = [key for key in ("org_name", "base_url", "mission_statement", "stakeholders") if not entry.get(key)]
+        if missing:
+            raise ValueError(f"Manifest entry {entry.get('org_name', entry)} is missing {', '.join(missing)}")
+        entries.append(entry)
+    names = [entry["org_name"] for entry in entries]
+    if len(set(names)) != len(names):
+        raise ValueError("Manifest org_name values must be unique")
+    return entries
+
+
+def entry_hash(entry: dict) -> str:
+    return content_hash(json.dumps(entry, sort_keys=True))
+
+
+def load_state(state_path: str) -> dict:
+    """
+    Reads the outcome of every organization a batch already ran, the last one per organization winning.
+    """
+    state = {}
+    if not os.path.exists(state_path):
+        return state
+    with open(state_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted batch
+                continue
+            state[record["org_name"]] = record
+    return state
+
+
+def _init_worker(budget):
+    configure_rate_limiter(SharedRateLimiter(budget))
+
+
+def run_organization(entry: dict, http_connections: int) -> dict:
+    """
+    Runs main.main for one organization in a worker process, logging its output to org_name/run.log.
+    Returns:
+        dict: The outcome of the run: status 'done' or 'failed', the error and traceback, and the duration.
+    """
+    # Imported here so the parent process does not load the stages it never runs
+    from main import main
+
+    os.makedirs(entry["org_name"], exist_ok=True)
+    start = time.time()
+    outcome = {"org_name": entry["org_name"], "hash": entry_hash(entry)}
+    with open(os.path.join(entry["org_name"], LOG_NAME), "a", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            main(entry["org_name"], entry["base_url"], entry["stakeholders"], entry["mission_statement"],
+                 **{"http_connections": http_connections, **entry.get("options", {})})
+            outcome["status"] = "done"
+        except Exception as e:
+            traceback.print_exc()
+            outcome.update(status="failed", error=f"{type(e).__name__}: {e}", traceback=traceback.format_exc())
+    outcome["seconds"] = round(time.time() - start, 3)
+    return outcome
+
+
+def run_batch(manifest: list, state_path: str = STATE_NAME, workers: int = 4, requests_per_minute: float = 500,
+              tokens_per_minute: float = None, http_connections: int = 40, retry_failed: bool = True) -> dict:
+    """
+    Audits many organizations, several at once in worker processes, resuming an interrupted batch.
+
+    The workers take organizations from a shared queue and all draw their LLM calls from one request and
+    token budget, held by a manager process. The HTTP connection budget is split evenly between the workers.
+    The outcome of every organization is appended to state_path as soon as it finishes; a failure is
+    recorded and the batch goes on. Running the same batch again skips the organizations already done,
+    unless their manifest entry changed since.
+    Args:
+        manifest (list): The organizations, see load_manifest.
+        state_path (str): The JSON Lines file recording the outcome of every organization.
+        workers (int): The number of organizations audited at once.
+        requests_per_minute (float, optional): The LLM request budget of the whole batch. None disables the limit.
+        tokens_per_minute (float, optional): The LLM token budget of the whole batch. None disables the limit.
+        http_connections (int): The number of simultaneous HTTP connections of the whole batch.
+        retry_failed (bool): Run the organizations that failed last time again.
+    Returns:
+        dict: The outcome of every organization of the manifest, keyed by org_name.
+    """
+    state = load_state(state_path)
+
+    def needs_run(entry):
+        previous = state.get(entry["org_name"])
+        if previous is None or previous.get("hash") != entry_hash(entry):
+            return True
+        return previous["status"] == "failed" and retry_failed
+
+    pending = [entry for entry in manifest if needs_run(entry)]
+    print(f"Batch of {len(manifest)} organizations: {len(manifest) - len(pending)} already run, {len(pending)} to run")
+    if pending:
+        workers = min(workers, len(pending))
+        connections = max(1, http_connections // workers)
+        with BudgetManager() as manager, open(state_path, "a", encoding="utf-8") as state_file:
+            budget = manager.RateBudget(requests_per_minute, tokens_per_minute)
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(budget,)) as pool:
+                futures = {pool.submit(run_organization, entry, connections): entry for entry in pending}
+                for future in as_completed(futures):
+                    entry = futures[future]
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        # The worker process itself died; the pool cannot run anything else
+                        outcome = {"org_name": entry["org_name"], "hash": entry_hash(entry), "status": "failed",
+                                   "error": f"{type(e).__name__}: {e}"}
+                    state[entry["org_name"]] = outcome
+                    state_file.write(json.dumps(outcome) + "\n")
+                    state_file.flush()
+                    print(f"{outcome['org_name']}: {outcome['status']}" +
+                          (f" ({outcome['error']})" if outcome["status"] == "failed" else ""))
+    outcomes = {entry["org_name"]: state.get(entry["org_name"]) for entry in manifest}
+    failed = [name for name, outcome in outcomes.items() if outcome and outcome["status"] == "failed"]
+    print(f"Batch finished: {len(outcomes) - len(failed)} done, {len(failed)} failed"
+          + (f" ({', '.join(failed)})" if failed else ""))
+    return outcomes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Audit every organization of a manifest, resuming earlier runs.")
+    parser.add_argument("manifest", help="A JSON or JSON Lines file of organizations, see batch.load_manifest.")
+    parser.add_argument("--state", default=STATE_NAME, help="The file recording the outcome of every organization.")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=500)
+    parser.add_argument("--tokens-per-minute", type=float, default=None)
+    parser.add_argument("--http-connections", type=int, default=40)
+    parser.add_argument("--no-retry-failed", action="store_true", help="Skip the organizations that failed before.")
+    args = parser.parse_args()
+    outcomes = run_batch(load_manifest(args.manifest), args.state, args.workers, args.requests_per_minute,
+                         args.tokens_per_minute, args.http_connections, not args.no_retry_failed)
+    raise SystemExit(1 if any(outcome is None or outcome["status"] == "failed" for outcome in outcomes.values()) else 0)
@@ -0,0 +1,428 @@
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+from aiohttp import web
+from PIL import Image
+
+from artifact_store import load_artifact
+from audit import audit_images, audit_site_chrome, audit_website
+from boilerplate import chrome_path_for
+from fake_llm import FakeChatModel, default_response
+from image_captions import caption_images, download_images, get_image_links
+from llm_executor import LLMExecutor, RateLimiter
+from model_router import MODEL_TIERS, ModelRouter, configure_model_router
+from report_generator import generate_full_reports, generate_output_reports
+from website_scraper import run_content_map_creation
+
+# Seconds each CLI command may spend starting up and importing what it needs, in a fresh interpreter
+COLD_START_BUDGETS = {"crawl": 1.0, "caption": 4.0, "audit": 4.0, "reports": 4.0, "pdf": 0.5, "run": 5.0}
+# Commands that must not load the LLM stack at all
+LLM_FREE_COMMANDS = ("crawl", "pdf")
+LLM_MODULES = ("langchain_core", "openai")
+WORDS = ("volunteer donor program community event student family support campus mission grant partner "
+         "leadership education service holiday scholarship outreach impact wellness culture learning").split()
+STAKEHOLDERS = {
+    "Board of Directors": "Responsible for overall governance and making strategic decisions.",
+    "Staff": "Employees who work full-time or part-time for the organization.",
+    "Volunteers": "Individuals who offer their time and services freely to support the organization's mission.",
+    "Donors": "Individuals or entities that provide financial support to the organization.",
+    "Beneficiaries": "Individuals or groups who directly benefit from the organization's services or programs.",
+    "Media": "Journalists and outlets that report on the organization.",
+}
+
+
+def generate_site(pages: int = 200, links_per_page: int = 5, depth: int = 3, images_per_page: int = 2,
+                  duplicate_ratio: float = 0.1, seed: int = 0) -> dict:
+    """
+    Generates a synthetic website: a tree of pages depth link hops deep from the home page, plus cross links,
+    a shared header and footer, and images. A duplicate_ratio fraction of the pages repeat the text of another page
+    and of the images repeat another image.
+    Args:
+        pages (int): The number of pages.
+        links_per_page (int): The number of links of every page to other pages.
+        depth (int): The number of link hops from the home page to the deepest pages.
+        images_per_page (int): The number of images linked from every page.
+        duplicate_ratio (float): The fraction of duplicated pages and images.
+        seed (int): The seed of the generator.
+    Returns:
+        dict: The response body of every path ('/', '/page/1', '/images/3.jpg', ...).
+    """
+    rng = random.Random(seed)
+    paths = ["/"] + [f"/page/{i}" for i in range(1, pages)]
+    # Spread the pages over depth levels so the deepest one is depth hops from the home page
+    levels = [[paths[0]]] + [[] for _ in range(max(depth, 1))]
+    for index, path in enumerate(paths[1:]):
+        levels[1 + index * max(depth, 1) // max(pages - 1, 1)].append(path)
+    children = {path: [] for path in paths}
+    for level, next_level in zip(levels, levels[1:]):
+        for index, path in enumerate(next_level):
+            children[level[index % len(level)]].append(path)
+    image_count = max(1, pages * images_per_page // 3)
+    site = {}
+    distinct_images = max(1, int(image_count * (1 - duplicate_ratio)))
+    image_rng = np.random.default_rng(seed)
+    for index in range(distinct_images):
+        buffer = io.BytesIO()
+        Image.fromarray(image_rng.integers(0, 255, (24, 32, 3), dtype=np.uint8)).resize((320, 240)).save(buffer, "JPEG")
+        site[f"/images/{index}.jpg"] = buffer.getvalue()
+    for index in range(distinct_images, image_count):
+        site[f"/images/{index}.jpg"] = site[f"/images/{rng.randrange(distinct_images)}.jpg"]
+    texts = {}
+    for index, path in enumerate(paths):
+        if index and rng.random() < duplicate_ratio:
+            texts[path] = texts[paths[rng.randrange(index)]]
+        else:
+            texts[path] = "\n".join(f"<p>{' '.join(rng.choices(WORDS, k=40))}.</p>" for _ in range(rng.randint(3, 12)))
+        links = children[path] + rng.sample(paths, min(links_per_page, len(paths)))
+        anchors = "\n".join(f'<a href="{{base}}{link.lstrip("/")}">{link}</a>' for link in links)
+        images = "\n".join(f'<a href="{{base}}images/{rng.randrange(image_count)}.jpg">image</a>'
+                           for _ in range(images_per_page))
+        site[path] = (f"<html><body>\n<nav>Home\nAbout us\nPrograms\nDonate</nav>\n<h1>Page {index}</h1>\n"
+                      f"{texts[path]}\n{anchors}\n{images}\n<footer>Contact us\nCopyright 2024</footer>\n</body></html>")
+    return site
+
+
+class SiteServer:
+    """
+    Serves a generated site from a local HTTP server running in a background thread, so the pipeline's
+    synchronous entry points can be benchmarked exactly as main calls them.
+    """
+
+    def __init__(self, site: dict, latency: float = 0.0, capacity: int = None, retry_after: float = 1.0,
+                 robots_txt: str = None):
+        """
+        Args:
+            site (dict): The response body of every path, see generate_site.
+            latency (float): The seconds every response is delayed by.
+            capacity (int, optional): Simulate a throttling server: requests beyond this many in flight get a
+                429 with a Retry-After of retry_after seconds.
+            retry_after (float): The Retry-After of throttled requests.
+            robots_txt (str, optional): Served as /robots.txt. Without it, /robots.txt is a 404 (everything allowed).
+        """
+        self.site = site
+        self.latency = latency
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.robots_txt = robots_txt
+        self.base_url = None
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+
+    async def _handle(self, request):
+        self.requests += 1
+        if request.path == "/robots.txt":
+            if self.robots_txt is None:
+                return web.Response(status=404)
+            return web.Response(text=self.robots_txt, content_type="text/plain")
+        if self.capacity is not None and self.in_flight >= self.capacity:
+            self.throttled += 1
+            return web.Response(status=429, headers={"Retry-After": str(self.retry_after)})
+        self.in_flight += 1
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        body = self.site.get(request.path)
+        if body is None:
+            return web.Response(status=404)
+        if isinstance(body, bytes):
+            return web.Response(body=body, content_type="image/jpeg")
+        return web.Response(text=body.replace("{base}", self.base_url), content_type="text/html")
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}/"
+
+    def __enter__(self):
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._start(), self._loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class StageMeter:
+    """
+    Measures the wall time, peak traced memory and fake LLM usage of each stage of a run.
+    """
+
+    def __init__(self, models):
+        """
+        Args:
+            models: The fake models to count the usage of, e.g. the live view of a model router's clients.
+        """
+        self.models = models
+        self.stages = []
+        self.routing = {}
+
+    def _usage(self):
+        return [sum(getattr(model, name) for model in self.models) for name in ("calls", "input_tokens", "output_tokens")]
+
+    def run(self, name: str, unit: str, function, *args, count=len, **kwargs):
+        """
+        Runs one stage and records its metrics.
+        Args:
+            name (str): The name of the stage.
+            unit (str): What the throughput counts, e.g. 'pages'.
+            function (callable): The stage.
+            count (callable): Maps the result of the stage to the number of units it processed.
+        Returns:
+            The result of the stage.
+        """
+        calls, input_tokens, output_tokens = self._usage()
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        units = count(result)
+        after = self._usage()
+        self.stages.append({
+            "stage": name, "seconds": round(seconds, 3), "units": units, "unit": unit,
+            "per_second": round(units / seconds, 1) if seconds else None,
+            "llm_calls": after[0] - calls, "input_tokens": after[1] - input_tokens,
+            "output_tokens": after[2] - output_tokens, "peak_mb": round(peak / 1e6, 1),
+        })
+        return result
+
+    def print(self):
+        print(f"{'stage':<16}{'seconds':>9}{'units':>8}{'unit':>8}{'per sec':>10}{'calls':>8}"
+              f"{'in tok':>10}{'out tok':>9}{'peak MB':>9}")
+        for stage in self.stages:
+            print(f"{stage['stage']:<16}{stage['seconds']:>9.2f}{stage['units']:>8}{stage['unit']:>8}"
+                  f"{stage['per_second'] or 0:>10.1f}{stage['llm_calls']:>8}{stage['input_tokens']:>10}"
+                  f"{stage['output_tokens']:>9}{stage['peak_mb']:>9.1f}")
+
+
+def fake_model_factory(model_settings: dict, invalid_rate: float = 0.0):
+    """
+    Returns a model router factory building a FakeChatModel named after each model. The small tier answers
+    invalid_rate of the prompts (chosen by prompt hash) without benefit/drawback tags, so they are escalated.
+    """
+    def response(prompt: str) -> str:
+        if int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16) < invalid_rate * 16 ** 8:
+            return "I could not find anything to say about this content."
+        return default_response(prompt)
+
+    def factory(model: str) -> FakeChatModel:
+        return FakeChatModel(model_name=model, response=response if model == MODEL_TIERS["small"] else None,
+                             **model_settings)
+
+    return factory
+
+
+def run_benchmark(pages: int = 200, links_per_page: int = 5, depth: int = 3, images_per_page: int = 2,
+                  duplicate_ratio: float = 0.1, stakeholders: int = 4, latency: float = 0.02, jitter: float = 0.0,
+                  error_rate: float = 0.0, server_latency: float = 0.0, concurrency: int = 16,
+                  requests_per_minute: float = None, seed: int = 0, server_capacity: int = None,
+                  invalid_rate: float = 0.0, group_size: int = None):
+    """
+    Runs every stage of main.main against a generated site and fake chat models, in a temporary folder.
+    The stages take their models from a model router whose clients are FakeChatModels named after the real
+    models, see fake_model_factory.
+    With server_capacity set, the site throttles requests beyond that many in flight (see SiteServer).
+    With group_size set, the audits send each page once per group of stakeholders (see audit_website_async).
+    Returns:
+        StageMeter: The metrics of each stage, in its stages list, and the model routing summary.
+    """
+    site = generate_site(pages, links_per_page, depth, images_per_page, duplicate_ratio, seed)
+    stakeholders_dict = dict(list(STAKEHOLDERS.items())[:stakeholders])
+    model_settings = dict(latency=latency, jitter=jitter, rate_limit_rate=error_rate, seed=seed)
+    router = configure_model_router(ModelRouter(factory=fake_model_factory(model_settings, invalid_rate)))
+    # No request budget by default, so the fake model's latency and the concurrency cap set the pace.
+    # Every stage runs its own event loop, so each gets its own executor
+    executor = lambda: LLMExecutor(concurrency=concurrency, base_delay=0.01, max_delay=0.1,
+                                   rate_limiter=RateLimiter(requests_per_minute=requests_per_minute))
+    meter = StageMeter(router.clients.values())
+    tracemalloc.start()
+    try:
+        with tempfile.TemporaryDirectory() as org_name, SiteServer(site, server_latency, server_capacity) as server:
+            website_map = meter.run("crawl", "pages", run_content_map_creation, server.base_url,
+                                    os.path.join(org_name, "website_map.json"), max_depth=depth, max_pages=pages + 1,
+                                    concurrency=concurrency)
+            image_links = get_image_links(website_map, server.base_url)
+            meter.run("download", "images", download_images, image_links, org_name)
+            captions = meter.run("caption", "images", caption_images, list(dict.fromkeys(image_links)),
+                                 os.path.join(org_name, "images"), executor=executor())
+            cells = lambda audit: sum(len(row) for row in audit.values())
+            url_reports = meter.run("website audit", "cells", audit_website, website_map, stakeholders_dict, "mission",
+                                    os.path.join(org_name, "website_audit.json"),
+                                    executor=executor(), group_size=group_size, near_duplicate_threshold=0.95,
+                                    count=cells)
+            image_reports = meter.run("image audit", "cells", audit_images, captions, website_map, server.base_url,
+                                      stakeholders_dict, os.path.join(org_name, "images_audit.json"),
+                                      executor=executor(), group_size=group_size, count=cells)
+            site_chrome = load_artifact(chrome_path_for(os.path.join(org_name, "website_map.json")))
+            site_chrome_audit = meter.run("chrome audit", "cells", audit_site_chrome, site_chrome['text'],
+                                          stakeholders_dict, "mission",
+                                          os.path.join(org_name, "site_chrome_audit.json"), executor=executor(),
+                                          group_size=group_size)
+            output_reports = meter.run("output reports", "cells", lambda: asyncio.run(generate_output_reports(
+                url_reports, image_reports, stakeholders_dict, None,
+                os.path.join(org_name, "output_reports.json"), executor=executor())), count=cells)
+            meter.run("full reports", "reports", generate_full_reports, stakeholders_dict, output_reports, None,
+                      os.path.join(org_name, "reports"), executor=executor(), site_chrome_audit=site_chrome_audit,
+                      count=lambda _: len(stakeholders_dict))
+    finally:
+        tracemalloc.stop()
+        configure_model_router(None)
+    meter.routing = router.summary()
+    return meter
+
+
+def compare(stages: list, baseline: list, tolerance: float) -> list:
+    """
+    Returns the regressions of a run against a baseline run: stages whose throughput dropped, or whose
+    LLM calls or peak memory grew, by more than tolerance (a fraction).
+    """
+    regressions = []
+    previous = {stage["stage"]: stage for stage in baseline}
+    for stage in stages:
+        before = previous.get(stage["stage"])
+        if before is None:
+            continue
+        if before["per_second"] and stage["per_second"] is not None and \
+                stage["per_second"] < before["per_second"] * (1 - tolerance):
+            regressions.append(f"{stage['stage']}: {stage['per_second']} {stage['unit']}/s, was {before['per_second']}")
+        for metric in ("llm_calls", "peak_mb"):
+            if stage[metric] > before[metric] * (1 + tolerance) + (1 if metric == "peak_mb" else 0):
+                regressions.append(f"{stage['stage']}: {metric} {stage[metric]}, was {before[metric]}")
+    return regressions
+
+
+def check_grouping(single: list, grouped: list) -> list:
+    """
+    Returns the audit stages where the grouped-stakeholder run did not make fewer LLM calls than the
+    per-stakeholder run, or audited a different number of cells.
+    """
+    failures = []
+    grouped_stages = {stage["stage"]: stage for stage in grouped}
+    for stage in single:
+        if not stage["stage"].endswith("audit"):
+            continue
+        other = grouped_stages[stage["stage"]]
+        if other["units"] != stage["units"]:
+            failures.append(f"{stage['stage']}: {other['units']} cells grouped, {stage['units']} one by one")
+        if stage["llm_calls"] and other["llm_calls"] >= stage["llm_calls"]:
+            failures.append(f"{stage['stage']}: {other['llm_calls']} calls grouped, {stage['llm_calls']} one by one")
+    return failures
+
+
+def measure_cold_start(repeats: int = 3) -> list:
+    """
+    Measures the import time of every CLI command (see cli.STAGE_MODULES) in fresh interpreters, keeping the
+    fastest of repeats runs, and which LLM modules each one loads.
+    """
+    results = []
+    for command, budget in COLD_START_BUDGETS.items():
+        code = (f"import json, sys, time\nstart = time.perf_counter()\nimport cli\ncli.import_stage({command!r})\n"
+                f"print(json.dumps([time.perf_counter() - start, [m for m in {LLM_MODULES!r} if m in sys.modules]]))")
+        runs = [json.loads(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                          cwd=os.path.dirname(os.path.abspath(__file__))).stdout)
+                for _ in range(repeats)]
+        results.append({"command": command, "seconds": round(min(run[0] for run in runs), 3), "budget": budget,
+                        "llm_modules": runs[0][1]})
+    return results
+
+
+def check_cold_start(results: list) -> list:
+    """
+    Returns the commands that started slower than their budget, or loaded the LLM stack without needing it.
+    """
+    violations = []
+    for result in results:
+        if result["seconds"] > result["budget"]:
+            violations.append(f"{result['command']}: started in {result['seconds']}s, budget {result['budget']}s")
+        if result["command"] in LLM_FREE_COMMANDS and result["llm_modules"]:
+            violations.append(f"{result['command']}: imports {', '.join(result['llm_modules'])}")
+    return violations
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the audit pipeline offline against a generated site.")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--links-per-page", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--images-per-page", type=int, default=2)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--stakeholders", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per fake LLM call.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random seconds per fake LLM call.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of fake LLM calls failing with a 429.")
+    parser.add_argument("--invalid-rate", type=float, default=0.0,
+                        help="Fraction of the small model's audit answers that fail validation and are escalated.")
+    parser.add_argument("--server-latency", type=float, default=0.0, help="Seconds per HTTP response.")
+    parser.add_argument("--server-capacity", type=int,
+                        help="Requests the site serves at once before answering 429 with a Retry-After.")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests-per-minute", type=float, help="The request budget of each stage. Unlimited by default.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Write the stage metrics to this file.")
+    parser.add_argument("--baseline", help="Fail if a stage regressed against the metrics in this file.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--group-size", type=int, help="Audit up to this many stakeholders with one call per page.")
+    parser.add_argument("--check-grouping", action="store_true",
+                        help="Run the benchmark one stakeholder at a time and grouped (--group-size, default 4), "
+                             "and fail unless grouping makes fewer audit calls.")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="Only check the startup time of every CLI command against COLD_START_BUDGETS.")
+    args = parser.parse_args()
+    if args.cold_start:
+        results = measure_cold_start()
+        for result in results:
+            print(f"{result['command']:<10}{result['seconds']:>8.3f}s  budget {result['budget']}s")
+        violations = check_cold_start(results)
+        for violation in violations:
+            print(f"OVER BUDGET {violation}")
+        sys.exit(1 if violations else 0)
+    benchmark_args = (args.pages, args.links_per_page, args.depth, args.images_per_page, args.duplicate_ratio,
+                      args.stakeholders, args.latency, args.jitter, args.error_rate, args.server_latency,
+                      args.concurrency, args.requests_per_minute, args.seed, args.server_capacity, args.invalid_rate)
+    if args.check_grouping:
+        single, grouped = (run_benchmark(*benchmark_args, group_size=group_size).stages
+                           for group_size in (None, args.group_size or 4))
+        for stage, other in zip(single, grouped):
+            if stage["stage"].endswith("audit"):
+                print(f"{stage['stage']:<16}{stage['llm_calls']:>8} calls one by one{other['llm_calls']:>8} grouped")
+        failures = check_grouping(single, grouped)
+        for failure in failures:
+            print(f"GROUPING {failure}")
+        sys.exit(1 if failures else 0)
+    meter = run_benchmark(*benchmark_args, group_size=args.group_size)
+    meter.print()
+    for stage, route in meter.routing.items():
+        print(f"{stage:<16}{route['model']:>14}" +
+              (f"{route['escalations']:>6} escalated to {route['fallback']}" if route["fallback"] else ""))
+    stages = meter.stages
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(stages, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(stages, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
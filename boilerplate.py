@@ -0,0 +1,106 @@
+import os
+import re
+from collections import Counter
+
+# The name the site chrome is audited under, in its own artifacts rather than among the pages
+SITE_CHROME = "site-chrome"
+# The number of consecutive lines of a shingle. Only runs of at least this many lines repeated across pages
+# count as chrome, so a line that merely recurs in page bodies ("Donate", a table header) is kept.
+SHINGLE_LINES = 3
+
+
+def _lines(text: str) -> list:
+    return [line.strip() for line in text.split('\n') if line.strip()]
+
+
+def _shingles(lines: list, size: int) -> list:
+    return [tuple(lines[i:i + size]) for i in range(len(lines) - size + 1)]
+
+
+def chrome_path_for(website_map_path: str) -> str:
+    """
+    Returns the artifact holding the site chrome of a website map, e.g. HillelSv/website_map.json -> HillelSv/site_chrome.json.
+    """
+    return os.path.join(os.path.dirname(website_map_path), "site_chrome.json")
+
+
+def find_boilerplate_shingles(texts: list, min_fraction: float = 0.5, min_pages: int = 3,
+                              size: int = SHINGLE_LINES) -> set:
+    """
+    Finds the runs of consecutive lines repeated across the pages of a site, such as the header, the nav menu
+    and the footer, as shingles of size lines.
+    Args:
+        texts (list): The visible text of every crawled page.
+        min_fraction (float): The fraction of pages a shingle must appear on to count as boilerplate.
+        min_pages (int): The minimum number of pages a shingle must appear on, so small sites keep their text.
+        size (int): The number of consecutive lines of a shingle.
+    Returns:
+        set: The boilerplate shingles, tuples of lines.
+    """
+    threshold = max(min_pages, min_fraction * len(texts))
+    frequency = Counter(shingle for text in texts for shingle in set(_shingles(_lines(text), size)))
+    return {shingle for shingle, count in frequency.items() if count >= threshold}
+
+
+def _covered(lines: list, shingles: set, size: int) -> list:
+    # Marks the lines that belong to a boilerplate shingle
+    covered = [False] * len(lines)
+    for i, shingle in enumerate(_shingles(lines, size)):
+        if shingle in shingles:
+            covered[i:i + size] = [True] * size
+    return covered
+
+
+def boilerplate_blocks(texts: list, shingles: set, size: int = SHINGLE_LINES) -> list:
+    """
+    Returns the contiguous blocks of boilerplate lines of the pages, each once, in the order they first appear.
+    """
+    blocks = {}
+    for text in texts:
+        lines = _lines(text)
+        block = []
+        for line, covered in zip(lines + [None], _covered(lines, shingles, size) + [False]):
+            if covered:
+                block.append(line)
+            elif block:
+                blocks.setdefault('\n'.join(block), None)
+                block = []
+    return list(blocks)
+
+
+def strip_page(page_data: dict, shingles: set, size: int = SHINGLE_LINES) -> int:
+    """
+    Removes the boilerplate runs of lines from one content map entry and records the bytes removed under 'boilerplate_bytes'.
+    Returns:
+        int: The number of bytes removed.
+    """
+    text = page_data['text']
+    covered = iter(_covered(_lines(text), shingles, size))
+    # Blank lines are kept; the non-blank ones take their coverage in order
+    stripped = '\n'.join(line for line in text.split('\n') if not line.strip() or not next(covered))
+    stripped = re.sub(r'\n{3,}', '\n', stripped)
+    page_data['text'] = stripped
+    page_data['boilerplate_bytes'] = len(text.encode('utf-8')) - len(stripped.encode('utf-8'))
+    return page_data['boilerplate_bytes']
+
+
+def strip_boilerplate(content_map: dict, min_fraction: float = 0.5, min_pages: int = 3) -> tuple:
+    """
+    Removes the runs of lines repeated across the site from every page and returns them as the site chrome,
+    so the shared header, nav menu and footer can be audited once instead of once per page (see
+    audit.audit_site_chrome). The content map stays a URL -> page mapping.
+    Each page entry records the number of bytes removed from it under 'boilerplate_bytes'.
+    Args:
+        content_map (dict): A dictionary where keys are URLs and values are dictionaries containing 'text' and 'links' keys.
+        min_fraction (float): The fraction of pages a run of lines must appear on to count as boilerplate.
+        min_pages (int): The minimum number of pages a run of lines must appear on.
+    Returns:
+        tuple: The number of bytes removed from each page, keyed by URL, and the site chrome text ("" if none).
+    """
+    texts = [data['text'] for data in content_map.values()]
+    shingles = find_boilerplate_shingles(texts, min_fraction, min_pages)
+    if not shingles:
+        return {}, ""
+    chrome = '\n\n'.join(boilerplate_blocks(texts, shingles))
+    removed = {url: strip_page(data, shingles) for url, data in content_map.items()}
+    return removed, chrome
@@ -0,0 +1,84 @@
+class CallPlanner:
+    """
+    Collects the (prompt, input) pairs of a batch of LLM calls before any of them is sent.
+
+    Pairs whose input is empty are dropped and answered with empty_result, and identical pairs
+    are collapsed into a single call whose result is fanned back out to every slot that asked for it.
+
+    Usage:
+        planner = CallPlanner("audit_images", empty_result="")
+        slots = [planner.add(prompt, content) for prompt, content in pairs]
+        results = await run([prompt + content for prompt, content in planner.calls])
+        per_slot = planner.fan_out(results)
+    """
+
+    def __init__(self, name: str, empty_result=None):
+        """
+        Args:
+            name (str): The name printed by report().
+            empty_result: The result of every slot whose input is empty.
+        """
+        self.name = name
+        self.empty_result = empty_result
+        self.calls = []
+        self._call_index = {}
+        self._call_slots = []
+        self._slots = []
+        self.skipped_empty = 0
+
+    def add(self, prompt: str, content: str) -> int:
+        """
+        Registers one requested call.
+        Args:
+            prompt (str): The instructions of the call.
+            content (str): The input the instructions are applied to.
+        Returns:
+            int: The slot of this call in the list returned by fan_out.
+        """
+        if not content or not content.strip():
+            self.skipped_empty += 1
+            self._slots.append(None)
+        else:
+            key = (prompt, content)
+            if key not in self._call_index:
+                self._call_index[key] = len(self.calls)
+                self.calls.append(key)
+                self._call_slots.append([])
+            self._call_slots[self._call_index[key]].append(len(self._slots))
+            self._slots.append(self._call_index[key])
+        return len(self._slots) - 1
+
+    @property
+    def requested(self) -> int:
+        return len(self._slots)
+
+    @property
+    def deduplicated(self) -> int:
+        return self.requested - self.skipped_empty - len(self.calls)
+
+    @property
+    def saved(self) -> int:
+        return self.requested - len(self.calls)
+
+    def slots_for(self, call_index: int) -> list:
+        """
+        Returns the slots answered by the unique call at call_index, for fanning out results as they stream in.
+        """
+        return self._call_slots[call_index]
+
+    def empty_slots(self) -> list:
+        return [slot for slot, index in enumerate(self._slots) if index is None]
+
+    def fan_out(self, results: list) -> list:
+        """
+        Maps the results of the unique calls, in the order of calls, back to every slot.
+        """
+        return [self.empty_result if index is None else results[index] for index in self._slots]
+
+    def report(self):
+        """
+        Prints how many calls the plan saved.
+        """
+        if self.requested:
+            print(f"{self.name}: {self.requested} calls requested, {self.skipped_empty} skipped as empty, "
+                  f"{self.deduplicated} deduplicated, {len(self.calls)} sent ({self.saved} saved)")
@@ -0,0 +1,83 @@
+from functools import lru_cache
+
+from llm_executor import estimate_tokens
+
+# The tokenizer of the gpt-4o family
+ENCODING_NAME = "o200k_base"
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    """
+    Loads the tiktoken encoding, or returns None when it is unavailable (tiktoken missing, or its
+    vocabulary not cached and no network), in which case token counts fall back to estimate_tokens.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the tokens of a text with the model's tokenizer, or estimates them when it is unavailable.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_tokens(text: str, max_tokens: int) -> list:
+    """
+    Cuts a text into pieces of at most max_tokens tokens, at token boundaries when the tokenizer is available
+    and at the estimated number of characters per token otherwise.
+    """
+    encoding = _encoding()
+    if encoding is None:
+        # estimate_tokens counts len // 4 + 1, so a piece of (max_tokens - 1) * 4 characters counts max_tokens
+        size = max(1, (max_tokens - 1) * 4)
+        return [text[start:start + size] for start in range(0, len(text), size)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[start:start + max_tokens]) for start in range(0, len(tokens), max_tokens)]
+
+
+def pack_chunks(blocks: list, max_tokens: int, separator: str = "\n") -> list:
+    """
+    Greedily packs consecutive blocks of text into chunks of at most max_tokens tokens, so that a block
+    (e.g. the findings of one page) is never split unless it is larger than a chunk on its own.
+    Args:
+        blocks (list): The blocks of text, in order.
+        max_tokens (int): The maximum number of tokens of a chunk.
+        separator (str): The string the blocks of a chunk are joined with.
+    Returns:
+        list: The chunks, in order.
+    """
+    separator_tokens = count_tokens(separator) if separator else 0
+    chunks, chunk, chunk_tokens = [], [], 0
+    for block in blocks:
+        tokens = count_tokens(block)
+        pieces = split_tokens(block, max_tokens) if tokens > max_tokens else [block]
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece)
+            if chunk and chunk_tokens + separator_tokens + piece_tokens > max_tokens:
+                chunks.append(separator.join(chunk))
+                chunk, chunk_tokens = [], 0
+            chunk_tokens += piece_tokens + (separator_tokens if chunk else 0)
+            chunk.append(piece)
+    if chunk:
+        chunks.append(separator.join(chunk))
+    return chunks
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """
+    Returns the start of a text that counts at most max_tokens tokens (see count_tokens).
+    """
+    budget = max_tokens
+    while count_tokens(text) > max_tokens and budget > 0:
+        # A cut can count a token more than its budget (e.g. a token split by decoding), so it is retried shorter
+        text = split_tokens(text, budget)[0]
+        budget -= 1
+    return text
@@ -0,0 +1,132 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+
+DEFAULT_CONFIG = "audit_config.json"
+REQUIRED_KEYS = ("org_name", "base_url", "mission_statement", "stakeholders")
+# The modules each command needs. A command imports only these (and what they import), which is what
+# its cold start costs; benchmark.py --cold-start checks the time against a budget.
+STAGE_MODULES = {
+    "crawl": ("main", "website_scraper"),
+    "caption": ("main", "image_captions"),
+    "audit": ("main", "audit"),
+    "reports": ("main", "report_generator"),
+    "pdf": ("main", "pdf_reports"),
+    "run": ("main", "website_scraper", "image_captions", "audit", "model_router", "report_generator",
+            "pdf_reports", "pipeline", "llm_cache"),
+}
+
+
+def load_config(path: str) -> dict:
+    """
+    Reads the organization to audit from a JSON file holding org_name, base_url, mission_statement and
+    stakeholders (a {name: description} dict), and optionally 'options', keyword arguments of main.main.
+    """
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    missing = [key for key in REQUIRED_KEYS if not config.get(key)]
+    if missing:
+        raise ValueError(f"{path} is missing {', '.join(missing)}")
+    config.setdefault("options", {})
+    return config
+
+
+def import_stage(command: str) -> list:
+    return [importlib.import_module(module) for module in STAGE_MODULES[command]]
+
+
+def _options(config: dict, args: argparse.Namespace) -> dict:
+    """
+    Merges the options of the config file with the ones given on the command line, which win.
+    """
+    options = dict(config["options"])
+    for name in ("recrawl", "reuse", "pipeline", "audit_group_size", "image_max_size", "http_connections",
+                 "wkhtmltopdf_path"):
+        value = getattr(args, name, None)
+        if value not in (None, False):
+            options[name] = value
+    return options
+
+
+def _load(org_name: str, name: str, stage: str):
+    from artifact_store import load_artifact
+
+    data = load_artifact(os.path.join(org_name, f"{name}.json"))
+    if data is None:
+        raise SystemExit(f"{org_name} has no {name} yet: run the {stage} command first")
+    return data
+
+
+def run_command(command: str, config: dict, options: dict):
+    main = import_stage(command)[0]
+    org_name, base_url = config["org_name"], config["base_url"]
+    stakeholders, mission_statement = config["stakeholders"], config["mission_statement"]
+    if command == "run":
+        main.main(org_name, base_url, stakeholders, mission_statement, **options)
+        return
+
+    from telemetry import configure_telemetry
+
+    llm_cache = main.prepare(org_name, options.get("use_artifact_store", True),
+                             llm=command in ("caption", "audit", "reports"), models=options.get("models"))
+    telemetry = configure_telemetry(org_name)
+    http_connections = options.get("http_connections", 10)
+    if command == "crawl":
+        main.crawl(org_name, base_url, not options.get("reuse", False), http_connections)
+    elif command == "caption":
+        main.caption(org_name, base_url, _load(org_name, "website_map", "crawl"), options.get("image_max_size", 1024),
+                     http_connections)
+    elif command == "audit":
+        captions = _load(org_name, "captions", "caption")
+        main.audit(org_name, base_url, _load(org_name, "website_map", "crawl"), captions, stakeholders,
+                   mission_statement, options.get("audit_group_size"), options.get("near_duplicate_threshold", 0.95))
+    elif command == "reports":
+        main.reports(org_name, _load(org_name, "website_audit", "audit"), _load(org_name, "images_audit", "audit"),
+                     stakeholders, options.get("finding_similarity", 0.7))
+    elif command == "pdf":
+        main.pdf(org_name, options.get("wkhtmltopdf_path"))
+    if llm_cache is not None:
+        from model_router import get_model_router
+
+        print(f"LLM cache: {llm_cache.stats()}")
+        print(f"Model routing: {get_model_router().summary()}")
+    telemetry.write(org_name)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Audit a nonprofit's website for its stakeholders.")
+    parser.add_argument("--config", default=os.environ.get("AUDIT_CONFIG", DEFAULT_CONFIG),
+                        help=f"The organization to audit, see cli.load_config. Defaults to $AUDIT_CONFIG or {DEFAULT_CONFIG}.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    crawl = commands.add_parser("crawl", help="Crawl the website into website_map.json.")
+    crawl.add_argument("--reuse", "--no-recrawl", dest="reuse", action="store_true",
+                       help="Keep the existing website map instead of crawling the site again.")
+    crawl.add_argument("--http-connections", dest="http_connections", type=int)
+    caption = commands.add_parser("caption", help="Download and caption the images of the crawled pages.")
+    caption.add_argument("--image-max-size", dest="image_max_size", type=int)
+    caption.add_argument("--http-connections", dest="http_connections", type=int)
+    audit = commands.add_parser("audit", help="Audit the pages and images for every stakeholder.")
+    audit.add_argument("--group-size", dest="audit_group_size", type=int)
+    commands.add_parser("reports", help="Write the benefits, drawbacks and full report of every stakeholder.")
+    pdf = commands.add_parser("pdf", help="Render the stakeholder reports to PDF.")
+    pdf.add_argument("--wkhtmltopdf", dest="wkhtmltopdf_path")
+    run = commands.add_parser("run", help="Run every stage, skipping the work earlier runs already did.")
+    run.add_argument("--recrawl", action="store_true", help="Crawl the site again instead of reusing the website map.")
+    run.add_argument("--pipeline", action="store_true", help="Overlap crawling, captioning and the audits.")
+    run.add_argument("--group-size", dest="audit_group_size", type=int)
+    run.add_argument("--image-max-size", dest="image_max_size", type=int)
+    run.add_argument("--http-connections", dest="http_connections", type=int)
+    run.add_argument("--wkhtmltopdf", dest="wkhtmltopdf_path")
+    return parser
+
+
+def main(argv: list = None):
+    args = build_parser().parse_args(argv)
+    config = load_config(args.config)
+    run_command(args.command, config, _options(config, args))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,264 @@
+import asyncio
+import functools
+import gzip
+import hashlib
+import math
+import posixpath
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+
+import aiohttp
+
+from http_client import HttpClient
+
+# Query parameters that only track where a visit came from and never change the page
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl", "ref", "igshid"}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_")
+SITEMAP_PATHS = ("sitemap.xml", "sitemap_index.xml")
+FEED_PATHS = ("feed/", "rss.xml", "feed.xml", "atom.xml")
+MAX_SITEMAPS = 50
+
+
+def normalize_url(url: str, base: str = None):
+    """
+    Canonicalizes a link: resolves it against the page it was found on, lowercases the scheme and host, drops
+    the default port, the fragment and tracking parameters, and sorts the remaining query parameters.
+    Args:
+        url (str): The link, absolute or relative.
+        base (str, optional): The URL of the page the link was found on.
+    Returns:
+        str or None: The canonical URL, or None for links that are not http(s) (mailto:, javascript:, ...).
+    """
+    url = urljoin(base, url.strip()) if base else url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ("http", "https") or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    if port and port != {"http": 80, "https": 443}[scheme]:
+        host = f"{host}:{port}"
+    path = parts.path or "/"
+    if "/." in path:
+        # Resolve ./ and ../ segments, which urljoin leaves in absolute links
+        resolved = posixpath.normpath(path)
+        path = resolved + "/" if path.endswith(("/", "/.", "/..")) and resolved != "/" else resolved
+    query = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES))
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def url_key(url: str) -> str:
+    """
+    Returns the key two spellings of the same page share: the canonical URL without a trailing slash.
+    """
+    parts = urlsplit(url)
+    return urlunsplit(parts._replace(path=parts.path.rstrip("/") or "/"))
+
+
+@functools.lru_cache(maxsize=64)
+def _scope(base_url: str) -> tuple:
+    parts = urlsplit(url_key(normalize_url(base_url) or base_url))
+    return parts.scheme, parts.netloc, parts.path.rstrip("/")
+
+
+def in_scope(url: str, base_url: str) -> bool:
+    """
+    Returns True if a canonical URL is under the base URL of the crawl: same scheme and host, and a path
+    equal to the base path or below it on a '/' boundary.
+    """
+    scheme, netloc, path = _scope(base_url)
+    parts = urlsplit(url_key(url))
+    if parts.scheme != scheme or parts.netloc != netloc:
+        return False
+    return not path or parts.path == path or parts.path.startswith(path + "/")
+
+
+class BloomFilter:
+    """
+    A scalable Bloom filter: a compact set of strings that answers "possibly seen" or "definitely not seen".
+
+    A site with hundreds of thousands of URLs fits in a few megabytes instead of the hundreds a set of strings takes.
+    When a filter fills up, a new one twice its size with a tighter error rate is added, so the overall false
+    positive rate stays under error_rate however many items are added. A false positive means a new URL is
+    taken for a seen one and skipped.
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 1e-4):
+        """
+        Args:
+            capacity (int): The number of items the first filter is sized for.
+            error_rate (float): The overall false positive rate.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = 0
+        self._filters = []
+        self._add_filter()
+
+    def _add_filter(self):
+        index = len(self._filters)
+        capacity = self.capacity * 2 ** index
+        # Halving the error rate of every new filter bounds the sum of the rates by error_rate
+        error_rate = self.error_rate / 2 ** (index + 1)
+        bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        self._filters.append({"bits": bytearray((bits + 7) // 8), "size": bits, "hashes": hashes,
+                              "capacity": capacity, "count": 0})
+
+    @staticmethod
+    def _hashes(item: str) -> tuple:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+
+    @staticmethod
+    def _positions(hashes: tuple, bloom: dict):
+        # Double hashing: the k bit positions of an item are first + i * second, for every filter size
+        first, second = hashes
+        size = bloom["size"]
+        return ((first + i * second) % size for i in range(bloom["hashes"]))
+
+    def _contains(self, hashes: tuple) -> bool:
+        for bloom in self._filters:
+            bits = bloom["bits"]
+            if all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(hashes, bloom)):
+                return True
+        return False
+
+    def __contains__(self, item: str) -> bool:
+        return self._contains(self._hashes(item))
+
+    def add(self, item: str) -> bool:
+        """
+        Adds an item. Returns True if it was not in the set before.
+        """
+        hashes = self._hashes(item)
+        if self._contains(hashes):
+            return False
+        bloom = self._filters[-1]
+        if bloom["count"] >= bloom["capacity"]:
+            self._add_filter()
+            bloom = self._filters[-1]
+        bits = bloom["bits"]
+        for p in self._positions(hashes, bloom):
+            bits[p >> 3] |= 1 << (p & 7)
+        bloom["count"] += 1
+        self.count += 1
+        return True
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(bloom["bits"]) for bloom in self._filters)
+
+
+class Frontier:
+    """
+    The URLs waiting to be crawled with their link depth, in the order they were found, and a Bloom filter of
+    every URL ever queued so each page is crawled once however it is spelled (see url_key).
+    """
+
+    def __init__(self, capacity: int = 100_000, error_rate: float = 1e-4):
+        self.seen = BloomFilter(capacity, error_rate)
+        self.queue = deque()
+
+    def add(self, url: str, depth: int = 0) -> bool:
+        """
+        Queues a canonical URL unless it was queued before. Returns True if it was queued.
+        """
+        if not self.seen.add(url_key(url)):
+            return False
+        self.queue.append((url, depth))
+        return True
+
+    def take(self, count: int) -> list:
+        """
+        Returns up to count (url, depth) pairs, oldest first.
+        """
+        return [self.queue.popleft() for _ in range(min(count, len(self.queue)))]
+
+    def __len__(self):
+        return len(self.queue)
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1].lower()
+
+
+def parse_sitemap(content: bytes):
+    """
+    Parses a sitemap, a sitemap index, an RSS feed or an Atom feed, gzipped or not.
+    Returns:
+        tuple: (page URLs, nested sitemap URLs). Both are empty if the content is not XML.
+    """
+    if content[:2] == b"\x1f\x8b":
+        try:
+            content = gzip.decompress(content)
+        except OSError:
+            return [], []
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError:
+        return [], []
+    pages, sitemaps = [], []
+    kind = _local_name(root.tag)
+    for element in root.iter():
+        name = _local_name(element.tag)
+        if kind == "sitemapindex" and name == "loc" and element.text:
+            sitemaps.append(element.text.strip())
+        elif kind == "urlset" and name == "loc" and element.text:
+            pages.append(element.text.strip())
+        elif kind == "rss" and name == "link" and element.text:
+            pages.append(element.text.strip())
+        elif kind == "feed" and name == "link" and element.get("href") and element.get("rel", "alternate") == "alternate":
+            pages.append(element.get("href").strip())
+    return pages, sitemaps
+
+
+async def _fetch_xml(client: HttpClient, url: str):
+    try:
+        async with client.get(url) as response:
+            if response.status != 200:
+                return None
+            return await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+
+
+async def discover_urls(client: HttpClient, base_url: str, max_urls: int = None) -> list:
+    """
+    Finds the pages of a site listed in its sitemaps (those declared in robots.txt, plus sitemap.xml and
+    sitemap_index.xml, following sitemap indexes) and its RSS/Atom feeds.
+    Args:
+        client (HttpClient): The HTTP client of the crawl.
+        base_url (str): The base URL of the site; only pages under it are returned.
+        max_urls (int, optional): Stop after this many pages.
+    Returns:
+        list: The canonical URLs found, without duplicates, in sitemap order.
+    """
+    base = base_url if base_url.endswith("/") else base_url + "/"
+    candidates = list(dict.fromkeys(await client.sitemaps(base_url) + [urljoin(base, path) for path in SITEMAP_PATHS]))
+    candidates += [urljoin(base, path) for path in FEED_PATHS]
+    found = {}
+    fetched = set()
+    while candidates and len(fetched) < MAX_SITEMAPS and (max_urls is None or len(found) < max_urls):
+        batch = [url for url in dict.fromkeys(candidates) if url not in fetched][:MAX_SITEMAPS - len(fetched)]
+        candidates = []
+        fetched.update(batch)
+        for content in await asyncio.gather(*(_fetch_xml(client, url) for url in batch)):
+            if not content:
+                continue
+            pages, sitemaps = parse_sitemap(content)
+            candidates += sitemaps
+            for page in pages:
+                url = normalize_url(page)
+                if url and in_scope(url, base_url):
+                    found.setdefault(url_key(url), url)
+    urls = list(found.values())
+    return urls[:max_urls] if max_urls is not None else urls
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import random
+import re
+import time
+from typing import Any, Callable, List, Optional, get_args, get_origin
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from pydantic import BaseModel, PrivateAttr
+
+from llm_executor import estimate_tokens
+
+
+class FakeRateLimitError(Exception):
+    """Raised by FakeChatModel to simulate an HTTP 429 from the provider."""
+    status_code = 429
+
+
+class FakeTimeoutError(TimeoutError):
+    """Raised by FakeChatModel to simulate a request timeout."""
+
+
+# Findings the fake audits pick from, each in a few near-identical wordings, the way a real model repeats
+# itself across the pages of a site
+FAKE_BENEFITS = (
+    ("The page states the mission of the organization clearly.", "The page clearly states the mission of the organization."),
+    ("The volunteer sign-up form is easy to find and short.", "The volunteer sign-up form is short and easy to find."),
+    ("The photos show the community programs in action.", "Photos show the community programs in action."),
+    ("The contact details of the staff are listed on the page.", "Contact details of the staff are listed on this page."),
+)
+FAKE_DRAWBACKS = (
+    ("There is no donation link on the page.", "There is no visible donation link on the page."),
+    ("The events calendar is out of date and lists past events.", "The events calendar is out of date, listing past events."),
+    ("The page does not explain how donations are spent.", "The page does not explain how the donations are spent."),
+    ("The text is long and lacks headings for skimming.", "The text is long and has no headings for skimming."),
+)
+
+FAKE_FINDINGS = {"benefits": FAKE_BENEFITS, "drawbacks": FAKE_DRAWBACKS}
+
+
+def default_response(prompt: str) -> str:
+    """
+    Builds a deterministic audit-style answer from the prompt, in the benefit/drawback tag format the audits ask for.
+    """
+    digest = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+    benefit = FAKE_BENEFITS[digest % len(FAKE_BENEFITS)][digest // 7 % 2]
+    drawback = FAKE_DRAWBACKS[digest // 11 % len(FAKE_DRAWBACKS)][digest // 13 % 2]
+    return f"<benefit>{benefit}</benefit>\n<drawback>{drawback}</drawback>"
+
+
+# The stakeholder list of audit.multi_stakeholder_prompt, between its first line and the page content after it
+LISTED_SECTION_PATTERN = re.compile(r"stakeholders:\n(.*?)\nProvide specific examples", re.DOTALL)
+# "- Name: description" lines, the way the multi-stakeholder prompts list who to answer for
+LISTED_NAME_PATTERN = re.compile(r"^- ([^:\n]+):", re.MULTILINE)
+# Fields of a list item that name who the item is about; a list of such items gets one item per listed name
+NAME_FIELDS = ("stakeholder", "name")
+
+
+def default_structured_response(schema: type, prompt: str):
+    """
+    Builds a deterministic instance of a pydantic schema from the prompt, filling strings with labels
+    and lists with two items. A list of items with a name field (see NAME_FIELDS) gets one item for each
+    name the prompt lists, so a grouped answer covers the stakeholders it was asked about. Only the stakeholder
+    list is read, so "- Label:" lines of the page content are not taken for stakeholders.
+    """
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+    section = LISTED_SECTION_PATTERN.search(prompt)
+    names = LISTED_NAME_PATTERN.findall(section.group(1)) if section else []
+    return _fake_value(schema, digest, [name.strip() for name in names])
+
+
+def _fake_value(annotation, label: str, names: list = (), field: str = None):
+    if get_origin(annotation) in (list, List):
+        (item,) = get_args(annotation)
+        if item is str and field in FAKE_FINDINGS:
+            # Findings come from the same pools as the text answers, so they repeat across pages the same way
+            digest = int(hashlib.sha256(label.encode("utf-8")).hexdigest()[:8], 16)
+            pool = FAKE_FINDINGS[field]
+            return [pool[(digest + i) % len(pool)][digest >> (i + 8) & 1] for i in range(2)]
+        name_field = next((name for name in NAME_FIELDS if isinstance(item, type) and issubclass(item, BaseModel)
+                           and name in item.model_fields), None)
+        if names and name_field:
+            return [item(**{**_fake_value(item, f"{label} {i}").model_dump(), name_field: name})
+                    for i, name in enumerate(names)]
+        return [_fake_value(item, f"{label} {i}") for i in range(2)]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation(**{name: _fake_value(field.annotation, f"{name} {label}", names, name)
+                             for name, field in annotation.model_fields.items()})
+    if annotation in (int, float):
+        return annotation(0)
+    if annotation is bool:
+        return False
+    return label
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    A local chat model for exercising the pipeline without network access.
+
+    It injects latency, rate-limit errors and timeouts at configurable rates, answers
+    deterministically from the prompt, and counts calls and (estimated) tokens.
+    """
+
+    model_name: str = "fake-chat-model"
+    latency: float = 0.0
+    """Seconds each call takes."""
+    jitter: float = 0.0
+    """Extra random seconds added to each call's latency."""
+    rate_limit_rate: float = 0.0
+    """Fraction of calls that raise FakeRateLimitError."""
+    timeout_rate: float = 0.0
+    """Fraction of calls that raise FakeTimeoutError."""
+    response: Optional[Callable[[str], str]] = None
+    """Maps the prompt text to the answer. Defaults to default_response."""
+    structured_response: Optional[Callable[[type, str], Any]] = None
+    """Maps (schema, prompt text) to the structured answer. Defaults to default_structured_response."""
+    seed: int = 0
+    calls: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    _random: random.Random = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name}
+
+    def _prepare(self, messages: List[BaseMessage]) -> tuple[str, float]:
+        if self._random is None:
+            self._random = random.Random(self.seed)
+        self.calls += 1
+        draw = self._random.random()
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        prompt = "\n".join(message.content if isinstance(message.content, str) else str(message.content)
+                           for message in messages)
+        if draw < self.rate_limit_rate:
+            self.errors += 1
+            raise FakeRateLimitError("Rate limit reached (fake)")
+        if draw < self.rate_limit_rate + self.timeout_rate:
+            self.errors += 1
+            raise FakeTimeoutError("Request timed out (fake)")
+        return prompt, delay
+
+    def _result(self, prompt: str, messages: List[BaseMessage]) -> ChatResult:
+        content = (self.response or default_response)(prompt)
+        # Counted from the messages so images are charged as images rather than as their base64 text
+        input_tokens, output_tokens = estimate_tokens(messages), estimate_tokens(content)
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        message = AIMessage(content=content, usage_metadata={"input_tokens": input_tokens,
+                                                              "output_tokens": output_tokens,
+                                                              "total_tokens": input_tokens + output_tokens})
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"model_name": self.model_name})
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs: Any) -> ChatResult:
+        prompt, delay = self._prepare(messages)
+        time.sleep(delay)
+        return self._result(prompt, messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs: Any) -> ChatResult:
+        prompt, delay = self._prepare(messages)
+        await asyncio.sleep(delay)
+        return self._result(prompt, messages)
+
+    def with_structured_output(self, schema, **kwargs):
+        """
+        Returns a runnable that goes through this model (latency, errors, accounting) and answers with a schema instance.
+        """
+        build = self.structured_response or default_structured_response
+
+        def prompt_text(value) -> str:
+            return "\n".join(str(message.content) for message in self._convert_input(value).to_messages())
+
+        def invoke(value):
+            self.invoke(value)
+            return build(schema, prompt_text(value))
+
+        async def ainvoke(value):
+            await self.ainvoke(value)
+            return build(schema, prompt_text(value))
+
+        return RunnableLambda(invoke, afunc=ainvoke)
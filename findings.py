@@ -0,0 +1,132 @@
+import math
+import re
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+from telemetry import traced
+
+# The minimum TF-IDF cosine similarity of two findings merged into one
+SIMILARITY_THRESHOLD = 0.7
+STOP_WORDS = frozenset("a an and are as at be by for from has have in is it its of on or that the their this to was "
+                       "were which will with".split())
+FINDING_KINDS = (("benefits", "Benefit"), ("drawbacks", "Drawback"))
+
+
+def normalize_finding(text: str) -> str:
+    """
+    Returns the key two spellings of the same finding share: its lowercase words, without punctuation.
+    """
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def finding_terms(text: str) -> Counter:
+    """
+    Returns the terms of a finding: its words and its word bigrams (2-word shingles), without stop words.
+    """
+    words = [word for word in re.findall(r"\w+", text.lower()) if word not in STOP_WORDS]
+    terms = Counter(words)
+    terms.update(" ".join(pair) for pair in zip(words, words[1:]))
+    return terms
+
+
+def tfidf_vectors(documents: list) -> list:
+    """
+    Weights the terms of every document by TF-IDF (sublinear term frequency, smoothed inverse document frequency).
+    Args:
+        documents (list): The term counts of each document, see finding_terms.
+    Returns:
+        list: The L2-normalized {term: weight} vector of each document, so the dot product of two is their cosine.
+    """
+    document_frequency = Counter(term for terms in documents for term in terms)
+    count = len(documents)
+    vectors = []
+    for terms in documents:
+        vector = {term: (1 + math.log(frequency)) * (math.log((1 + count) / (1 + document_frequency[term])) + 1)
+                  for term, frequency in terms.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        vectors.append({term: weight / norm for term, weight in vector.items()})
+    return vectors
+
+
+def consolidate_findings(findings: list, threshold: float = SIMILARITY_THRESHOLD) -> list:
+    """
+    Merges findings that say the same thing in (almost) the same words into one entry listing every page
+    it was found on.
+
+    Findings equal up to case and punctuation are merged first. The remaining variants are clustered by the
+    TF-IDF cosine of their words and bigrams: taken from the most to the least widespread, each variant joins
+    the most similar cluster whose first variant is at least threshold similar, or starts a new cluster.
+    Only clusters sharing a term are compared, through an inverted index.
+    Args:
+        findings (list): (finding, url) pairs, in page order.
+        threshold (float): The minimum cosine similarity of a variant and the first variant of its cluster.
+    Returns:
+        list: {"finding", "urls"} dicts, the most widespread first. The finding is the most frequent wording
+              of the cluster, the URLs are in page order.
+    """
+    page_order = {}
+    variants = {}
+    for text, url in findings:
+        key = normalize_finding(text)
+        if not key:
+            continue
+        page_order.setdefault(url, len(page_order))
+        variant = variants.setdefault(key, {"texts": Counter(), "urls": set()})
+        variant["texts"][text.strip()] += 1
+        variant["urls"].add(url)
+    keys = sorted(variants, key=lambda key: -len(variants[key]["urls"]))
+    clusters = []
+    postings = defaultdict(list)
+    for key, vector in zip(keys, tfidf_vectors([finding_terms(key) for key in keys])):
+        scores = defaultdict(float)
+        for term, weight in vector.items():
+            for index, leader_weight in postings.get(term, ()):
+                scores[index] += weight * leader_weight
+        best = max(scores, key=scores.get, default=None)
+        if best is not None and scores[best] >= threshold:
+            clusters[best].append(variants[key])
+            continue
+        for term, weight in vector.items():
+            postings[term].append((len(clusters), weight))
+        clusters.append([variants[key]])
+    entries = []
+    for cluster in clusters:
+        texts = sum((variant["texts"] for variant in cluster), Counter())
+        urls = set().union(*(variant["urls"] for variant in cluster))
+        entries.append({"finding": texts.most_common(1)[0][0], "urls": sorted(urls, key=page_order.get)})
+    entries.sort(key=lambda entry: -len(entry["urls"]))
+    return entries
+
+
+@traced("consolidate_findings")
+def consolidate_report_findings(output_reports: dict, stakeholder: str, threshold: float = SIMILARITY_THRESHOLD) -> dict:
+    """
+    Consolidates the benefits and the drawbacks of every page for a stakeholder, see consolidate_findings.
+    Args:
+        output_reports (dict): The benefits and drawbacks of every page and stakeholder, keyed by URL.
+        stakeholder (str): The stakeholder.
+        threshold (float): The minimum cosine similarity of two merged findings.
+    Returns:
+        dict: The consolidated "benefits" and "drawbacks" entries.
+    """
+    return {kind: consolidate_findings([(finding, url) for url in output_reports
+                                        for finding in output_reports[url][stakeholder][kind]], threshold)
+            for kind, _ in FINDING_KINDS}
+
+
+def _pages(urls: list) -> str:
+    # The pages of one site are listed by path after their origin, which would otherwise repeat for every page
+    origins = {urlsplit(url)._replace(path="", query="", fragment="").geturl() for url in urls}
+    if len(origins) != 1:
+        return f"Pages: {', '.join(urls)}"
+    origin = origins.pop()
+    return f"Pages on {origin}: {', '.join(url[len(origin):] or '/' for url in urls)}"
+
+
+def consolidated_blocks(consolidated: dict) -> list:
+    """
+    Renders consolidated findings as text blocks of a report context, one per finding with the pages it was found on.
+    """
+    return [f"{label} (found on {len(entry['urls'])} page{'s' if len(entry['urls']) > 1 else ''}): {entry['finding']}\n"
+            f"{_pages(entry['urls'])}"
+            for kind, label in FINDING_KINDS for entry in consolidated[kind]]
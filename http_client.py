@@ -0,0 +1,283 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+
+HEADERS = {'User-Agent': 'MyApp/1.0'}
+# Answers that mean the server wants fewer requests; they are retried after Retry-After
+THROTTLE_STATUS_CODES = (429, 503)
+# A response is healthy while it is at most this many times slower than the fastest one seen from its host
+LATENCY_TOLERANCE = 2.0
+MAX_RETRY_AFTER = 120.0
+
+
+class DisallowedByRobots(aiohttp.ClientError):
+    """
+    Raised for a URL the host's robots.txt does not allow us to fetch.
+    """
+
+
+def parse_retry_after(value: str):
+    """
+    Returns the number of seconds a Retry-After header asks to wait (a number of seconds or an HTTP date),
+    capped at MAX_RETRY_AFTER, or None if there is no usable header.
+    """
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+def parse_crawl_delay(lines: list, user_agent: str):
+    """
+    Returns the Crawl-delay of robots.txt lines for a user agent (its own group, else the '*' group), or None.
+    The standard library parser only reads whole seconds, and only in groups that also have rules.
+    """
+    delays, agents, in_rules = {}, [], False
+    for line in lines:
+        line = line.split('#')[0].strip()
+        if ':' not in line:
+            continue
+        field, value = (part.strip() for part in line.split(':', 1))
+        if field.lower() == 'user-agent':
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value.lower())
+            continue
+        in_rules = True
+        if field.lower() == 'crawl-delay':
+            try:
+                delay = float(value)
+            except ValueError:
+                continue
+            for agent in agents:
+                delays[agent] = delay
+    name = user_agent.lower()
+    return next((delay for agent, delay in delays.items() if agent != '*' and agent in name), delays.get('*'))
+
+
+class HostLimiter:
+    """
+    An AIMD (additive increase, multiplicative decrease) concurrency limit for one host.
+
+    The limit grows by about one request per round of healthy responses (fast and not throttled) and is
+    halved, at most once per round trip, when the host throttles us, fails or slows down a lot. Requests
+    are also spaced by the host's robots.txt crawl delay, and none starts before a Retry-After expires.
+    """
+
+    def __init__(self, initial: int = 2, maximum: int = 8, min_interval: float = 0.0):
+        """
+        Args:
+            initial (int): The starting number of concurrent requests.
+            maximum (int): The largest number of concurrent requests.
+            min_interval (float): The minimum number of seconds between the starts of two requests.
+        """
+        self.limit = float(min(initial, maximum))
+        self.maximum = maximum
+        self.min_interval = min_interval
+        self.in_flight = 0
+        self.next_start = 0.0
+        self.paused_until = 0.0
+        self.fastest = None
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            now = time.monotonic()
+            start = max(now, self.next_start, self.paused_until)
+            self.next_start = start + self.min_interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    async def release(self, latency: float, ok: bool, throttled: bool = False, retry_after: float = None):
+        """
+        Frees a request slot and adapts the limit to how the request went.
+        Args:
+            latency (float): The seconds until the response headers arrived.
+            ok (bool): The host answered without throttling or a server error.
+            throttled (bool): The host answered 429 or 503.
+            retry_after (float, optional): The seconds the host asked us to wait.
+        """
+        async with self._condition:
+            self.in_flight -= 1
+            self.requests += 1
+            now = time.monotonic()
+            healthy = ok and (self.fastest is None or latency <= self.fastest * LATENCY_TOLERANCE + 0.05)
+            if ok:
+                self.fastest = latency if self.fastest is None else min(latency, self.fastest)
+            if healthy:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif not ok or latency > self.fastest * LATENCY_TOLERANCE * 2:
+                self.throttled += throttled
+                self.errors += not ok and not throttled
+                if now - self._last_decrease > (self.fastest or 1.0):
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+            if retry_after:
+                self.paused_until = max(self.paused_until, now + retry_after)
+            self._condition.notify_all()
+
+
+class HttpClient:
+    """
+    The HTTP layer of the crawler and the image downloader: one pooled keep-alive session, robots.txt rules
+    and crawl delays, an AIMD concurrency limit per host (see HostLimiter) and retries of throttled requests
+    that honor Retry-After.
+
+    Usage:
+        async with HttpClient(max_connections=10) as client:
+            async with client.get(url) as response:
+                html = await response.text()
+    """
+
+    def __init__(self, max_connections: int = 10, max_per_host: int = 8, initial_per_host: int = 2,
+                 timeout: float = 30, max_retries: int = 3, respect_robots: bool = True, headers: dict = None):
+        """
+        Args:
+            max_connections (int): The maximum number of open connections of the session.
+            max_per_host (int): The largest concurrency limit a host can grow to.
+            initial_per_host (int): The concurrency limit a host starts with.
+            timeout (float): The total timeout in seconds of a single request.
+            max_retries (int): The number of retries of a throttled or failed request.
+            respect_robots (bool): Refuse URLs disallowed by robots.txt and follow its crawl delay.
+            headers (dict, optional): The headers of every request. Defaults to HEADERS.
+        """
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.initial_per_host = initial_per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.respect_robots = respect_robots
+        self.headers = headers or HEADERS
+        self.user_agent = self.headers.get('User-Agent', '*').split('/')[0]
+        self.hosts = {}
+        self._robots = {}
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections, limit_per_host=self.max_per_host,
+                                         keepalive_timeout=30)
+        self.session = aiohttp.ClientSession(headers=self.headers, connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        throttled = {host: limiter for host, limiter in self.hosts.items() if limiter.throttled or limiter.errors}
+        for host, limiter in throttled.items():
+            print(f"{host}: {limiter.throttled} throttled and {limiter.errors} failed of {limiter.requests} requests, "
+                  f"concurrency limit ended at {int(limiter.limit)}")
+
+    def limiter(self, host: str) -> HostLimiter:
+        if host not in self.hosts:
+            self.hosts[host] = HostLimiter(self.initial_per_host, self.max_per_host)
+        return self.hosts[host]
+
+    async def _fetch_robots(self, origin: str, host: str) -> RobotFileParser:
+        parser = RobotFileParser(f"{origin}/robots.txt")
+        delay = None
+        try:
+            async with self.session.get(f"{origin}/robots.txt") as response:
+                if response.status in (401, 403):
+                    parser.disallow_all = True
+                elif response.status == 200:
+                    lines = (await response.text(errors="replace")).splitlines()
+                    parser.parse(lines)
+                    delay = parse_crawl_delay(lines, self.user_agent)
+                else:
+                    parser.allow_all = True
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            parser.allow_all = True
+        if delay:
+            self.limiter(host).min_interval = float(delay)
+        return parser
+
+    async def robots(self, url: str) -> RobotFileParser:
+        """
+        Returns the parsed robots.txt of the URL's host. Each robots.txt is fetched once.
+        """
+        parts = urlparse(url)
+        origin = f"{parts.scheme}://{parts.netloc}"
+        if origin not in self._robots:
+            self._robots[origin] = asyncio.ensure_future(self._fetch_robots(origin, parts.netloc))
+        return await self._robots[origin]
+
+    async def allowed(self, url: str) -> bool:
+        """
+        Returns True if the robots.txt of the URL's host allows us to fetch it.
+        """
+        if not self.respect_robots:
+            return True
+        return (await self.robots(url)).can_fetch(self.user_agent, url)
+
+    async def sitemaps(self, url: str) -> list:
+        """
+        Returns the sitemap URLs declared in the robots.txt of the URL's host.
+        """
+        return (await self.robots(url)).site_maps() or []
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(MAX_RETRY_AFTER, 2 ** attempt))
+
+    @asynccontextmanager
+    async def get(self, url: str, **kwargs):
+        """
+        Sends a GET request under the host's concurrency limit and yields the response. Throttled requests
+        (429/503), server errors and connection errors are retried up to max_retries times.
+        Only a 429/503 with a Retry-After header pauses every request to the host; other failures are retried
+        after a backoff of this URL alone, since one broken page says nothing about the rest of the site.
+        Raises:
+            DisallowedByRobots: If robots.txt disallows the URL.
+            aiohttp.ClientError, asyncio.TimeoutError: If the last attempt fails to connect.
+        """
+        if not await self.allowed(url):
+            raise DisallowedByRobots(f"{url} is disallowed by robots.txt")
+        limiter = self.limiter(urlparse(url).netloc)
+        attempt = 0
+        while True:
+            await limiter.acquire()
+            start = time.monotonic()
+            try:
+                response = await self.session.get(url, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await limiter.release(time.monotonic() - start, ok=False)
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            latency = time.monotonic() - start
+            throttled = response.status in THROTTLE_STATUS_CODES
+            ok = not throttled and response.status < 500
+            retry_after = parse_retry_after(response.headers.get("Retry-After")) if throttled else None
+            if not ok and attempt < self.max_retries:
+                response.release()
+                await limiter.release(latency, ok, throttled, retry_after)
+                attempt += 1
+                if retry_after is None:
+                    await asyncio.sleep(self._backoff(attempt))
+                continue
+            # The slot is held until the body has been read
+            try:
+                yield response
+            finally:
+                response.release()
+                await limiter.release(latency, ok, throttled, retry_after)
+            return
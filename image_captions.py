@@ -1,11 +1,22 @@
-from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage
-from langchain_openai import ChatOpenAI
-import base64, os, httpx, json
-import asyncio, aiohttp
-from concurrent.futures import ThreadPoolExecutor
+import base64, os, json, hashlib, re, uuid
+import asyncio
 from typing import List
-load_dotenv()
+from urllib.parse import urlparse
+
+from artifact_store import save_artifact
+from image_preprocessing import preprocess_images
+from llm_executor import IMAGE_TOKENS, LLMExecutor
+from model_router import get_model_router
+from telemetry import traced
+from http_client import HttpClient
+
+MANIFEST_NAME = "manifest.json"
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Keeps a batched request well under the provider's request size limit once base64-encoded
+MAX_BATCH_BYTES = 8 * 1024 * 1024
+CAPTION_TAG_PATTERN = re.compile(r"<image[ _-]?(\d+)>(.*?)</image[ _-]?\1>", re.IGNORECASE | re.DOTALL)
 
 def get_image_links(website_map,base_url):
     image_links = {
@@ -18,64 +29,259 @@ def get_image_links(website_map,base_url):
     return image_links
 
 
-async def download_image(session, url, output_dir):
-    name = url.split('/')[-1]
-    output_dir = os.path.join(output_dir, "images")
-    filename = os.path.join(output_dir,name)
-    if not os.path.exists(filename):
-        async with session.get(url) as response:
-            content = await response.read()
-            with open(filename, "wb") as f:
-                f.write(content)
+def load_manifest(images_path: str) -> dict:
+    """
+    Loads the URL to file manifest written by download_images, or an empty manifest.
+    """
+    manifest_path = os.path.join(images_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def image_file(url: str, images_path: str, manifest: dict) -> str:
+    """
+    Returns the path of the downloaded file of an image URL, falling back to the URL's last segment
+    for folders downloaded before the manifest existed.
+    """
+    if url in manifest:
+        return os.path.join(images_path, manifest[url]["file"])
+    return os.path.join(images_path, url.split('/')[-1])
 
 
-async def download_images_async(urls,output_dir=None):
-    if not output_dir:
-        output_dir = "images"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+async def download_image(client: HttpClient, url, images_path, manifest, max_bytes=MAX_IMAGE_BYTES):
+    """
+    Streams one image to disk in chunks under a content-addressed name (sha256 of its bytes plus its extension)
+    and records it in the manifest. A previously downloaded image is revalidated with a conditional request
+    and kept as it is when the server answers 304 Not Modified.
+    """
+    entry = manifest.get(url)
+    headers = {}
+    if entry and os.path.exists(os.path.join(images_path, entry["file"])):
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+    partial = os.path.join(images_path, f".{uuid.uuid4().hex}.part")
+    try:
+        async with client.get(url, headers=headers) as response:
+            if response.status == 304:
+                return
+            response.raise_for_status()
+            if (response.content_length or 0) > max_bytes:
+                raise ValueError(f"{response.content_length} bytes exceed the {max_bytes} byte limit")
+            digest, size = hashlib.sha256(), 0
+            f = await asyncio.to_thread(open, partial, "wb")
+            try:
+                async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise ValueError(f"more than the {max_bytes} byte limit")
+                    digest.update(chunk)
+                    await asyncio.to_thread(f.write, chunk)
+            finally:
+                await asyncio.to_thread(f.close)
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    except Exception as e:
+        if os.path.exists(partial):
+            os.remove(partial)
+        print(f"Downloading {url} failed: {e!r}")
+        return
+    extension = os.path.splitext(urlparse(url).path)[1].lower()
+    name = digest.hexdigest() + extension
+    # Identical images downloaded from several URLs share one file
+    if os.path.exists(os.path.join(images_path, name)):
+        os.remove(partial)
     else:
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-    async with aiohttp.ClientSession() as session:
-        tasks = [download_image(session, url, output_dir) for url in urls]
+        os.replace(partial, os.path.join(images_path, name))
+    manifest[url] = {"file": name, "bytes": size, "etag": etag, "last_modified": last_modified}
+
+
+@traced("image_download", count=len)
+async def download_images_async(urls, output_dir=None, concurrency_per_host: int = 4,
+                                max_bytes: int = MAX_IMAGE_BYTES, timeout: float = 60, manifest: dict = None) -> dict:
+    """
+    Downloads the images of a site into output_dir/images and writes the URL to file manifest next to them.
+    Args:
+        urls (list): The image URLs.
+        output_dir (str, optional): The folder holding the images folder. Defaults to the current folder.
+        concurrency_per_host (int): The largest number of downloads in flight per host; each host starts lower and
+            adapts to how fast it answers and whether it throttles us.
+        max_bytes (int): Images larger than this are not downloaded.
+        timeout (float): The total timeout in seconds for a single download.
+        manifest (dict, optional): The manifest to update, shared by concurrent calls. Defaults to the one on disk.
+    Returns:
+        dict: The manifest entry (file name, size, ETag, Last-Modified) of every downloaded image, keyed by URL.
+    """
+    images_path = os.path.join(output_dir or ".", "images")
+    os.makedirs(images_path, exist_ok=True)
+    if manifest is None:
+        manifest = load_manifest(images_path)
+    async with HttpClient(max_connections=100, max_per_host=concurrency_per_host,
+                          initial_per_host=min(2, concurrency_per_host), timeout=timeout) as client:
+        tasks = [download_image(client, url, images_path, manifest, max_bytes) for url in dict.fromkeys(urls)]
         await asyncio.gather(*tasks)
+    with open(os.path.join(images_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
 
 
-def download_images(urls: List[str], output_dir):
-    asyncio.run(download_images_async(urls, output_dir))
+def download_images(urls: List[str], output_dir, concurrency_per_host: int = 4, max_bytes: int = MAX_IMAGE_BYTES):
+    return asyncio.run(download_images_async(urls, output_dir, concurrency_per_host, max_bytes))
 
 
-async def fetch_caption(url, input_path, model, semaphore):
-    async with semaphore:
-        filename = os.path.join(input_path, "images", url.split('/')[-1])
-        with open(filename, "rb") as f:
-            image_data = base64.b64encode(f.read()).decode("utf-8")
-        message = HumanMessage(
-            content=[
-                {"type": "text", "text": "describe the scene."},
-                {
-                    "type": "image_url",
-                    "image_url": {"url": f"data:image/jpeg;base64,{image_data}"},
-                },
-            ],
-        )
-        response = await model.invoke([message])
-        return url, response.content
-
-def caption_images(urls,images_path, output_filepath=None):
+def _image_part(image_data: bytes, mime_type: str) -> dict:
+    return {
+        "type": "image_url",
+        "image_url": {"url": f"data:{mime_type};base64,{base64.b64encode(image_data).decode('utf-8')}"},
+    }
+
+
+def batch_caption_prompt(count: int) -> str:
+    return (f"You are given {count} numbered images. Describe the scene of each image separately.\n"
+            f"Put the description of image N between <image_N> and </image_N> tags, for N from 1 to {count}, "
+            "and provide nothing outside the tags.")
+
+
+def parse_batch_captions(text: str, count: int) -> dict:
+    """
+    Extracts the per-image captions of a batched captioning answer.
+    Returns:
+        dict: The non-empty caption of each image found in the answer, keyed by its 0-based position in the batch.
+    """
     captions = {}
-    model = ChatOpenAI(model="gpt-4o")
-    semaphore = asyncio.Semaphore(10)
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    with ThreadPoolExecutor() as executor:
-        futures = [loop.run_in_executor(executor, fetch_caption, url, images_path, model, semaphore) for url in urls]
-        results = loop.run_until_complete(asyncio.gather(*futures))
-    for result in results:
-        captions[result[0]] = result[1]
+    for match in CAPTION_TAG_PATTERN.finditer(text or ""):
+        index, caption = int(match.group(1)) - 1, match.group(2).strip()
+        if 0 <= index < count and caption and index not in captions:
+            captions[index] = caption
+    return captions
+
+
+def pack_batches(prepared: dict, batch_size: int, max_batch_bytes: int) -> list:
+    """
+    Greedily packs the prepared images into batches of at most batch_size images and max_batch_bytes bytes.
+    An image larger than max_batch_bytes gets a batch of its own.
+    """
+    batches, batch, batch_bytes = [], [], 0
+    for url, (data, _) in prepared.items():
+        if batch and (len(batch) >= batch_size or batch_bytes + len(data) > max_batch_bytes):
+            batches.append(batch)
+            batch, batch_bytes = [], 0
+        batch.append(url)
+        batch_bytes += len(data)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def fetch_caption(image_data: bytes, mime_type: str, model, executor: LLMExecutor):
+    message = HumanMessage(
+        content=[
+            {"type": "text", "text": "describe the scene."},
+            _image_part(image_data, mime_type),
+        ],
+    )
+    response = await executor.run(lambda: model.ainvoke([message]), IMAGE_TOKENS + executor.expected_output_tokens)
+    return response.content
+
+
+async def fetch_batch_captions(images: list, model, executor: LLMExecutor) -> dict:
+    """
+    Captions several images with a single request.
+    Args:
+        images (list): The (bytes, MIME type) of each image.
+    Returns:
+        dict: The caption of each image the answer could be parsed for, keyed by its position in images.
+    """
+    content = [{"type": "text", "text": batch_caption_prompt(len(images))}]
+    for number, (image_data, mime_type) in enumerate(images, start=1):
+        content.append({"type": "text", "text": f"Image {number}:"})
+        content.append(_image_part(image_data, mime_type))
+    message = HumanMessage(content=content)
+    tokens = len(images) * (IMAGE_TOKENS + executor.expected_output_tokens)
+    response = await executor.run(lambda: model.ainvoke([message]), tokens)
+    return parse_batch_captions(response.content, len(images))
+
+
+async def caption_batch(urls: list, prepared: dict, model, executor: LLMExecutor) -> dict:
+    """
+    Captions a batch of images with one request, then captions the images whose caption is missing
+    from the answer (or all of them, if the batched request failed) with one request each.
+    Returns:
+        dict: The caption, or the error of the single-image request, of each URL of the batch.
+    """
+    captions = {}
+    if len(urls) > 1:
+        try:
+            parsed = await fetch_batch_captions([prepared[url] for url in urls], model, executor)
+            captions = {urls[index]: caption for index, caption in parsed.items()}
+        except Exception as e:
+            print(f"Batched captioning of {len(urls)} images failed, captioning them one by one: {e!r}")
+    missing = [url for url in urls if url not in captions]
+    singles = await asyncio.gather(*[fetch_caption(*prepared[url], model, executor) for url in missing],
+                                   return_exceptions=True)
+    captions.update(zip(missing, singles))
+    return captions
+
+
+@traced("captions", count=len)
+async def caption_images_async(urls, images_path, output_filepath=None, max_size: int = 1024,
+                               model=None, executor: LLMExecutor = None, batch_size: int = 4,
+                               max_batch_bytes: int = MAX_BATCH_BYTES):
+    """
+    Captions the downloaded images of a site. Each image is downscaled to max_size before upload, and copies
+    of the same picture (byte-identical, or at another size, quality or format) are captioned once.
+    Images are sent batch_size at a time; the images whose caption cannot be parsed out of a batched
+    answer are captioned again one by one.
+    Args:
+        urls (list): The image URLs to caption.
+        images_path (str): The folder holding the downloaded images.
+        output_filepath (str, optional): The JSON file to write the captions to.
+        max_size (int): The maximum width and height of the uploaded images in pixels.
+        model (optional): The vision chat model to use. Defaults to the model the router picks for the stage.
+        executor (LLMExecutor, optional): The concurrency cap, rate limiter and retry policy of the calls.
+        batch_size (int): The maximum number of images per request. 1 disables batching.
+        max_batch_bytes (int): The maximum number of image bytes per request.
+    Returns:
+        dict: The caption of each image, keyed by image URL. Images that could not be read or captioned are left out.
+    """
+    # An empty caption is asked again from the larger model
+    model = model or get_model_router().model("captions", validate=lambda response: bool(response.content.strip()))
+    executor = executor or LLMExecutor(concurrency=10)
+    files = {}
+    manifest = load_manifest(images_path)
+    for url in urls:
+        filename = image_file(url, images_path, manifest)
+        if not os.path.exists(filename):
+            print(f"Skipping {url}: not downloaded")
+            continue
+        with open(filename, "rb") as f:
+            files[url] = f.read()
+    representatives, prepared = preprocess_images(files, max_size)
+    batches = pack_batches(prepared, batch_size, max_batch_bytes)
+    calls_before = executor.calls
+    results = await asyncio.gather(*[caption_batch(batch, prepared, model, executor) for batch in batches])
+    representative_captions = {}
+    for url, result in (item for batch_result in results for item in batch_result.items()):
+        if isinstance(result, Exception):
+            print(f"Captioning {url} failed: {result!r}")
+        else:
+            representative_captions[url] = result
+    if prepared:
+        print(f"Captioned {len(representative_captions)} of {len(prepared)} pictures with "
+              f"{executor.calls - calls_before} requests")
+    captions = {url: representative_captions[representative] for url, representative in representatives.items()
+                if representative in representative_captions}
     if output_filepath:
-        with open(output_filepath, 'w') as f:
-            json.dump(captions, f, indent=4)
+        save_artifact(output_filepath, captions)
     return captions
 
+
+def caption_images(urls, images_path, output_filepath=None, max_size: int = 1024, model=None,
+                   executor: LLMExecutor = None, batch_size: int = 4, max_batch_bytes: int = MAX_BATCH_BYTES):
+    """
+    Synchronous entry point of caption_images_async.
+    """
+    return asyncio.run(caption_images_async(urls, images_path, output_filepath, max_size, model, executor,
+                                            batch_size, max_batch_bytes))
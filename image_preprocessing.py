@@ -0,0 +1,133 @@
+import hashlib
+import io
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from near_duplicates import NearDuplicateIndex
+
+# The formats the vision models accept as they are; anything else is re-encoded to JPEG
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+# How far the aspect ratio (relative) and the mean brightness (0-255) of two copies of a picture may differ
+ASPECT_TOLERANCE = 0.05
+BRIGHTNESS_TOLERANCE = 12
+
+
+def exact_hash(data: bytes) -> str:
+    """
+    Returns the sha256 of the raw bytes of an image.
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """
+    Computes the 64-bit difference hash (dHash) of an image: the image is shrunk to 9x8 grayscale pixels
+    and each bit tells whether a pixel is brighter than its right neighbour. The same picture at another
+    size, quality or format gets a hash that differs in few bits.
+    """
+    pixels = np.asarray(image.convert("L").resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(sum(1 << i for i, bit in enumerate(bits) if bit))
+
+
+def image_profile(image: Image.Image) -> tuple:
+    """
+    Returns the aspect ratio and the mean brightness of an image shrunk to 8x8 grayscale pixels: a cheap check
+    that two images with close perceptual hashes are copies of the same picture. The dHash only compares
+    neighbouring pixels, so a cropped banner or a darker variant of a layout can share it.
+    """
+    pixels = np.asarray(image.convert("L").resize((8, 8), Image.Resampling.BOX), dtype=np.float64)
+    return image.width / max(image.height, 1), float(pixels.mean())
+
+
+def same_picture(profile: tuple, other: tuple) -> bool:
+    """
+    Returns True if two image profiles (see image_profile) agree within ASPECT_TOLERANCE and BRIGHTNESS_TOLERANCE.
+    """
+    (aspect, brightness), (other_aspect, other_brightness) = profile, other
+    return (abs(aspect - other_aspect) <= ASPECT_TOLERANCE * max(aspect, other_aspect)
+            and abs(brightness - other_brightness) <= BRIGHTNESS_TOLERANCE)
+
+
+def prepare_image(data: bytes, max_size: int = 1024, quality: int = 85) -> tuple:
+    """
+    Downscales an image so its longest side is at most max_size pixels and re-encodes it for upload.
+    Images already small enough in a format the model accepts are sent as they are.
+    Args:
+        data (bytes): The image file.
+        max_size (int): The maximum width and height in pixels.
+        quality (int): The JPEG quality of re-encoded images.
+    Returns:
+        tuple: (image bytes, MIME type, perceptual hash, image profile)
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        fingerprint = perceptual_hash(image)
+        profile = image_profile(image)
+        if image_format in MIME_TYPES and max(image.size) <= max_size:
+            return data, MIME_TYPES[image_format], fingerprint, profile
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha channel, so transparent areas are flattened onto white
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, "JPEG", quality=quality, optimize=True)
+    encoded = buffer.getvalue()
+    # Re-encoding a small, already compressed image can make it bigger
+    if image_format in MIME_TYPES and len(data) <= len(encoded):
+        return data, MIME_TYPES[image_format], fingerprint, profile
+    return encoded, "image/jpeg", fingerprint, profile
+
+
+def preprocess_images(files: dict, max_size: int = 1024, similarity: float = 0.95) -> tuple:
+    """
+    Prepares the images of a site for captioning and groups the ones showing the same picture.
+    Byte-identical files are grouped by their sha256; the same picture served at another size, quality
+    or format is grouped by its perceptual hash, if their aspect ratios and mean brightness agree too
+    (see same_picture), since a wrong match reuses the caption of another picture.
+    Args:
+        files (dict): The image bytes, keyed by image URL.
+        max_size (int): The maximum width and height of the uploaded images.
+        similarity (float): The minimum fraction of equal perceptual hash bits of two copies of a picture.
+    Returns:
+        tuple: ({url: representative url}, {representative url: (bytes, MIME type)}). Files that cannot be
+               decoded as images are left out of both.
+    """
+    representatives, prepared = {}, {}
+    by_exact_hash = {}
+    index = NearDuplicateIndex(similarity)
+    order = {url: position for position, url in enumerate(files)}
+    profiles = {}
+    original_bytes = upload_bytes = 0
+    for url, data in files.items():
+        digest = exact_hash(data)
+        if digest in by_exact_hash:
+            representatives[url] = representatives[by_exact_hash[digest]]
+            continue
+        try:
+            encoded, mime_type, fingerprint, profiles[url] = prepare_image(data, max_size)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {url}: {e}")
+            continue
+        by_exact_hash[digest] = url
+        matches = [match for match in index.add_fingerprint(url, fingerprint)
+                   if same_picture(profiles[url], profiles[match])]
+        if matches:
+            # Prefer the copy indexed first, so a picture keeps the same representative between runs
+            representatives[url] = representatives[min(matches, key=order.get)]
+            continue
+        representatives[url] = url
+        prepared[url] = (encoded, mime_type)
+        original_bytes += len(data)
+        upload_bytes += len(encoded)
+    if representatives:
+        print(f"Images: {len(representatives)} files, {len(prepared)} distinct pictures, "
+              f"{original_bytes / 1e6:.1f} MB downscaled to {upload_bytes / 1e6:.1f} MB for upload")
+    return representatives, prepared
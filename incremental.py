@@ -0,0 +1,154 @@
+import hashlib
+import os
+
+from artifact_store import load_artifact, save_artifact
+
+
+def content_hash(*parts) -> str:
+    """
+    Hashes the inputs of a computation so a later run can tell whether they changed.
+    Args:
+        *parts: Strings (or None) that together determine the output.
+    Returns:
+        str: A sha256 hex digest of the parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def page_hash(page_data: dict) -> str:
+    """
+    Returns the content hash of a website_map entry, computing it for maps written before hashes were stored.
+    """
+    return page_data.get("hash") or content_hash(page_data["text"])
+
+
+def page_hash_snapshot(website_map) -> dict:
+    """
+    Copies the content hash of every page into memory, {url: {"hash": ...}}, enough for diff_pages. A stored
+    website map is read lazily, so it must be snapshotted before the crawl that replaces it saves.
+    """
+    return {url: {"hash": page_hash(data)} for url, data in website_map.items()}
+
+
+def add_page_hashes(website_map: dict) -> dict:
+    """
+    Stores the content hash of every page's text in its website_map entry under the 'hash' key.
+    """
+    for page_data in website_map.values():
+        page_data["hash"] = content_hash(page_data["text"])
+    return website_map
+
+
+def diff_pages(old_map: dict, new_map: dict) -> dict:
+    """
+    Compares two website maps by page content hash.
+    Args:
+        old_map (dict): The previously crawled website map.
+        new_map (dict): The freshly crawled website map.
+    Returns:
+        dict: Lists of 'added', 'removed', 'changed' and 'unchanged' URLs.
+    """
+    diff = {"added": [], "removed": [], "changed": [], "unchanged": []}
+    for url, data in new_map.items():
+        if url not in old_map:
+            diff["added"].append(url)
+        elif page_hash(old_map[url]) != page_hash(data):
+            diff["changed"].append(url)
+        else:
+            diff["unchanged"].append(url)
+    diff["removed"] = [url for url in old_map if url not in new_map]
+    return diff
+
+
+def hashes_path(output_path: str) -> str:
+    """
+    Returns the path of the sidecar file holding the per-cell input hashes of an artifact,
+    e.g. website_audit.json -> website_audit.hashes.json.
+    """
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.hashes{ext or '.json'}"
+
+
+class IncrementalArtifact:
+    """
+    A {page: {stakeholder: value}} artifact that is recomputed cell by cell.
+
+    Each cell is stored together with the hash of the inputs it was computed from, in a sidecar
+    file next to the artifact. On a re-run, cells whose input hash is unchanged are reused from
+    the existing file, every other cell is recomputed, and pages that are no longer requested are
+    dropped, so the artifact keeps the exact shape it had before.
+    An artifact written before hashes were tracked has no sidecar; its existing cells are adopted
+    as fresh once and their hashes recorded, so change detection starts from the next run.
+    """
+
+    def __init__(self, output_path: str = None):
+        """
+        Args:
+            output_path (str, optional): The JSON file of the artifact. Without it nothing is reused or saved.
+        """
+        self.output_path = output_path
+        self.previous = {}
+        self.previous_hashes = {}
+        self.legacy = False
+        previous = load_artifact(output_path) if output_path else None
+        if previous is not None:
+            # With an artifact store configured these are lazy views that load a page when it is looked up
+            self.previous = previous
+            previous_hashes = load_artifact(hashes_path(output_path))
+            if previous_hashes is not None:
+                self.previous_hashes = previous_hashes
+            else:
+                self.legacy = True
+        self.results = {}
+        self.hashes = {}
+        self.reused = 0
+        self.computed = 0
+
+    def is_fresh(self, page: str, stakeholder: str, cell_hash: str) -> bool:
+        """
+        Returns True, and carries the previous value over, if the cell was computed before from the same inputs.
+        """
+        if stakeholder not in self.previous.get(page, {}):
+            return False
+        if not self.legacy and self.previous_hashes.get(page, {}).get(stakeholder) != cell_hash:
+            return False
+        self._store(page, stakeholder, self.previous[page][stakeholder], cell_hash)
+        self.reused += 1
+        return True
+
+    def reserve(self, page: str, stakeholder: str):
+        """
+        Reserves the slot of a cell that will be computed later, so results keep the order of the inputs.
+        """
+        self.results.setdefault(page, {})[stakeholder] = None
+
+    def set(self, page: str, stakeholder: str, value, cell_hash: str = None):
+        """
+        Stores a freshly computed cell. Cells stored without a hash (e.g. failed calls) are recomputed on the next run.
+        """
+        self._store(page, stakeholder, value, cell_hash)
+        self.computed += 1
+
+    def _store(self, page: str, stakeholder: str, value, cell_hash: str = None):
+        self.results.setdefault(page, {})[stakeholder] = value
+        if cell_hash is not None:
+            self.hashes.setdefault(page, {})[stakeholder] = cell_hash
+
+    def removed_pages(self) -> list:
+        return [page for page in self.previous if page not in self.results]
+
+    def save(self):
+        """
+        Writes the artifact and its hash sidecar, and prints how many cells were reused.
+        """
+        if not self.output_path:
+            return
+        removed = len(self.removed_pages())
+        save_artifact(self.output_path, self.results)
+        save_artifact(hashes_path(self.output_path), self.hashes)
+        print(f"{os.path.basename(self.output_path)}: reused {self.reused} cells, computed {self.computed}, "
+              f"dropped {removed} removed pages")
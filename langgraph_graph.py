@@ -3,13 +3,13 @@
 
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import SystemMessage
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 from langgraph.constants import START, END
 from langgraph.graph import add_messages, StateGraph, MessagesState
 from langgraph.prebuilt import ToolNode, tools_condition
 from typing_extensions import Annotated, TypedDict
 
+from model_router import get_model_router
 from website_scraper import get_content
 
 load_dotenv()
@@ -24,7 +24,7 @@ class State(TypedDict):
 def bind_llm_to_tools(llm:BaseChatModel,tools:list):
     return llm.bind_tools(tools)
 
-llm = ChatOpenAI(model="gpt-4o")
+llm = get_model_router().model("agent")
 tools = []
 llm_with_tools = bind_llm_to_tools(llm, tools)
 def assistant(state: MessagesState):
@@ -0,0 +1,166 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Any, Optional
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.globals import set_llm_cache
+from langchain_core.load import dumps, loads
+
+warnings.filterwarnings("ignore", message="The function `loads` is in beta")
+
+
+def cache_key(prompt: str, llm_string: str) -> str:
+    """
+    Builds the content address of an LLM call.
+    Args:
+        prompt (str): The serialized prompt, including every message and image sent to the model.
+        llm_string (str): The serialized model configuration (model name, temperature, tools, ...).
+    Returns:
+        str: A sha256 hex digest identifying the call.
+    """
+    digest = hashlib.sha256()
+    digest.update(llm_string.encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(prompt.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    A persistent, content-addressed LLM response cache stored in a single SQLite file.
+
+    It plugs into langchain's cache hook, so every chat model call made while it is installed
+    (plain, structured-output or multimodal) is looked up by a hash of the model configuration
+    and the full prompt before anything is sent over the network.
+    Entries older than max_age seconds are ignored and purged, and the least recently used
+    entries are evicted once the cache grows beyond max_entries or max_bytes.
+    """
+
+    def __init__(self, path: str, max_entries: Optional[int] = 100_000, max_bytes: Optional[int] = 1024 ** 3,
+                 max_age: Optional[float] = None):
+        """
+        Args:
+            path (str): The SQLite file to store responses in. Parent folders are created if needed.
+            max_entries (int, optional): The maximum number of cached responses. None disables the limit.
+            max_bytes (int, optional): The maximum total size of cached responses. None disables the limit.
+            max_age (float, optional): The maximum age of a cached response in seconds. None keeps entries forever.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, model TEXT, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = cache_key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        generations = [loads(generation) for generation in loads(row[0])]
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            if message is not None:
+                # Lets telemetry count the call as free
+                message.response_metadata["cache_hit"] = True
+        return generations
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        value = dumps([dumps(generation) for generation in return_val])
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key(prompt, llm_string), _model_name(llm_string), value, len(value), now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def _evict(self, now: float) -> None:
+        if self.max_age is not None:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.max_age,))
+        count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        over_entries = count - self.max_entries if self.max_entries is not None else 0
+        over_bytes = size - self.max_bytes if self.max_bytes is not None else 0
+        if over_entries <= 0 and over_bytes <= 0:
+            return
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, entry_size in rows:
+            if over_entries <= 0 and over_bytes <= 0:
+                break
+            evicted.append((key,))
+            over_entries -= 1
+            over_bytes -= entry_size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", evicted)
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counters of this process and the current size of the cache.
+        """
+        with self._lock:
+            count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": count,
+            "bytes": size,
+        }
+
+
+def _model_name(llm_string: str) -> str:
+    # llm_string is the serialized model constructor, e.g. '{..."kwargs": {"model_name": "gpt-4o", ...}}---[...]'
+    match = re.search(r"""["']model(?:_name)?["']\s*[:,]\s*["']([^"']+)["']""", llm_string)
+    return match.group(1) if match else ""
+
+
+def configure_llm_cache(path: str, **kwargs) -> SQLiteLLMCache:
+    """
+    Installs a SQLiteLLMCache as the process-wide langchain cache so every chat model call goes through it.
+    Args:
+        path (str): The SQLite file to store responses in.
+        **kwargs: Eviction settings forwarded to SQLiteLLMCache.
+    Returns:
+        SQLiteLLMCache: The installed cache, whose stats() can be reported at the end of a run.
+    """
+    cache = SQLiteLLMCache(path, **kwargs)
+    set_llm_cache(cache)
+    return cache
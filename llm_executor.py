@@ -0,0 +1,236 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from telemetry import labelled
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+# The tokens a vision model charges for one image of at most 1024x1024 pixels at high detail
+IMAGE_TOKENS = 765
+
+_rate_limiter = None
+
+
+def estimate_tokens(text) -> int:
+    """
+    Cheaply estimates the number of tokens of a prompt (about 4 characters per token for English text).
+    Args:
+        text: A string, a list of messages, a multimodal content list or anything whose str() approximates
+              what is sent to the model. Images count as IMAGE_TOKENS each.
+    Returns:
+        int: The estimated token count.
+    """
+    if isinstance(text, list):
+        return sum(estimate_tokens(getattr(message, "content", message)) for message in text)
+    if isinstance(text, dict) and "type" in text:
+        return IMAGE_TOKENS if text["type"] == "image_url" else estimate_tokens(text.get("text", ""))
+    return len(str(text)) // 4 + 1
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    Returns True for rate-limit errors (429), overloaded or failing servers (5xx) and timeouts.
+    """
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status_code in RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in ("RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError")
+
+
+class TokenBucket:
+    """
+    An asyncio token bucket that refills continuously up to its capacity.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1):
+        """
+        Waits until the bucket holds amount tokens and takes them. Amounts above the capacity are clipped to it.
+        The wait is computed under the lock but slept outside it, so other callers can check the bucket meanwhile.
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            async with self._lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.refill_per_second
+            await asyncio.sleep(wait)
+
+
+class RateLimiter:
+    """
+    Limits requests per minute and tokens per minute with one token bucket each.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = 500, tokens_per_minute: Optional[float] = None):
+        """
+        Args:
+            requests_per_minute (float, optional): The request budget. None disables the limit.
+            tokens_per_minute (float, optional): The token budget. None disables the limit.
+        """
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60) if tokens_per_minute else None
+
+    async def acquire(self, tokens: int = 0):
+        if self.requests:
+            await self.requests.acquire(1)
+        if self.tokens and tokens:
+            await self.tokens.acquire(tokens)
+
+
+class RateBudget:
+    """
+    A thread-safe request and token budget that returns how long a caller has to wait instead of waiting itself,
+    so one budget can be served to several processes through a multiprocessing manager (see SharedRateLimiter).
+    Every reservation is taken immediately and may overdraw the budget; the waiting time grows with the overdraft,
+    which queues the callers in the order they reserved.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = 500, tokens_per_minute: Optional[float] = None):
+        """
+        Args:
+            requests_per_minute (float, optional): The request budget. None disables the limit.
+            tokens_per_minute (float, optional): The token budget. None disables the limit.
+        """
+        self.limits = {"requests": requests_per_minute, "tokens": tokens_per_minute}
+        self.levels = {name: limit for name, limit in self.limits.items() if limit}
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int = 0) -> float:
+        """
+        Takes one request and tokens from the budget.
+        Returns:
+            float: The number of seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self.updated_at = now - self.updated_at, now
+            delay = 0.0
+            for name, amount in (("requests", 1), ("tokens", tokens)):
+                limit = self.limits[name]
+                if not limit:
+                    continue
+                rate = limit / 60
+                self.levels[name] = min(limit, self.levels[name] + elapsed * rate) - min(amount, limit)
+                delay = max(delay, -self.levels[name] / rate)
+            return delay
+
+
+class SharedRateLimiter:
+    """
+    A RateLimiter drawing from a RateBudget, usually a proxy of one held by a multiprocessing manager,
+    so every process of a batch shares the same request and token budget.
+    """
+
+    def __init__(self, budget: RateBudget):
+        self.budget = budget
+
+    async def acquire(self, tokens: int = 0):
+        # The budget may live in another process, so it is asked from a thread rather than the event loop
+        delay = await asyncio.to_thread(self.budget.reserve, tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def configure_rate_limiter(rate_limiter) -> None:
+    """
+    Makes every LLMExecutor created without a rate limiter use this one, e.g. a SharedRateLimiter in a batch worker.
+    The rate limiter must not hold asyncio primitives, since the stages run in separate event loops.
+    """
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+class LLMExecutor:
+    """
+    Runs LLM calls concurrently under a concurrency cap and a rate limiter.
+
+    Calls that fail with a rate-limit error, a server error or a timeout are retried with
+    exponential backoff and full jitter. Results are always returned in the order the calls
+    were submitted, regardless of the order in which they complete.
+    """
+
+    def __init__(self, concurrency: int = 8, rate_limiter: Optional[RateLimiter] = None, max_retries: int = 6,
+                 base_delay: float = 1.0, max_delay: float = 60.0, timeout: Optional[float] = 120.0,
+                 expected_output_tokens: int = 500):
+        """
+        Args:
+            concurrency (int): The maximum number of calls in flight.
+            rate_limiter (RateLimiter, optional): The request/token budget shared by every call. Defaults to the one
+                set with configure_rate_limiter, or a new RateLimiter().
+            max_retries (int): The number of retries of a call before its error is raised.
+            base_delay (float): The backoff before the first retry, doubled on every further retry.
+            max_delay (float): The maximum backoff between two retries.
+            timeout (float, optional): The timeout of a single attempt in seconds.
+            expected_output_tokens (int): Added to the estimated prompt tokens when charging the token budget.
+        """
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = rate_limiter or _rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.expected_output_tokens = expected_output_tokens
+        self.calls = 0
+        self.retries = 0
+
+    async def run(self, call: Callable[[], Awaitable], tokens: int = 0, labels: dict = None):
+        """
+        Runs one call with the concurrency cap, the rate limiter and retries.
+        Args:
+            call (callable): A function returning a fresh awaitable for each attempt, e.g. lambda: llm.ainvoke(prompt).
+            tokens (int): The number of tokens charged to the token budget for each attempt.
+            labels (dict, optional): Telemetry labels of the call, e.g. {"stakeholder": name}.
+        Returns:
+            The result of the call.
+        """
+        attempt = 0
+        while True:
+            async with self.semaphore:
+                await self.rate_limiter.acquire(tokens)
+                self.calls += 1
+                try:
+                    with labelled(**(labels or {})):
+                        return await asyncio.wait_for(call(), self.timeout)
+                except Exception as e:
+                    if attempt >= self.max_retries or not is_retryable(e):
+                        raise
+            attempt += 1
+            self.retries += 1
+            await asyncio.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))))
+
+    async def map(self, llm, inputs: list, return_exceptions: bool = False, labels: list = None) -> List:
+        """
+        Invokes llm.ainvoke on every input concurrently.
+        Args:
+            llm: A langchain runnable, e.g. a chat model or a structured-output chat model.
+            inputs (list): The inputs, one per call.
+            return_exceptions (bool): Return the error of a call that failed for good in its slot instead of raising it.
+            labels (list, optional): The telemetry labels of each call, in the order of inputs.
+        Returns:
+            list: The results, in the order of inputs.
+        """
+        tasks = [
+            self.run(lambda value=value: llm.ainvoke(value), estimate_tokens(value) + self.expected_output_tokens,
+                     labels[index] if labels else None)
+            for index, value in enumerate(inputs)
+        ]
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
@@ -1,119 +1,197 @@
-import asyncio
-import json
 import os
-from typing import List
-
-from langchain_openai import ChatOpenAI
-from pydantic import Field, BaseModel
-
-from website_scraper import run_content_map_creation
-from image_captions import get_image_links, download_images, caption_images
-from audit import audit_images, audit_website
-from report_generator import generate_full_reports, generate_output_reports
-import pdfkit
-from markdown import markdown
-import glob
-
-
-def reports_to_pdfs(org_name):
-    # Get a list of all JSON file names in the reports subfolder
-    json_files = glob.glob(os.path.join(org_name, "reports", "*.json"))
-    if not json_files:
-        print("No JSON files found in the reports subfolder.")
-        return
-
-    # Print the list of JSON file names
-    if not os.path.exists(os.path.join(org_name,"pdf_reports")):
-        os.makedirs(os.path.join(org_name,"pdf_reports"))
-    for json_file in json_files:
-        with open(json_file, "r") as file:
-            # Load the JSON content
-            md_report = json.load(file)[0]
-        md_report = md_report.replace('```markdown','').replace('```','')
-        filename = os.path.basename(json_file)
-        # Convert Markdown to HTML
-        html_content = markdown(md_report)
-        # Path to save the PDF
-        output_pdf_path = os.path.join(org_name,"pdf_reports",filename.replace(".json", ".pdf"))
-        # Convert HTML to PDF
-        config = pdfkit.configuration(wkhtmltopdf=r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
-        pdfkit.from_string(html_content, output_pdf_path, configuration=config)
-
-
-def main(org_name, base_url, stakeholders_dict, mission_statement):
-    if not os.path.exists(org_name):
-        os.makedirs(org_name)
-    else:
-        pass
-
-    if os.path.exists(os.path.join(org_name,"website_map.json")):
-        with open(os.path.join(org_name,"website_map.json"),encoding="utf-8") as f:
-            website_map = json.load(f)
-    else:
-        website_map = run_content_map_creation(base_url,os.path.join(org_name,"website_map.json"))
-    
-    image_links = get_image_links(website_map= website_map,base_url= base_url)
-    
-    download_images(urls= image_links, output_dir= org_name)
-
-    if os.path.exists(os.path.join(org_name,"captions.json")):
-        with open(os.path.join(org_name,"captions.json"),encoding="utf-8") as f:
-            captions = json.load(f)
-    else:
-        captions = caption_images(urls= image_links, images_path= os.path.join(org_name,"images"), output_filepath= os.path.join(org_name,"captions.json"))
-    
-    if os.path.exists(os.path.join(org_name,"website_audit.json")):
-        with open(os.path.join(org_name,"website_audit.json"),encoding="utf-8") as f:
-            url_reports = json.load(f)
-    else:
-        url_reports = audit_website(website_map, stakeholders_dict, mission_statement, os.path.join(org_name,'website_audit.json'))
-    
-    if os.path.exists(os.path.join(org_name,"images_audit.json")):
-        with open(os.path.join(org_name,"images_audit.json"),encoding="utf-8") as f:
-            image_reports = json.load(f)
-    else:
-        image_reports = audit_images(captions, website_map, base_url, stakeholders_dict,os.path.join(org_name,'images_audit.json'))
-
-
-    class Report(BaseModel):
-        benefits: List[str] = Field(description="The unique benefits for the stakeholder based on the combined context.")
-        drawbacks: List[str] = Field(description="The unique drawbacks for the stakeholder based on the combined context.")
 
-    llm = ChatOpenAI(model="gpt-4o")
-    if os.path.exists(os.path.join(org_name,"output_reports.json")):
-        with open(os.path.join(org_name,"output_reports.json"),encoding="utf-8") as f:
-            output_reports = json.load(f)
+from dotenv import load_dotenv
+
+# The stage modules are imported inside the functions that use them, so a command that runs one stage
+# (see cli.py) only pays for the imports of that stage.
+
+
+def prepare(org_name, use_artifact_store=True, llm=True, models=None):
+    """
+    Creates the organization's folder and sets up what the stages share: the environment (.env), the artifact store
+    and, for stages that call a model, the model router and the LLM cache.
+    Args:
+        models (dict, optional): The model routing, {"tiers": {tier: model}, "stages": {stage: tier}, "escalate": bool},
+            overriding model_router.MODEL_TIERS and STAGE_TIERS.
+    Returns:
+        SQLiteLLMCache or None: The LLM cache, if llm is set.
+    """
+    os.makedirs(org_name, exist_ok=True)
+    load_dotenv()
+    # Artifacts are stored as compressed, indexed records in one SQLite file and loaded page by page;
+    # existing JSON files are imported the first time they are needed (see artifact_store.py to export them back)
+    if use_artifact_store:
+        from artifact_store import configure_artifact_store
+        configure_artifact_store(os.path.join(org_name, "artifacts.sqlite"))
+    if not llm:
+        return None
+    from llm_cache import configure_llm_cache
+    from model_router import ModelRouter, configure_model_router
+    models = models or {}
+    # Per-page stages run on a small model and escalate answers that fail validation; the full reports use a large one
+    configure_model_router(ModelRouter(models.get("tiers"), models.get("stages"), escalate=models.get("escalate", True)))
+    # Every chat model call is looked up in this cache first, so re-runs only pay for changed prompts
+    return configure_llm_cache(os.path.join(org_name, "llm_cache.sqlite"))
+
+
+def print_diff(previous_map, website_map):
+    from incremental import diff_pages
+    diff = diff_pages(previous_map, website_map)
+    print(f"Pages added: {len(diff['added'])}, removed: {len(diff['removed'])}, "
+          f"changed: {len(diff['changed'])}, unchanged: {len(diff['unchanged'])}")
+
+
+def crawl(org_name, base_url, recrawl=False, http_connections=10):
+    """
+    Returns the website map of the organization, crawling the site if there is none yet or recrawl is set.
+    """
+    from artifact_store import load_artifact
+    from incremental import page_hash_snapshot
+    from website_scraper import run_content_map_creation
+
+    website_map_path = os.path.join(org_name, "website_map.json")
+    previous_map = load_artifact(website_map_path)
+    if previous_map is not None and not recrawl:
+        return previous_map
+    if previous_map is not None:
+        # The stored map is read lazily and the crawl overwrites it, so the diff needs a copy of the old hashes
+        previous_map = page_hash_snapshot(previous_map)
+    website_map = run_content_map_creation(base_url, website_map_path, concurrency=http_connections)
+    if previous_map is not None and website_map is not None:
+        print_diff(previous_map, website_map)
+    return website_map
+
+
+def caption(org_name, base_url, website_map, image_max_size=1024, http_connections=10):
+    """
+    Downloads the images of the website map and captions the ones that appeared since the last run.
+    Returns:
+        dict: The caption of each image, keyed by image URL.
+    """
+    from artifact_store import load_artifact, save_artifact
+    from image_captions import caption_images, download_images, get_image_links
+
+    image_links = get_image_links(website_map=website_map, base_url=base_url)
+    download_images(urls=image_links, output_dir=org_name, concurrency_per_host=min(4, http_connections))
+
+    captions = load_artifact(os.path.join(org_name, "captions.json"))
+    captions_exist = captions is not None
+    captions = captions if captions is not None else {}
+    if isinstance(captions, list):
+        captions = {k: v for caption in captions for k, v in caption.items()}
+    # Only images that appeared since the last run are captioned; they are downscaled to image_max_size
+    # before upload and copies of the same picture are captioned once
+    new_image_links = [link for link in image_links if link not in captions]
+    if new_image_links or not captions_exist:
+        captions.update(caption_images(urls=new_image_links, images_path=os.path.join(org_name, "images"),
+                                       max_size=image_max_size))
+        save_artifact(os.path.join(org_name, "captions.json"), captions)
+    return captions
+
+
+def audit(org_name, base_url, website_map, captions, stakeholders_dict, mission_statement, audit_group_size=None,
+          near_duplicate_threshold=0.95):
+    """
+    Audits the pages and their images for every stakeholder, and the site chrome stripped from the pages once.
+    Returns:
+        tuple: (website audit, images audit)
+    """
+    from artifact_store import load_artifact
+    from audit import audit_images, audit_site_chrome, audit_website
+    from boilerplate import chrome_path_for
+
+    # The audits merge into their existing JSON files and only recompute page/stakeholder cells whose inputs changed
+    # With audit_group_size set, each page is sent once per group of stakeholders instead of once per stakeholder;
+    # near-duplicate pages are audited once through the first page of their cluster
+    url_reports = audit_website(website_map, stakeholders_dict, mission_statement,
+                                os.path.join(org_name, 'website_audit.json'),
+                                group_size=audit_group_size, near_duplicate_threshold=near_duplicate_threshold)
+    image_reports = audit_images(captions, website_map, base_url, stakeholders_dict,
+                                 os.path.join(org_name, 'images_audit.json'), group_size=audit_group_size)
+    # The header, nav menu and footer are audited once for the whole site, see site_chrome_audit.json
+    site_chrome = load_artifact(chrome_path_for(os.path.join(org_name, "website_map.json")))
+    if site_chrome and site_chrome['text']:
+        audit_site_chrome(site_chrome['text'], stakeholders_dict, mission_statement,
+                          os.path.join(org_name, 'site_chrome_audit.json'), group_size=audit_group_size)
+    return url_reports, image_reports
+
+
+def reports(org_name, url_reports, image_reports, stakeholders_dict, finding_similarity=0.7):
+    """
+    Extracts the benefits and drawbacks of every page and stakeholder, then writes the full report of every
+    stakeholder to the reports folder. Findings of different pages at least finding_similarity similar are
+    merged before the full reports; None disables the consolidation. The audit of the site chrome, if any,
+    is added to every full report once, as findings that apply to every page.
+    Returns:
+        dict: The benefits and drawbacks of every page and stakeholder.
+    """
+    import asyncio
+
+    from artifact_store import load_artifact
+    from boilerplate import SITE_CHROME
+    from report_generator import generate_full_reports, generate_output_reports
+
+    # Both stages take their model from the model router
+    output_reports = asyncio.run(generate_output_reports(url_reports, image_reports, stakeholders_dict, None,
+                                                         os.path.join(org_name, "output_reports.json")))
+    site_chrome_audit = load_artifact(os.path.join(org_name, "site_chrome_audit.json")) or {}
+    generate_full_reports(stakeholders_dict, output_reports, None, os.path.join(org_name, "reports"),
+                          similarity_threshold=finding_similarity,
+                          site_chrome_audit=site_chrome_audit.get(SITE_CHROME))
+    return output_reports
+
+
+def pdf(org_name, wkhtmltopdf_path=None):
+    from pdf_reports import reports_to_pdfs
+
+    # Only reports whose markdown changed are rendered again; wkhtmltopdf is detected unless a path is given
+    reports_to_pdfs(org_name, wkhtmltopdf=wkhtmltopdf_path)
+
+
+def main(org_name, base_url, stakeholders_dict, mission_statement, recrawl=False, audit_group_size=None,
+         near_duplicate_threshold=0.95, image_max_size=1024, pipeline=False,
+         wkhtmltopdf_path=None, use_artifact_store=True, http_connections=10, models=None,
+         finding_similarity=0.7):
+    from telemetry import configure_telemetry
+
+    from model_router import get_model_router
+
+    llm_cache = prepare(org_name, use_artifact_store, models=models)
+    # Stage and LLM call spans, tokens and estimated cost per model, stage and stakeholder,
+    # written next to the artifacts as run_summary.json, metrics.prom and trace.json
+    telemetry = configure_telemetry(org_name)
+
+    if pipeline:
+        from artifact_store import load_artifact
+        from incremental import page_hash_snapshot
+        from pipeline import run_pipeline
+
+        previous_map = load_artifact(os.path.join(org_name, "website_map.json"))
+        if recrawl and previous_map is not None:
+            # Copied before the pipeline's crawl overwrites the stored map, see crawl()
+            previous_map = page_hash_snapshot(previous_map)
+        # Crawl, download, captioning and both audits overlap page by page instead of running one after the other
+        website_map, captions, url_reports, image_reports = run_pipeline(
+            org_name, base_url, stakeholders_dict, mission_statement,
+            website_map=None if recrawl or previous_map is None else previous_map,
+            group_size=audit_group_size, near_duplicate_threshold=near_duplicate_threshold,
+            image_max_size=image_max_size, crawl_concurrency=http_connections)
+        if recrawl and previous_map is not None:
+            print_diff(previous_map, website_map)
     else:
-        structured_llm = llm.with_structured_output(Report)
-        output_reports = asyncio.run(generate_output_reports(url_reports,
-                                                            image_reports,
-                                                                stakeholders_dict,
-                                                                structured_llm,
-                                                                os.path.join(org_name,"output_reports.json")))
-    output_reports_path = os.path.join(org_name,"reports")
-    generate_full_reports(stakeholders_dict,output_reports,llm,output_reports_path)
-    reports_to_pdfs(org_name)
-
+        website_map = crawl(org_name, base_url, recrawl, http_connections)
+        captions = caption(org_name, base_url, website_map, image_max_size, http_connections)
+        url_reports, image_reports = audit(org_name, base_url, website_map, captions, stakeholders_dict,
+                                           mission_statement, audit_group_size, near_duplicate_threshold)
 
+    reports(org_name, url_reports, image_reports, stakeholders_dict, finding_similarity)
+    pdf(org_name, wkhtmltopdf_path)
+    print(f"LLM cache: {llm_cache.stats()}")
+    print(f"Model routing: {get_model_router().summary()}")
+    telemetry.write(org_name)
 
 
 if __name__ == "__main__":
-    org_name = "HillelSv"
-    base_url = "https://hillelsv.org/"
-    stakeholders_dict = {
-        "Board of Directors": "Responsible for overall governance and making strategic decisions.",
-        "Staff": "Employees who work full-time or part-time for the organization.",
-        "Volunteers": "Individuals who offer their time and services freely to support the organization’s mission.",
-        "Donors": "People or entities that provide financial support to the organization.",
-        "Beneficiaries": "Individuals or groups who directly benefit from the organization's work.",
-        "Government Agencies": "Public sector organizations that might regulate or provide funding.",
-        "Grant-Making Foundations": "Organizations that provide grants to support the non-profit’s activities.",
-        "Partners": "Other organizations or entities that collaborate with the non-profit.",
-        "Media": "Press and news organizations that cover stories about the non-profit.",
-        "Community Members": "Local individuals who are part of the community served by the non-profit."
-    }
-
-    mission_statement = 'Our mission at Hillel of Silicon Valley is to provide a welcoming and supportive environment for students, enriching their college experience and enabling them to connect with the Jewish community and Israel. We strive to inspire the next generation of Jews through meaningful Jewish experiences when they need us the most.'
-
-    main(org_name, base_url, stakeholders_dict, mission_statement)
-
+    # The organization now comes from a config file, see cli.py
+    from cli import main as cli_main
+    cli_main(["run"])
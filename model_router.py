@@ -0,0 +1,200 @@
+import threading
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableConfig, RunnableSerializable
+from pydantic import ConfigDict, ValidationError
+
+# The models of each tier, from the cheapest to the most capable
+MODEL_TIERS = {"small": "gpt-4o-mini", "large": "gpt-4o"}
+# The tier of each stage, named like the telemetry stages. High-volume per-page calls go to the small model,
+# the final stakeholder reports to the large one. Stages not listed use the large model.
+STAGE_TIERS = {
+    "captions": "small",
+    "website_audit": "small",
+    "images_audit": "small",
+    "output_reports": "small",
+    "full_reports": "large",
+    "mission_statement": "large",
+}
+# Errors that mean an answer did not validate against its schema, rather than that the call failed
+VALIDATION_ERRORS = (OutputParserException, ValidationError)
+
+_router = None
+
+
+def _openai_model(model: str):
+    # Imported here so the stages that never call a model do not load the OpenAI client
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model=model)
+
+
+class EscalatingModel(RunnableSerializable):
+    """
+    A chat model (or structured-output runnable) that answers with a cheap model first and asks a larger one
+    again when the answer fails validation: a schema parsing error, or validate(answer) returning False.
+    Other errors (rate limits, timeouts) are raised as usual so LLMExecutor retries them.
+    It is a Runnable, so it batches, streams and composes with | like the models it wraps.
+    """
+
+    model: Any
+    fallback: Any
+    router: Any
+    stage: str
+    validate_answer: Optional[Callable] = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def __init__(self, model, fallback, router: "ModelRouter", stage: str, validate: Callable = None):
+        """
+        Args:
+            model: The model asked first.
+            fallback: The model asked when the first answer is invalid.
+            router (ModelRouter): The router counting the escalations.
+            stage (str): The stage the model serves.
+            validate (callable, optional): Returns False for an answer that should be escalated.
+        """
+        super().__init__(model=model, fallback=fallback, router=router, stage=stage, validate_answer=validate)
+
+    def _invalid(self, result) -> bool:
+        return self.validate_answer is not None and not self.validate_answer(result)
+
+    def invoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        try:
+            result = self.model.invoke(input, config, **kwargs)
+            if not self._invalid(result):
+                return result
+            reason = "invalid answer"
+        except VALIDATION_ERRORS as e:
+            reason = type(e).__name__
+        self.router.escalated(self.stage, reason)
+        return self.fallback.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input, config: Optional[RunnableConfig] = None, **kwargs):
+        try:
+            result = await self.model.ainvoke(input, config, **kwargs)
+            if not self._invalid(result):
+                return result
+            reason = "invalid answer"
+        except VALIDATION_ERRORS as e:
+            reason = type(e).__name__
+        self.router.escalated(self.stage, reason)
+        return await self.fallback.ainvoke(input, config, **kwargs)
+
+    def with_structured_output(self, schema, **kwargs) -> "EscalatingModel":
+        """
+        Returns the structured-output version of both models, keeping the validation; an answer that does not
+        parse into schema is escalated too.
+        """
+        return EscalatingModel(self.model.with_structured_output(schema, **kwargs),
+                               self.fallback.with_structured_output(schema, **kwargs), self.router, self.stage,
+                               self.validate_answer)
+
+
+class ModelRouter:
+    """
+    Picks the model of every stage from its tier and keeps one client per model, shared by every stage and call.
+
+    A stage on a small tier can escalate to the next larger tier when the small model's answer fails validation
+    (see EscalatingModel). The first routing of each stage is printed, and summary() reports the model and the
+    number of escalations of every stage.
+    """
+
+    def __init__(self, tiers: dict = None, stage_tiers: dict = None, factory: Callable = None,
+                 escalate: bool = True):
+        """
+        Args:
+            tiers (dict, optional): Overrides of MODEL_TIERS, {tier: model name}. Tiers escalate in the order listed.
+            stage_tiers (dict, optional): Overrides of STAGE_TIERS, {stage: tier}.
+            factory (callable, optional): Builds the client of a model name. Defaults to ChatOpenAI, e.g. a
+                FakeChatModel factory runs every stage offline.
+            escalate (bool): Ask the next larger tier again when an answer fails validation.
+        """
+        self.tiers = {**MODEL_TIERS, **(tiers or {})}
+        self.stage_tiers = {**STAGE_TIERS, **(stage_tiers or {})}
+        unknown = set(self.stage_tiers.values()) - set(self.tiers)
+        if unknown:
+            raise ValueError(f"Unknown model tiers: {', '.join(sorted(unknown))}")
+        self.factory = factory or _openai_model
+        self.escalate = escalate
+        self.clients = {}
+        self.routes = {}
+        self.escalations = Counter()
+        self._lock = threading.Lock()
+
+    def client(self, model: str):
+        """
+        Returns the client of a model, creating it on first use.
+        """
+        with self._lock:
+            if model not in self.clients:
+                self.clients[model] = self.factory(model)
+            return self.clients[model]
+
+    def tier(self, stage: str) -> str:
+        return self.stage_tiers.get(stage, list(self.tiers)[-1])
+
+    def _next_tier(self, tier: str) -> Optional[str]:
+        tiers = list(self.tiers)
+        index = tiers.index(tier)
+        return tiers[index + 1] if index + 1 < len(tiers) else None
+
+    def model(self, stage: str, validate: Callable = None):
+        """
+        Returns the model of a stage: the client of its tier, wrapped in an EscalatingModel if escalation is on
+        and a larger tier exists.
+        Args:
+            stage (str): The stage, e.g. 'website_audit'.
+            validate (callable, optional): Returns False for an answer that should be escalated, e.g. an audit
+                without benefit/drawback tags. Schema parsing errors of structured output are always escalated.
+        """
+        tier = self.tier(stage)
+        model = self.tiers[tier]
+        fallback_tier = self._next_tier(tier) if self.escalate else None
+        fallback = self.tiers[fallback_tier] if fallback_tier else None
+        if fallback == model:
+            fallback = None
+        with self._lock:
+            first = stage not in self.routes
+            self.routes[stage] = {"tier": tier, "model": model, "fallback": fallback}
+        if first:
+            print(f"Model routing: {stage} -> {model} ({tier} tier)" +
+                  (f", escalating invalid answers to {fallback}" if fallback else ""))
+        if fallback is None:
+            return self.client(model)
+        return EscalatingModel(self.client(model), self.client(fallback), self, stage, validate)
+
+    def escalated(self, stage: str, reason: str):
+        with self._lock:
+            self.escalations[stage] += 1
+            first = self.escalations[stage] == 1
+        if first:
+            print(f"Model routing: escalating a {stage} answer to {self.routes[stage]['fallback']} ({reason}); "
+                  f"further escalations are counted in the summary")
+
+    def summary(self) -> dict:
+        """
+        Returns the tier, model, fallback model and number of escalations of every stage routed so far.
+        """
+        with self._lock:
+            return {stage: {**route, "escalations": self.escalations[stage]} for stage, route in self.routes.items()}
+
+
+def configure_model_router(router: ModelRouter) -> ModelRouter:
+    """
+    Makes every stage created without an explicit model take its model from this router.
+    """
+    global _router
+    _router = router
+    return router
+
+
+def get_model_router() -> ModelRouter:
+    """
+    Returns the configured router, or a default one (MODEL_TIERS, STAGE_TIERS, ChatOpenAI) created on first use.
+    """
+    global _router
+    if _router is None:
+        _router = ModelRouter()
+    return _router
@@ -0,0 +1,138 @@
+import hashlib
+import re
+from collections import Counter
+
+import numpy as np
+
+BITS = 64
+# The narrowest band the index accepts. A band of b bits matches about 1 / 2^b of unrelated fingerprints
+# by chance, so narrower bands would make most of the index candidates of every query.
+MIN_BAND_BITS = 8
+_BIT_POSITIONS = np.arange(BITS, dtype=np.uint64)
+
+
+def _shingle_hashes(text: str, size: int) -> tuple:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        shingles = Counter([" ".join(words)]) if words else Counter()
+    else:
+        shingles = Counter(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    hashes = np.fromiter((int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+                          for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    weights = np.fromiter(shingles.values(), dtype=np.int64, count=len(shingles))
+    return hashes, weights
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """
+    Computes the 64-bit SimHash of a text over its word shingles, weighted by shingle frequency.
+    Texts that share most of their shingles get fingerprints that differ in few bits.
+    Args:
+        text (str): The text to fingerprint.
+        shingle_size (int): The number of consecutive words per shingle.
+    Returns:
+        int: The fingerprint.
+    """
+    hashes, weights = _shingle_hashes(text, shingle_size)
+    if not len(hashes):
+        return 0
+    bits = ((hashes[:, None] >> _BIT_POSITIONS) & np.uint64(1)).astype(np.int64)
+    votes = (weights[:, None] * (2 * bits - 1)).sum(axis=0)
+    return int(sum(1 << i for i in range(BITS) if votes[i] > 0))
+
+
+def similarity(a: int, b: int) -> float:
+    """
+    Returns the fraction of equal bits of two fingerprints.
+    """
+    return 1 - bin(a ^ b).count("1") / BITS
+
+
+class NearDuplicateIndex:
+    """
+    A SimHash index that finds near-duplicate texts without comparing every pair.
+
+    Two fingerprints within max_distance differing bits must agree exactly on at least one of
+    max_distance + 1 bit bands (pigeonhole principle), so only texts sharing a band are compared.
+    Thresholds low enough to need bands under MIN_BAND_BITS bits are rejected.
+    """
+
+    def __init__(self, threshold: float = 0.95, shingle_size: int = 3):
+        """
+        Args:
+            threshold (float): The minimum similarity (fraction of equal fingerprint bits) of two near-duplicates.
+            shingle_size (int): The number of consecutive words per shingle.
+        """
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.max_distance = int((1 - threshold) * BITS)
+        bands = self.max_distance + 1
+        if BITS // bands < MIN_BAND_BITS:
+            lowest = 1 - (BITS // MIN_BAND_BITS - 1) / BITS
+            raise ValueError(f"A similarity threshold of {threshold} needs {bands} bands of under {MIN_BAND_BITS} bits, "
+                             f"which match too many unrelated texts; use a threshold of at least {lowest:.3f}")
+        edges = [round(i * BITS / bands) for i in range(bands + 1)]
+        self._bands = [(start, (1 << (end - start)) - 1) for start, end in zip(edges, edges[1:])]
+        self._buckets = [{} for _ in self._bands]
+        self.fingerprints = {}
+
+    def query(self, fingerprint: int) -> list:
+        """
+        Returns the keys of the indexed texts within the similarity threshold of a fingerprint.
+        """
+        candidates = set()
+        for buckets, (start, mask) in zip(self._buckets, self._bands):
+            candidates.update(buckets.get((fingerprint >> start) & mask, ()))
+        return [key for key in candidates
+                if bin(self.fingerprints[key] ^ fingerprint).count("1") <= self.max_distance]
+
+    def add(self, key, text: str) -> list:
+        """
+        Indexes a text and returns the keys of the near-duplicates indexed before it.
+        """
+        return self.add_fingerprint(key, simhash(text, self.shingle_size))
+
+    def add_fingerprint(self, key, fingerprint: int) -> list:
+        """
+        Indexes a precomputed 64-bit fingerprint (e.g. a perceptual image hash) and returns the keys
+        of the near-duplicates indexed before it.
+        """
+        matches = self.query(fingerprint)
+        self.fingerprints[key] = fingerprint
+        for buckets, (start, mask) in zip(self._buckets, self._bands):
+            buckets.setdefault((fingerprint >> start) & mask, []).append(key)
+        return matches
+
+
+def near_duplicate_representatives(website_map: dict, threshold: float = 0.95) -> dict:
+    """
+    Clusters the pages of a website map whose texts are near-duplicates (pagination, tag archives,
+    the same page with and without a query string or trailing slash, ...).
+    Only the representatives are indexed: a page joins the cluster of the most similar representative
+    within the threshold, or starts a cluster of its own, so every page of a cluster is within the threshold
+    of the page audited for it. Chains of pages that each differ a little from the previous one are not merged.
+    Args:
+        website_map (dict): The content map of the website, keyed by URL.
+        threshold (float): The minimum SimHash similarity of a page and the representative of its cluster.
+    Returns:
+        dict: The representative URL of every page; the first page of each cluster, in map order, represents it.
+    """
+    index = NearDuplicateIndex(threshold)
+    order = {url: position for position, url in enumerate(website_map)}
+    representatives = {}
+    for url, data in website_map.items():
+        representatives[url] = url
+        if not data['text'].strip():
+            continue
+        fingerprint = simhash(data['text'], index.shingle_size)
+        matches = index.query(fingerprint)
+        if matches:
+            # The closest representative, the earliest one on a tie
+            representatives[url] = min(matches, key=lambda match: (bin(index.fingerprints[match] ^ fingerprint).count("1"),
+                                                                  order[match]))
+        else:
+            index.add_fingerprint(url, fingerprint)
+    duplicates = sum(1 for url, representative in representatives.items() if url != representative)
+    if duplicates:
+        print(f"Found {duplicates} near-duplicate pages; {len(set(representatives.values()))} of {len(website_map)} pages will be audited")
+    return representatives
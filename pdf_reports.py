@@ -0,0 +1,125 @@
+import glob
+import html
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import pdfkit
+from markdown import markdown
+
+from incremental import content_hash
+
+# Checked in order when no renderer path is given and wkhtmltopdf is not on the PATH
+WKHTMLTOPDF_LOCATIONS = (
+    r"C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe",
+    "/usr/local/bin/wkhtmltopdf",
+    "/usr/bin/wkhtmltopdf",
+    "/opt/homebrew/bin/wkhtmltopdf",
+)
+PDF_OPTIONS = {"encoding": "UTF-8", "quiet": ""}
+COMBINED_REPORT_NAME = "all_stakeholders_report.pdf"
+HASHES_NAME = "pdf_hashes.json"
+
+
+def find_wkhtmltopdf(path: str = None) -> str:
+    """
+    Locates the wkhtmltopdf executable: the given path, then the WKHTMLTOPDF_PATH environment variable,
+    then the PATH, then the usual install locations.
+    Returns:
+        str or None: The path of the executable, or None if it cannot be found.
+    """
+    for candidate in (path, os.environ.get("WKHTMLTOPDF_PATH"), shutil.which("wkhtmltopdf")):
+        if candidate:
+            return candidate
+    return next((location for location in WKHTMLTOPDF_LOCATIONS if os.path.exists(location)), None)
+
+
+def report_markdown(json_file: str) -> str:
+    """
+    Reads the markdown of a report written by generate_full_reports, without the code fences the model wraps it in.
+    """
+    with open(json_file, "r") as file:
+        md_report = json.load(file)[0]
+    return md_report.replace('```markdown', '').replace('```', '')
+
+
+def render_pdf(html_content: str, output_pdf_path: str, wkhtmltopdf: str):
+    """
+    Converts HTML to a PDF file. Runs in a worker process of the rendering pool.
+    """
+    config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf)
+    pdfkit.from_string(html_content, output_pdf_path, configuration=config, options=PDF_OPTIONS)
+    return output_pdf_path
+
+
+def combined_report_html(reports: dict) -> str:
+    """
+    Builds one HTML document holding every stakeholder report, each starting on a new page,
+    preceded by a table of contents linking to them.
+    Args:
+        reports (dict): The markdown of each report, keyed by stakeholder.
+    """
+    toc = "\n".join(f'<li><a href="#report-{index}">{html.escape(stakeholder)}</a></li>'
+                    for index, stakeholder in enumerate(reports))
+    sections = "\n".join(f'<div id="report-{index}" style="page-break-before: always">\n'
+                         f'<h1>{html.escape(stakeholder)}</h1>\n{markdown(md_report)}\n</div>'
+                         for index, (stakeholder, md_report) in enumerate(reports.items()))
+    return (f'<html><head><meta charset="utf-8"></head><body>\n'
+            f'<h1>Table of contents</h1>\n<ol>\n{toc}\n</ol>\n{sections}\n</body></html>')
+
+
+def reports_to_pdfs(org_name, wkhtmltopdf: str = None, workers: int = None, combined: bool = True):
+    """
+    Renders the stakeholder reports of an organization to PDF, in parallel.
+    A PDF is rendered again only if the markdown of its report changed since it was last rendered.
+    Args:
+        org_name (str): The folder of the organization's artifacts; reports are read from its reports subfolder
+            and written to its pdf_reports subfolder.
+        wkhtmltopdf (str, optional): The path of the wkhtmltopdf executable. Detected by default, see find_wkhtmltopdf.
+        workers (int, optional): The number of rendering processes. Defaults to the number of CPUs.
+        combined (bool): Also render every report into one PDF with a table of contents.
+    """
+    json_files = sorted(glob.glob(os.path.join(org_name, "reports", "*.json")))
+    if not json_files:
+        print("No JSON files found in the reports subfolder.")
+        return
+    renderer = find_wkhtmltopdf(wkhtmltopdf)
+    if renderer is None:
+        print("wkhtmltopdf not found: install it, put it on the PATH or set WKHTMLTOPDF_PATH. Skipping PDF rendering.")
+        return
+    output_dir = os.path.join(org_name, "pdf_reports")
+    os.makedirs(output_dir, exist_ok=True)
+    hashes_file = os.path.join(output_dir, HASHES_NAME)
+    hashes = {}
+    if os.path.exists(hashes_file):
+        with open(hashes_file, encoding="utf-8") as f:
+            hashes = json.load(f)
+
+    reports = {}
+    jobs = {}
+    for json_file in json_files:
+        filename = os.path.basename(json_file).replace(".json", ".pdf")
+        md_report = report_markdown(json_file)
+        reports[os.path.basename(json_file).removesuffix("_report.json")] = md_report
+        jobs[filename] = (markdown(md_report), content_hash(md_report, json.dumps(PDF_OPTIONS)))
+    if combined:
+        jobs[COMBINED_REPORT_NAME] = (combined_report_html(reports),
+                                      content_hash(*reports.keys(), *reports.values(), json.dumps(PDF_OPTIONS)))
+    stale = {filename: job for filename, job in jobs.items()
+             if hashes.get(filename) != job[1] or not os.path.exists(os.path.join(output_dir, filename))}
+    print(f"Rendering {len(stale)} PDFs, {len(jobs) - len(stale)} unchanged")
+    if stale:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(stale))) as pool:
+            futures = {filename: pool.submit(render_pdf, html_content, os.path.join(output_dir, filename), renderer)
+                       for filename, (html_content, _) in stale.items()}
+            for filename, future in futures.items():
+                try:
+                    future.result()
+                    hashes[filename] = stale[filename][1]
+                except Exception as e:
+                    # Left out of the hashes so it is rendered again on the next run
+                    print(f"Rendering {filename} failed: {e}")
+                    hashes.pop(filename, None)
+    with open(hashes_file, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, indent=4)
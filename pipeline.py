@@ -0,0 +1,248 @@
+import asyncio
+import os
+import time
+
+from artifact_store import load_artifact, save_artifact
+from audit import audit_images_async, audit_site_chrome_async, audit_website_async
+from boilerplate import boilerplate_blocks, chrome_path_for, find_boilerplate_shingles, strip_page
+from image_captions import caption_images_async, download_images_async, get_image_links, load_manifest
+from incremental import IncrementalArtifact, content_hash
+from llm_executor import LLMExecutor
+from website_scraper import crawl_content_map
+
+# Put on a queue once its producers are done; every consumer puts it back for the next one
+_CLOSED = object()
+
+
+async def _next_batch(queue: asyncio.Queue, size: int) -> list:
+    """
+    Waits for the next item of a queue and takes up to size items that are already waiting with it.
+    Returns an empty list once the queue is closed.
+    """
+    item = await queue.get()
+    batch = []
+    while item is not _CLOSED:
+        batch.append(item)
+        if len(batch) >= size or queue.empty():
+            return batch
+        item = queue.get_nowait()
+    queue.put_nowait(_CLOSED)
+    return batch
+
+
+class Pipeline:
+    """
+    Runs crawl -> image download -> captioning -> website audit -> image audit as overlapping stages
+    connected by bounded queues, instead of one stage after the other over the whole site.
+
+    A page is audited as soon as it is crawled, and its image audit starts as soon as its images are captioned.
+    Each stage runs a configurable number of workers that take pages in small batches, so a slow stage
+    fills its input queue and, through it, slows the stages feeding it (backpressure). The stage functions
+    are the same as in the sequential run; the audits share one IncrementalArtifact each so the batches
+    merge into the usual output files.
+
+    The site chrome is learned from the first warmup_pages pages crawled (or from every page, if the crawl ends
+    sooner) and then stripped from every page as it arrives, since the full crawl is not available to stream from.
+    The warmup pages are held back until then, so warmup_pages trades how early the audits start against how
+    reliably the header, nav menu and footer are recognized; a block that only becomes frequent after the warmup
+    stays in the pages. The chrome is kept out of the website map, in site_chrome.json, and audited once.
+    """
+
+    def __init__(self, org_name: str, base_url: str, stakeholders: dict, mission_statement: str, llm=None,
+                 vision_model=None, executor: LLMExecutor = None, audit_workers: int = 4, image_workers: int = 2,
+                 batch_size: int = 8, queue_size: int = 32, warmup_pages: int = 50, group_size: int = None,
+                 near_duplicate_threshold: float = None, image_max_size: int = 1024, max_depth: int = 3,
+                 max_pages: int = 500, crawl_concurrency: int = 10):
+        """
+        Args:
+            org_name (str): The folder of the organization's artifacts.
+            base_url (str): The base URL of the website.
+            stakeholders (dict): The stakeholder descriptions, keyed by stakeholder name.
+            mission_statement (str): The mission statement of the organization.
+            llm (optional): The chat model of the audits. Defaults to the models the router picks for them.
+            vision_model (optional): The chat model of the captions. Defaults to the model the router picks for them.
+            executor (LLMExecutor, optional): The concurrency cap, rate limiter and retry policy shared by every call.
+            audit_workers (int): The number of concurrent batches of each audit stage.
+            image_workers (int): The number of concurrent batches of the download and captioning stage.
+            batch_size (int): The maximum number of pages a worker takes at once.
+            queue_size (int): The maximum number of pages waiting in front of a stage.
+            warmup_pages (int): The number of crawled pages the site chrome is learned from, see above.
+            group_size (int, optional): Passed to the audits, see audit_website_async.
+            near_duplicate_threshold (float, optional): Passed to the website audit, within each batch.
+            image_max_size (int): The maximum width and height of the uploaded images.
+            max_depth (int): The number of link hops followed from the base URL.
+            max_pages (int): The maximum number of pages to crawl.
+            crawl_concurrency (int): The maximum number of simultaneous crawl connections.
+        """
+        self.org_name = org_name
+        self.base_url = base_url
+        self.stakeholders = stakeholders
+        self.mission_statement = mission_statement
+        # Left as None, each stage takes its own model from the model router
+        self.llm = llm
+        self.vision_model = vision_model
+        self.executor = executor or LLMExecutor()
+        self.audit_workers = audit_workers
+        self.image_workers = image_workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.warmup_pages = warmup_pages
+        self.group_size = group_size
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self.image_max_size = image_max_size
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.crawl_concurrency = crawl_concurrency
+        self.images_path = os.path.join(org_name, "images")
+        self.website_map = {}
+        self.site_chrome = ""
+        self.captions = {}
+        self.manifest = {}
+        self._boilerplate = None
+        self._warmup = []
+        self._pending_images = {}
+        self.timings = {}
+
+    async def run(self, website_map: dict = None):
+        """
+        Runs the stages until every page is audited, then writes the website map, the site chrome, the captions,
+        both audits and the audit of the site chrome.
+        Args:
+            website_map (dict, optional): A website map from an earlier crawl to audit instead of crawling the site.
+        Returns:
+            tuple: (website map, captions, website audit, images audit)
+        """
+        start = time.time()
+        os.makedirs(self.images_path, exist_ok=True)
+        captions_path = os.path.join(self.org_name, "captions.json")
+        self.captions = load_artifact(captions_path) or {}
+        if isinstance(self.captions, list):
+            self.captions = {k: v for caption in self.captions for k, v in caption.items()}
+        self.manifest = load_manifest(self.images_path)
+        self.website_artifact = IncrementalArtifact(os.path.join(self.org_name, "website_audit.json"))
+        self.images_artifact = IncrementalArtifact(os.path.join(self.org_name, "images_audit.json"))
+        self.website_queue = asyncio.Queue(self.queue_size)
+        self.image_queue = asyncio.Queue(self.queue_size)
+        self.image_audit_queue = asyncio.Queue(self.queue_size)
+
+        async with asyncio.TaskGroup() as stages:
+            website_auditors = [stages.create_task(self._website_audit_worker()) for _ in range(self.audit_workers)]
+            image_auditors = [stages.create_task(self._image_audit_worker()) for _ in range(self.audit_workers)]
+            image_workers = [stages.create_task(self._image_worker()) for _ in range(self.image_workers)]
+            await self._source(website_map)
+            self.timings["crawl"] = time.time() - start
+            await self.website_queue.put(_CLOSED)
+            await self.image_queue.put(_CLOSED)
+            await asyncio.gather(*image_workers)
+            self.timings["captions"] = time.time() - start
+            await self.image_audit_queue.put(_CLOSED)
+            await asyncio.gather(*website_auditors, *image_auditors)
+        website_map_path = os.path.join(self.org_name, "website_map.json")
+        if self.site_chrome:
+            await audit_site_chrome_async(self.site_chrome, self.stakeholders, self.mission_statement,
+                                          os.path.join(self.org_name, "site_chrome_audit.json"), llm=self.llm,
+                                          executor=self.executor, group_size=self.group_size)
+        self.timings["audits"] = time.time() - start
+
+        save_artifact(website_map_path, self.website_map)
+        if website_map is None:
+            save_artifact(chrome_path_for(website_map_path), {'text': self.site_chrome})
+        save_artifact(captions_path, self.captions)
+        self.website_artifact.save()
+        self.images_artifact.save()
+        print("Pipeline finished: " + ", ".join(f"{stage} done after {seconds:.1f}s"
+                                                for stage, seconds in self.timings.items()))
+        return self.website_map, self.captions, self.website_artifact.results, self.images_artifact.results
+
+    async def _source(self, website_map: dict = None):
+        """
+        Feeds the pages of an earlier website map, or crawls the site and feeds each page as it is fetched.
+        """
+        if website_map is not None:
+            # The chrome of the earlier crawl, already stripped from its pages
+            chrome = load_artifact(chrome_path_for(os.path.join(self.org_name, "website_map.json")))
+            self.site_chrome = chrome['text'] if chrome else ""
+            for url, data in website_map.items():
+                await self._emit(url, data)
+            return
+        crawl_started = time.time()
+        crawled = await crawl_content_map(self.base_url, max_depth=self.max_depth, max_pages=self.max_pages,
+                                          concurrency=self.crawl_concurrency, on_page=self._on_crawled)
+        if self.base_url not in crawled:
+            print(f"Failed to fetch base URL: {self.base_url}")
+        if self._boilerplate is None:
+            # The crawl ended before warmup_pages pages: the chrome is learned from all of them
+            await self._learn_boilerplate()
+        print(f"Crawled {len(crawled)} pages in {time.time() - crawl_started:.2f}s")
+
+    async def _on_crawled(self, url: str, data: dict):
+        if self._boilerplate is None:
+            self._warmup.append((url, data))
+            if len(self._warmup) >= self.warmup_pages:
+                await self._learn_boilerplate()
+            return
+        await self._emit(url, self._strip(data))
+
+    async def _learn_boilerplate(self):
+        texts = [data['text'] for _, data in self._warmup]
+        self._boilerplate = find_boilerplate_shingles(texts)
+        self.site_chrome = '\n\n'.join(boilerplate_blocks(texts, self._boilerplate))
+        warmup, self._warmup = self._warmup, []
+        for url, data in warmup:
+            await self._emit(url, self._strip(data))
+
+    def _strip(self, data: dict) -> dict:
+        strip_page(data, self._boilerplate)
+        data['hash'] = content_hash(data['text'])
+        return data
+
+    async def _emit(self, url: str, data: dict):
+        self.website_map[url] = data
+        await self.website_queue.put((url, data))
+        await self.image_queue.put((url, data))
+
+    async def _website_audit_worker(self):
+        while batch := await _next_batch(self.website_queue, self.batch_size):
+            await audit_website_async(dict(batch), self.stakeholders, self.mission_statement, llm=self.llm,
+                                      executor=self.executor, group_size=self.group_size,
+                                      near_duplicate_threshold=self.near_duplicate_threshold,
+                                      artifact=self.website_artifact)
+
+    async def _image_worker(self):
+        """
+        Downloads and captions the images of a batch of pages that no other batch is already handling,
+        waits for the ones that are, and hands the pages on to the image audit.
+        """
+        while batch := await _next_batch(self.image_queue, self.batch_size):
+            links = list(dict.fromkeys(get_image_links(dict(batch), self.base_url)))
+            new_links = [link for link in links if link not in self.captions and link not in self._pending_images]
+            for link in new_links:
+                self._pending_images[link] = asyncio.Event()
+            try:
+                if new_links:
+                    await download_images_async(new_links, self.org_name, manifest=self.manifest)
+                    self.captions.update(await caption_images_async(new_links, self.images_path,
+                                                                    max_size=self.image_max_size,
+                                                                    model=self.vision_model, executor=self.executor))
+            finally:
+                for link in new_links:
+                    self._pending_images.pop(link).set()
+            for link in links:
+                if link in self._pending_images:
+                    await self._pending_images[link].wait()
+            for item in batch:
+                await self.image_audit_queue.put(item)
+
+    async def _image_audit_worker(self):
+        while batch := await _next_batch(self.image_audit_queue, self.batch_size):
+            await audit_images_async(self.captions, dict(batch), self.base_url, self.stakeholders, llm=self.llm,
+                                     executor=self.executor, group_size=self.group_size,
+                                     artifact=self.images_artifact)
+
+
+def run_pipeline(org_name: str, base_url: str, stakeholders: dict, mission_statement: str, website_map: dict = None,
+                 **kwargs):
+    """
+    Synchronous entry point of Pipeline.run; keyword arguments are passed to Pipeline.
+    """
+    return asyncio.run(Pipeline(org_name, base_url, stakeholders, mission_statement, **kwargs).run(website_map))
@@ -1,21 +1,23 @@
 from itertools import chain
 import asyncio
 import os
-import aiohttp
 from tqdm import tqdm
-from itertools import chain
 from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_openai import ChatOpenAI
-from dotenv import load_dotenv
-load_dotenv()
 import json
+from findings import SIMILARITY_THRESHOLD, consolidate_report_findings, consolidated_blocks
+from incremental import IncrementalArtifact, content_hash
+from llm_executor import LLMExecutor, estimate_tokens
+from model_router import get_model_router
+from audit_parser import parse_audit_text
+from call_planner import CallPlanner
+from chunking import count_tokens, pack_chunks, truncate_tokens
+from telemetry import labelled, traced
 
 from typing import List
 from pydantic import BaseModel,Field
 
-
-
+# The largest chunk sent in one call, leaving room for the instructions and the answer in a 128k-token context
+MAX_CHUNK_TOKENS = 100_000
 
 
 class Report(BaseModel):
@@ -26,16 +28,14 @@ class Report(BaseModel):
 def process_text(text, max_tokens):
     """
     Processes the input text by splitting it into chunks based on the specified maximum number of tokens.
+    Lines are kept whole unless a single line exceeds max_tokens.
     Args:
         text (str): The input text to be processed.
         max_tokens (int): The maximum number of tokens allowed in each chunk.
     Returns:
         list: A list of text chunks, each containing up to max_tokens tokens.
     """
-    # Check for token limit and split if necessary
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=max_tokens, chunk_overlap=200)
-    text_chunks = text_splitter.split_text(text)
-    return text_chunks
+    return pack_chunks(text.split('\n'), max_tokens)
 
 def summarize(text, system_message,llm):  # Adjust model as needed
     """
@@ -48,7 +48,7 @@ def summarize(text, system_message,llm):  # Adjust model as needed
         list: A list of responses generated by the language model for each chunk of the text.
     """
     sys_message = SystemMessage(content=system_message)
-    chunks = process_text(text,110_000)
+    chunks = process_text(text, MAX_CHUNK_TOKENS)
     # Process each chunk and combine results
     results = []
     for chunk in chunks:
@@ -57,6 +57,29 @@ def summarize(text, system_message,llm):  # Adjust model as needed
         results.append(response)
     return results
 
+async def asummarize(text, system_message, llm, executor: LLMExecutor = None):
+    """
+    Summarizes the given text using a language model, processing the chunks concurrently.
+    Args:
+        text (str): The text to be summarized.
+        system_message (str): The system message to be used in the summarization process.
+        llm (object): The language model object that provides the `ainvoke` method for generating responses.
+        executor (LLMExecutor, optional): Runs the calls under its concurrency cap, rate limiter and retries.
+    Returns:
+        list: A list of responses generated by the language model for each chunk of the text, in chunk order.
+    """
+    sys_message = SystemMessage(content=system_message)
+    chunks = process_text(text, MAX_CHUNK_TOKENS)
+    return await asyncio.gather(*(_ainvoke(llm, [sys_message, HumanMessage(content=chunk)], executor)
+                                  for chunk in chunks))
+
+
+async def _ainvoke(llm, messages, executor: LLMExecutor = None):
+    if executor is None:
+        return await llm.ainvoke(messages)
+    return await executor.run(lambda: llm.ainvoke(messages), estimate_tokens(messages) + executor.expected_output_tokens)
+
+
 def generate_report(context, llm,stakeholder):
     """Generates a report using the provided context and LLM.
 
@@ -76,8 +99,49 @@ def generate_report(context, llm,stakeholder):
     return response
 
 
+async def agenerate_report(context, llm, stakeholder, executor: LLMExecutor = None):
+    """Asynchronous version of generate_report.
+
+    Args:
+        context (str): The context for the report.
+        llm: The language model to use.
+        executor (LLMExecutor, optional): Runs the call under its concurrency cap, rate limiter and retries.
+
+    Returns:
+        Report: A Report object containing benefits and drawbacks.
+    """
+    prompt = f"Analyze the following text and provide the unique benefits and drawbacks for the stakeholder {stakeholder}: {context}"
+    return await _ainvoke(llm, [HumanMessage(content=prompt)], executor)
+
+
+def review_context(url, stakeholder, website_reviews, images_reviews):
+    """
+    Joins the website and image audit texts of a page and stakeholder.
+    """
+    return '\n'.join([website_reviews[url].get(stakeholder) or "",
+                      images_reviews[url].get(stakeholder) or "" if url in images_reviews else ""])
+
+
+async def process_context(context, stakeholder, llm, executor: LLMExecutor = None):
+    """
+    Turns the audit texts of a page into a report for a stakeholder with the LLM.
+    Args:
+        context (str): The joined audit texts, see review_context.
+        stakeholder (str): The stakeholder to consider.
+        llm (object): A STRUCTURED language model object used for processing.
+        executor (LLMExecutor, optional): Runs the calls under its concurrency cap, rate limiter and retries.
+    Returns:
+        Report: The generated report.
+    """
+    summaries = await asummarize(context, f"Provide a list of unique benefits and drawbacks for the stakeholder {stakeholder}: ", llm, executor)
+    benefits = list(chain(*[summary.benefits for summary in summaries]))
+    drawbacks = list(chain(*[summary.drawbacks for summary in summaries]))
+    benefits_drawbacks = benefits + drawbacks
+    context = '\n'.join(benefits_drawbacks)
+    return await agenerate_report(context, llm, stakeholder, executor)
+
 
-async def process_page_and_stakeholder(url, stakeholder, website_reviews, images_reviews, llm):
+async def process_page_and_stakeholder(url, stakeholder, website_reviews, images_reviews, llm, executor: LLMExecutor = None):
     """
     Process a page and stakeholder to generate a report.
     Args:
@@ -86,77 +150,179 @@ async def process_page_and_stakeholder(url, stakeholder, website_reviews, images
         website_reviews (dict): A dictionary containing website reviews with pages as keys.
         images_reviews (dict): A dictionary containing image reviews.
         llm (object): A language model object used for processing.
+        executor (LLMExecutor, optional): Runs the calls under its concurrency cap, rate limiter and retries.
     Returns: 
         tuple: A tuple containing the URL, stakeholder, and the generated report.
 
         """
-    context = '\n'.join([website_reviews[url][stakeholder], images_reviews[url][stakeholder] if url in images_reviews else ""])
-    summaries = summarize(context, f"Provide a list of unique benefits and drawbacks for the stakeholder {stakeholder}: ", llm)
-    benefits = list(chain(*[summary.benefits for summary in summaries]))
-    drawbacks = list(chain(*[summary.drawbacks for summary in summaries]))
-    benefits_drawbacks = benefits + drawbacks
-    context = '\n'.join(benefits_drawbacks)
-    report = generate_report(context, llm,stakeholder)
+    context = review_context(url, stakeholder, website_reviews, images_reviews)
+    report = await process_context(context, stakeholder, llm, executor)
     return url, stakeholder, report
 
 
-async def generate_output_reports(website_reviews, image_reviews, stakeholders_dict, llm,output_reports_path=None):
+def parse_page_and_stakeholder(url, stakeholder, website_reviews, images_reviews):
+    """
+    Builds the report of a page and stakeholder straight from the tagged audit texts, without calling an LLM.
+    Args:
+        url (str): The URL of the page to process.
+        stakeholder (str): The stakeholder to consider.
+        website_reviews (dict): A dictionary containing website reviews with pages as keys.
+        images_reviews (dict): A dictionary containing image reviews.
+    Returns:
+        Report or None: The report, or None if either audit text could not be parsed.
+    """
+    website_findings = parse_audit_text(website_reviews[url].get(stakeholder) or "")
+    images_findings = parse_audit_text(images_reviews[url].get(stakeholder) or "" if url in images_reviews else "")
+    if website_findings is None or images_findings is None:
+        return None
+    benefits = list(dict.fromkeys(website_findings[0] + images_findings[0]))
+    drawbacks = list(dict.fromkeys(website_findings[1] + images_findings[1]))
+    if not benefits and not drawbacks:
+        return None
+    return Report(benefits=benefits, drawbacks=drawbacks)
+
+
+def checkpoint_path_for(output_reports_path: str) -> str:
+    """
+    Returns the append-only JSONL checkpoint of an output reports file, e.g. output_reports.json -> output_reports.checkpoint.jsonl.
+    """
+    return os.path.splitext(output_reports_path)[0] + ".checkpoint.jsonl"
+
+
+def load_checkpoint(checkpoint_path: str) -> dict:
+    """
+    Reads the cells finished by an interrupted run.
+    Args:
+        checkpoint_path (str): The JSONL checkpoint file.
+    Returns:
+        dict: (url, stakeholder) -> (cell hash, report dict). A truncated last line is ignored.
+    """
+    finished = {}
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                finished[record["url"], record["stakeholder"]] = (record["hash"], record["report"])
+    return finished
+
+
+@traced("output_reports", count=len)
+async def generate_output_reports(website_reviews, image_reviews, stakeholders_dict, llm,output_reports_path=None,
+                                  concurrency=8, executor: LLMExecutor = None):
     """
     Generate output reports for website and image reviews for each stakeholder.
     This function processes reviews for each page and stakeholder, generates reports, and optionally saves them to a specified file path.
+    If output_reports_path already holds previous reports, only the cells whose reviews changed are regenerated.
+    Benefits and drawbacks are parsed straight out of the tagged audit texts; the LLM is only used for cells
+    whose texts cannot be parsed.
+    Every finished cell is appended to a JSONL checkpoint next to output_reports_path as soon as it completes,
+    so an interrupted run resumes from the cells it had already finished.
+    Cells whose LLM call failed, or whose page has no audit for the stakeholder yet, are stored empty and
+    without a hash, so the next run computes them again; a failed call does not cancel the others.
     Args:
         website_reviews (dict): A dictionary containing website reviews with pages as keys.
         image_reviews (dict): A dictionary containing image reviews.
         stakeholders_dict (dict): A dictionary containing stakeholders information.
         llm (object): A STRUCTURED language model object used for processing. Report Pydantic BaseModel with fields.
-        output_reports_path (str, optional): The file path to save the output reports. Defaults to None.
+            None uses the model the router picks for the output_reports stage.
+        output_reports_path (str, optional): The file path to merge the output reports into. Defaults to None.
+        concurrency (int): The maximum number of LLM-processed contexts in flight at once.
+        executor (LLMExecutor, optional): Runs the LLM calls under its concurrency cap, rate limiter and retries.
     Returns:
         dict: A dictionary containing the generated reports for each page and stakeholder.
     """
 
-    output_reports = {}
-    async with aiohttp.ClientSession():
-        tasks = []
-        for page in tqdm(list(website_reviews.keys()),"Generating reports for each page"):
-            for stakeholder in stakeholders_dict:
-                task = asyncio.create_task(process_page_and_stakeholder(page, stakeholder, website_reviews, image_reviews, llm))
-                tasks.append(task)
-            results = await asyncio.gather(*tasks)
-            for url, stakeholder, report in results:
-                output_reports.setdefault(url, {})[stakeholder] = {
-                    "benefits": report.benefits,
-                    "drawbacks": report.drawbacks
-                }
-    if output_reports_path:
-        with open(output_reports_path,"w") as f:
-            json.dump(output_reports,f,indent=4)
-    return output_reports
+    llm = llm or get_model_router().model("output_reports").with_structured_output(Report)
+    artifact = IncrementalArtifact(output_reports_path)
+    executor = executor or LLMExecutor(concurrency=concurrency)
+    checkpoint_path = checkpoint_path_for(output_reports_path) if output_reports_path else None
+    finished = load_checkpoint(checkpoint_path)
+    cells = {}
+    # Cells stored without a hash: their page has no audit for the stakeholder yet, or their LLM call failed
+    stale = set()
+    for page in website_reviews:
+        for stakeholder in stakeholders_dict:
+            cell_hash = content_hash(website_reviews[page].get(stakeholder) or "",
+                                     image_reviews[page].get(stakeholder) or "" if page in image_reviews else "",
+                                     stakeholder)
+            if artifact.is_fresh(page, stakeholder, cell_hash):
+                continue
+            artifact.reserve(page, stakeholder)
+            cells[page, stakeholder] = cell_hash
+            if website_reviews[page].get(stakeholder) is None:
+                stale.add((page, stakeholder))
+    results = {cell: finished[cell][1] for cell, cell_hash in cells.items()
+               if cell in finished and finished[cell][0] == cell_hash}
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
 
+    def finish(url, stakeholder, report):
+        results[url, stakeholder] = {
+            "benefits": report.benefits,
+            "drawbacks": report.drawbacks
+        }
+        if checkpoint:
+            checkpoint.write(json.dumps({"url": url, "stakeholder": stakeholder, "hash": cells[url, stakeholder],
+                                         "report": results[url, stakeholder]}) + "\n")
+            checkpoint.flush()
 
-def generate_full_reports(stakeholders,output_reports,llm,output_directory=None):
-    """
-    Generates detailed reports for each stakeholder based on the provided output reports.
-    Args:
-        stakeholders (list): A list of stakeholders for whom the reports are to be generated.
-        output_reports (dict): A dictionary containing the benefits and drawbacks for each stakeholder, keyed by URL.
-        llm (object): The language model used to generate the summaries. 
-    Returns:
-        None
-    The function creates a detailed report for each stakeholder by:
-    1. Generating a system prompt for the language model.
-    2. Compiling the benefits and drawbacks from the output reports.
-    3. Summarizing the compiled information using the language model.
-    4. Saving the summaries in a JSON file named after the stakeholder.
-    """
-    if not output_directory:
-        output_directory = "reports"
-        if not os.path.exists("reports"):
-            os.makedirs("reports")
-    else:
-        if not os.path.exists(output_directory):
-            os.makedirs(output_directory)
-    for stakeholder in stakeholders:
-        system_prompt = """
+    # Cells whose audit texts parse need no call; the rest are planned so empty and identical contexts cost nothing extra
+    planner = CallPlanner("generate_output_reports", empty_result=Report(benefits=[], drawbacks=[]))
+    llm_cells = []
+    parsed = 0
+    try:
+        for page, stakeholder in [cell for cell in cells if cell not in results]:
+            report = parse_page_and_stakeholder(page, stakeholder, website_reviews, image_reviews)
+            if report is not None:
+                parsed += 1
+                finish(page, stakeholder, report)
+            else:
+                planner.add(stakeholder, review_context(page, stakeholder, website_reviews, image_reviews))
+                llm_cells.append((page, stakeholder))
+        for slot in planner.empty_slots():
+            finish(*llm_cells[slot], planner.empty_result)
+        semaphore = asyncio.BoundedSemaphore(concurrency)
+
+        async def process_call(index, stakeholder, context):
+            async with semaphore:
+                with labelled(stakeholder=stakeholder):
+                    report = await process_context(context, stakeholder, llm, executor)
+            # Finished as soon as it completes, so the checkpoint keeps it even if a later call fails
+            for slot in planner.slots_for(index):
+                finish(*llm_cells[slot], report)
+                progress.update(1)
+
+        with tqdm(total=len(cells), initial=len(results), desc="Generating reports for each page and stakeholder") as progress:
+            outcomes = await asyncio.gather(*(process_call(index, stakeholder, context)
+                                              for index, (stakeholder, context) in enumerate(planner.calls)),
+                                            return_exceptions=True)
+        failed = [index for index, outcome in enumerate(outcomes) if isinstance(outcome, Exception)]
+        for index in failed:
+            for slot in planner.slots_for(index):
+                results[llm_cells[slot]] = {"benefits": [], "drawbacks": []}
+                stale.add(llm_cells[slot])
+        if failed:
+            print(f"{len(failed)} of {len(planner.calls)} report calls failed ({outcomes[failed[0]]!r}); "
+                  f"their cells are retried on the next run")
+    finally:
+        if checkpoint:
+            checkpoint.close()
+    if parsed or llm_cells:
+        print(f"Parsed {parsed} of {parsed + len(llm_cells)} cells locally, {len(llm_cells)} needed the LLM")
+        planner.report()
+    for (url, stakeholder), cell_hash in cells.items():
+        artifact.set(url, stakeholder, results[url, stakeholder], None if (url, stakeholder) in stale else cell_hash)
+    artifact.save()
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        # Everything is in output_reports_path now
+        os.remove(checkpoint_path)
+    return artifact.results
+
+
+def full_report_prompt(stakeholder):
+    return """
                 Provide the benefits and drawbacks of how {stakeholder} view the nonprofit.
                 Provide specific benefits and drawbacks with links to the website and how certain links have drawbacks or benefits.
                 Explain how the non-profit could highlight it's strengths better and how it can improve its image with regards to is drawbacks.
@@ -166,14 +332,143 @@ def generate_full_reports(stakeholders,output_reports,llm,output_directory=None)
                 The report should be in raw markdown.
                 Provide no precursor or post cursor text.
                 """.format(stakeholder=stakeholder)
-        full_context = []
-        for url in output_reports:
-            benefits, drawbacks = '\n'.join(output_reports[url][stakeholder]["benefits"]), '\n'.join(output_reports[url][stakeholder]["drawbacks"])
-            full_context.append(f"{url}:\nBenefits:\n{benefits}\nDrawbacks:\n{drawbacks}")
-        full_context = '\n'.join(full_context)
-        summaries = summarize(full_context, system_prompt,llm)
-        summaries = [summary.content for summary in summaries]
+
+
+def merge_reports_prompt(stakeholder):
+    return full_report_prompt(stakeholder) + """
+                The input is a set of partial reports, each covering a different part of the website.
+                Merge them into a single report: keep every specific example and link, and combine repeated points.
+                """
+
+
+async def amap_reduce(blocks, system_message, merge_message, llm, executor: LLMExecutor = None,
+                      max_tokens: int = MAX_CHUNK_TOKENS) -> str:
+    """
+    Writes one answer over blocks of text that may not fit in a single call.
+    The blocks are packed into chunks of at most max_tokens tokens and answered concurrently with system_message
+    (map); the partial answers are then merged with merge_message, re-packed with pack_chunks at every level into
+    groups that fit in a call, until one is left (reduce). Input that fits in one chunk is answered with a single call.
+    Only if no two partial answers fit in a call together are the ones over half a call truncated, so the level
+    can still merge them in pairs.
+    Args:
+        blocks (list): The blocks of text, never split across chunks unless larger than a chunk.
+        system_message (str): The instructions for the input.
+        merge_message (str): The instructions for merging partial answers.
+        llm (object): The language model object that provides the `ainvoke` method for generating responses.
+        executor (LLMExecutor, optional): Runs the calls under its concurrency cap, rate limiter and retries.
+        max_tokens (int): The maximum number of input tokens of a call.
+    Returns:
+        str: The answer.
+    """
+    async def answer(instructions, chunk):
+        response = await _ainvoke(llm, [SystemMessage(content=instructions), HumanMessage(content=chunk)], executor)
+        return response.content
+
+    partials = await asyncio.gather(*(answer(system_message, chunk) for chunk in pack_chunks(blocks, max_tokens)))
+    while len(partials) > 1:
+        groups = pack_chunks(partials, max_tokens, separator="\n\n")
+        if len(groups) >= len(partials):
+            # Last resort: no two partials fit together, so the ones over half a call are cut to half a call
+            half = (max_tokens - count_tokens("\n\n")) // 2
+            oversized = sum(count_tokens(partial) > half for partial in partials)
+            print(f"Truncating {oversized} of {len(partials)} partial answers to {half} tokens to merge them")
+            partials = [truncate_tokens(partial, half) for partial in partials]
+            groups = pack_chunks(partials, max_tokens, separator="\n\n")
+        partials = await asyncio.gather(*(answer(merge_message, group) for group in groups))
+    return partials[0] if partials else ""
+
+
+def site_chrome_blocks(site_chrome_audit, stakeholder) -> list:
+    """
+    Renders the findings of the site chrome audit (see audit.audit_site_chrome) for a stakeholder as one text
+    block, since they apply to every page. Returns no block if there are none.
+    """
+    findings = parse_audit_text((site_chrome_audit or {}).get(stakeholder) or "")
+    if not findings or not any(findings):
+        return []
+    benefits, drawbacks = '\n'.join(findings[0]), '\n'.join(findings[1])
+    return [f"Every page (header, navigation menu and footer):\nBenefits:\n{benefits}\nDrawbacks:\n{drawbacks}"]
+
+
+def page_blocks(output_reports, stakeholder) -> list:
+    """
+    Renders the benefits and drawbacks of every page for a stakeholder as text blocks, one per page.
+    """
+    blocks = []
+    for url in output_reports:
+        benefits, drawbacks = '\n'.join(output_reports[url][stakeholder]["benefits"]), '\n'.join(output_reports[url][stakeholder]["drawbacks"])
+        blocks.append(f"{url}:\nBenefits:\n{benefits}\nDrawbacks:\n{drawbacks}")
+    return blocks
+
+
+async def agenerate_full_report(stakeholder, output_reports, llm, executor: LLMExecutor = None,
+                                max_tokens: int = MAX_CHUNK_TOKENS,
+                                similarity_threshold: float = SIMILARITY_THRESHOLD, site_chrome_audit: dict = None) -> str:
+    """
+    Writes the detailed report of one stakeholder from the benefits and drawbacks of every page, and of the
+    site chrome shared by every page if site_chrome_audit is given.
+    Findings repeated across pages are consolidated locally first (see findings.consolidate_findings), so
+    each is sent once with the pages it was found on; similarity_threshold None sends every page's findings.
+    """
+    findings = page_blocks(output_reports, stakeholder)
+    if similarity_threshold is not None:
+        consolidated = consolidate_report_findings(output_reports, stakeholder, similarity_threshold)
+        before, findings = findings, consolidated_blocks(consolidated)
+        count = sum(len(output_reports[url][stakeholder][kind]) for url in output_reports for kind in consolidated)
+        print(f"{stakeholder}: consolidated {count} findings into {len(findings)}, "
+              f"report context {estimate_tokens(before)} -> {estimate_tokens(findings)} tokens")
+    with labelled(stakeholder=stakeholder):
+        return await amap_reduce(site_chrome_blocks(site_chrome_audit, stakeholder) + findings, full_report_prompt(stakeholder), merge_reports_prompt(stakeholder), llm,
+                                 executor, max_tokens)
+
+
+@traced("full_reports")
+async def agenerate_full_reports(stakeholders, output_reports, llm, output_directory=None,
+                                 executor: LLMExecutor = None, max_tokens: int = MAX_CHUNK_TOKENS,
+                                 similarity_threshold: float = SIMILARITY_THRESHOLD, site_chrome_audit: dict = None):
+    """
+    Generates detailed reports for each stakeholder based on the provided output reports.
+    Args:
+        stakeholders (list): A list of stakeholders for whom the reports are to be generated.
+        output_reports (dict): A dictionary containing the benefits and drawbacks for each stakeholder, keyed by URL.
+        llm (object): The language model used to generate the summaries. None uses the model the router picks
+            for the full_reports stage.
+        output_directory (str, optional): The folder the reports are written to. Defaults to "reports".
+        executor (LLMExecutor, optional): The concurrency cap, rate limiter and retry policy shared by every call.
+        max_tokens (int): The maximum number of input tokens of a call.
+        similarity_threshold (float, optional): Merge the findings of different pages at least this similar
+            (TF-IDF cosine) before writing the reports. None disables the consolidation.
+        site_chrome_audit (dict, optional): The audit text of the site chrome for each stakeholder, sent once
+            as findings that apply to every page.
+    Returns:
+        None
+    The function creates a detailed report for each stakeholder, all stakeholders concurrently, by:
+    1. Compiling the benefits and drawbacks from the output reports, one block per consolidated finding with
+       the pages it was found on (or one block per page without consolidation).
+    2. Packing the blocks into chunks that fit in a call and summarizing each chunk (map).
+    3. Merging the partial summaries into a single report (reduce).
+    4. Saving the report in a JSON file named after the stakeholder.
+    """
+    llm = llm or get_model_router().model("full_reports")
+    output_directory = output_directory or "reports"
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+    executor = executor or LLMExecutor()
+    stakeholders = list(stakeholders)
+    reports = await asyncio.gather(*(agenerate_full_report(stakeholder, output_reports, llm, executor, max_tokens,
+                                                           similarity_threshold, site_chrome_audit)
+                                     for stakeholder in stakeholders))
+    for stakeholder, report in zip(stakeholders, reports):
         path = os.path.join(output_directory,f"{stakeholder}_report.json")
         with open(path,"w") as f:
-            json.dump(summaries,f,indent=4)
+            json.dump([report],f,indent=4)
 
+
+def generate_full_reports(stakeholders,output_reports,llm,output_directory=None,
+                          executor: LLMExecutor = None, max_tokens: int = MAX_CHUNK_TOKENS,
+                          similarity_threshold: float = SIMILARITY_THRESHOLD, site_chrome_audit: dict = None):
+    """
+    Synchronous entry point of agenerate_full_reports.
+    """
+    asyncio.run(agenerate_full_reports(stakeholders, output_reports, llm, output_directory, executor, max_tokens,
+                                       similarity_threshold, site_chrome_audit))
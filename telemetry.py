@@ -0,0 +1,334 @@
+import functools
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+# USD per million (input, output) tokens; a model is priced by the longest prefix of its name found here
+PRICES_PER_MILLION = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "fake-chat-model": (0.0, 0.0),
+}
+
+_handler = ContextVar("telemetry_handler", default=None)
+_span = ContextVar("telemetry_span", default=None)
+_labels = ContextVar("telemetry_labels", default={})
+_telemetry = None
+
+
+def model_price(model: str) -> tuple:
+    """
+    Returns the (input, output) USD price per million tokens of a model, or (0, 0) if it is not in PRICES_PER_MILLION.
+    """
+    matches = [name for name in PRICES_PER_MILLION if (model or "").startswith(name)]
+    return PRICES_PER_MILLION[max(matches, key=len)] if matches else (0.0, 0.0)
+
+
+def _new_id(size: int) -> str:
+    return secrets.token_hex(size)
+
+
+class TelemetryCallbacks:
+    """
+    Records every chat model call made while telemetry is configured as a span of the current stage,
+    with its token usage and the labels (e.g. stakeholder) of the code that made it.
+    Mixed into a langchain callback handler by callback_handler_class.
+    """
+
+    # Called in the event loop rather than a worker thread, so the stage and labels context variables are visible
+    run_inline = True
+
+    def __init__(self, telemetry: "Telemetry"):
+        self.telemetry = telemetry
+        self._calls = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or (serialized or {}).get("name", "unknown")
+        parent = _span.get()
+        self._calls[run_id] = {
+            "name": "llm_call", "span_id": _new_id(8), "parent_id": parent["span_id"] if parent else None,
+            "stage": parent["stage"] if parent else None, "model": model, "labels": dict(_labels.get()),
+            "start": time.time(),
+        }
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        usage, cached = {}, False
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                if message is not None:
+                    usage = getattr(message, "usage_metadata", None) or usage
+                    cached = cached or bool(message.response_metadata.get("cache_hit"))
+        if not usage:
+            token_usage = (response.llm_output or {}).get("token_usage") or {}
+            usage = {"input_tokens": token_usage.get("prompt_tokens", 0),
+                     "output_tokens": token_usage.get("completion_tokens", 0)}
+        self.telemetry.record_call(call, usage.get("input_tokens", 0), usage.get("output_tokens", 0), cached)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        call = self._calls.pop(run_id, None)
+        if call is not None:
+            self.telemetry.record_call(call, 0, 0, False, error=type(error).__name__)
+
+
+@functools.lru_cache(maxsize=None)
+def callback_handler_class() -> type:
+    """
+    Returns the langchain callback handler class of TelemetryCallbacks, registered so that every langchain run
+    started while a handler is configured reports to it. langchain is only imported here, on first use,
+    so importing this module to decorate the stages stays cheap.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_core.tracers.context import register_configure_hook
+
+    register_configure_hook(_handler, inheritable=True)
+    return type("TelemetryCallbackHandler", (TelemetryCallbacks, BaseCallbackHandler), {})
+
+
+class Telemetry:
+    """
+    Collects the timing spans of the pipeline stages and of every LLM call, with token usage and estimated cost,
+    and summarizes them per stage, model and stakeholder.
+
+    Usage:
+        telemetry = configure_telemetry()
+        ...  # run the stages; functions decorated with traced() and every chat model call are recorded
+        telemetry.write(org_name)  # run_summary.json, metrics.prom and trace.json
+    """
+
+    def __init__(self, run_name: str = "audit"):
+        self.run_name = run_name
+        self.trace_id = _new_id(16)
+        self.started_at = time.time()
+        self.spans = []
+        self.calls = []
+        self.handler = callback_handler_class()(self)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, stage: str = None, **attributes):
+        """
+        Times a block of code as a span, nested under the current span. LLM calls made inside it are attributed to
+        its stage (the stage of the enclosing span if none is given).
+        """
+        parent = _span.get()
+        span = {"name": name, "span_id": _new_id(8), "parent_id": parent["span_id"] if parent else None,
+                "stage": stage or (parent["stage"] if parent else name), "start": time.time(),
+                "attributes": attributes}
+        token = _span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span["error"] = type(e).__name__
+            raise
+        finally:
+            _span.reset(token)
+            span["end"] = time.time()
+            with self._lock:
+                self.spans.append(span)
+
+    def record_call(self, call: dict, input_tokens: int, output_tokens: int, cached: bool, error: str = None):
+        input_price, output_price = model_price(call["model"])
+        call.update(end=time.time(), input_tokens=input_tokens, output_tokens=output_tokens, cached=cached,
+                    cost_usd=0.0 if cached else (input_tokens * input_price + output_tokens * output_price) / 1e6)
+        if error:
+            call["error"] = error
+        with self._lock:
+            self.calls.append(call)
+
+    def summary(self) -> dict:
+        """
+        Returns the run totals and the LLM usage per stage, model and stakeholder. A call made for several
+        stakeholders (a grouped or deduplicated call) is split evenly between them.
+        """
+        def bucket():
+            return {"llm_calls": 0, "cached_calls": 0, "failed_calls": 0, "input_tokens": 0, "output_tokens": 0,
+                    "cost_usd": 0.0, "llm_seconds": 0.0}
+
+        def add(entry, call, share=1):
+            entry["llm_calls"] += share
+            entry["cached_calls"] += share if call["cached"] else 0
+            entry["failed_calls"] += share if call.get("error") else 0
+            entry["input_tokens"] += call["input_tokens"] * share
+            entry["output_tokens"] += call["output_tokens"] * share
+            entry["cost_usd"] += call["cost_usd"] * share
+            entry["llm_seconds"] += (call["end"] - call["start"]) * share
+
+        totals, stages, models, stakeholders = bucket(), {}, {}, {}
+        with self._lock:
+            spans, calls = list(self.spans), list(self.calls)
+        for span in spans:
+            if span["parent_id"] is None or span["name"] == span["stage"]:
+                stages.setdefault(span["stage"], bucket()).setdefault("seconds", 0.0)
+                stages[span["stage"]]["seconds"] += span["end"] - span["start"]
+        for call in calls:
+            add(totals, call)
+            add(stages.setdefault(call["stage"] or "other", bucket()), call)
+            add(models.setdefault(call["model"], bucket()), call)
+            names = call["labels"].get("stakeholder")
+            names = [names] if isinstance(names, str) else list(names or [])
+            for name in names:
+                add(stakeholders.setdefault(name, bucket()), call, 1 / len(names))
+
+        def rounded(entry):
+            return {key: round(value, 6) if isinstance(value, float) else value for key, value in entry.items()}
+
+        return {
+            "run": {"name": self.run_name, "trace_id": self.trace_id, "started_at": self.started_at,
+                    "seconds": round(time.time() - self.started_at, 3)},
+            "totals": rounded(totals),
+            "stages": {name: rounded(entry) for name, entry in stages.items()},
+            "models": {name: rounded(entry) for name, entry in models.items()},
+            "stakeholders": {name: rounded(entry) for name, entry in stakeholders.items()},
+        }
+
+    def to_prometheus(self) -> str:
+        """
+        Renders the summary in the Prometheus text exposition format.
+        """
+        summary = self.summary()
+        metrics = [
+            ("audit_stage_seconds", "gauge", "Wall time spent in each stage.", "stages", "stage", "seconds"),
+            ("audit_llm_calls_total", "counter", "LLM calls.", None, None, "llm_calls"),
+            ("audit_llm_cached_calls_total", "counter", "LLM calls answered from the cache.", None, None, "cached_calls"),
+            ("audit_llm_failed_calls_total", "counter", "LLM calls that failed.", None, None, "failed_calls"),
+            ("audit_llm_input_tokens_total", "counter", "LLM input tokens.", None, None, "input_tokens"),
+            ("audit_llm_output_tokens_total", "counter", "LLM output tokens.", None, None, "output_tokens"),
+            ("audit_llm_cost_usd_total", "counter", "Estimated LLM cost in USD.", None, None, "cost_usd"),
+        ]
+        lines = []
+        run = summary["run"]["name"].replace('"', '\\"')
+        for name, kind, help_text, section, label, field in metrics:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            breakdowns = [(section, label)] if section else [("stages", "stage"), ("models", "model"),
+                                                             ("stakeholders", "stakeholder")]
+            for section_name, label_name in breakdowns:
+                for key, entry in summary[section_name].items():
+                    if field in entry:
+                        key = str(key).replace('"', '\\"')
+                        lines.append(f'{name}{{run="{run}",{label_name}="{key}"}} {entry[field]}')
+        return "\n".join(lines) + "\n"
+
+    def to_otel_json(self) -> dict:
+        """
+        Renders the spans and LLM calls as OpenTelemetry (OTLP/JSON) resource spans.
+        """
+        def attribute(key, value):
+            if isinstance(value, bool):
+                return {"key": key, "value": {"boolValue": value}}
+            if isinstance(value, int):
+                return {"key": key, "value": {"intValue": str(value)}}
+            if isinstance(value, float):
+                return {"key": key, "value": {"doubleValue": value}}
+            return {"key": key, "value": {"stringValue": value if isinstance(value, str) else json.dumps(value)}}
+
+        def otel_span(span, attributes):
+            return {
+                "traceId": self.trace_id, "spanId": span["span_id"], "parentSpanId": span["parent_id"] or "",
+                "name": span["name"], "kind": 1,
+                "startTimeUnixNano": str(int(span["start"] * 1e9)), "endTimeUnixNano": str(int(span["end"] * 1e9)),
+                "attributes": [attribute(key, value) for key, value in attributes.items() if value is not None],
+                "status": {"code": 2, "message": span["error"]} if span.get("error") else {"code": 1},
+            }
+
+        with self._lock:
+            spans, calls = list(self.spans), list(self.calls)
+        otel_spans = [otel_span(span, {"stage": span["stage"], **span["attributes"]}) for span in spans]
+        otel_spans += [otel_span(call, {"stage": call["stage"], "gen_ai.request.model": call["model"],
+                                        "gen_ai.usage.input_tokens": call["input_tokens"],
+                                        "gen_ai.usage.output_tokens": call["output_tokens"],
+                                        "llm.cached": call["cached"], "llm.cost_usd": call["cost_usd"],
+                                        **{f"labels.{key}": value for key, value in call["labels"].items()}})
+                       for call in calls]
+        return {"resourceSpans": [{
+            "resource": {"attributes": [attribute("service.name", "vee-audit"), attribute("run.name", self.run_name)]},
+            "scopeSpans": [{"scope": {"name": "telemetry"}, "spans": otel_spans}],
+        }]}
+
+    def write(self, directory: str) -> dict:
+        """
+        Writes run_summary.json, metrics.prom (Prometheus) and trace.json (OpenTelemetry) to a folder, and prints the totals.
+        """
+        summary = self.summary()
+        with open(os.path.join(directory, "run_summary.json"), "w") as f:
+            json.dump(summary, f, indent=4)
+        with open(os.path.join(directory, "metrics.prom"), "w") as f:
+            f.write(self.to_prometheus())
+        with open(os.path.join(directory, "trace.json"), "w") as f:
+            json.dump(self.to_otel_json(), f)
+        totals = summary["totals"]
+        print(f"Run took {summary['run']['seconds']:.1f}s: {totals['llm_calls']:.0f} LLM calls "
+              f"({totals['cached_calls']:.0f} cached), {totals['input_tokens']:.0f} input and "
+              f"{totals['output_tokens']:.0f} output tokens, ~${totals['cost_usd']:.2f}")
+        return summary
+
+
+def configure_telemetry(run_name: str = "audit") -> Telemetry:
+    """
+    Starts recording the spans of the traced stages and every chat model call of this process.
+    """
+    global _telemetry
+    _telemetry = Telemetry(run_name)
+    _handler.set(_telemetry.handler)
+    return _telemetry
+
+
+def get_telemetry() -> Optional[Telemetry]:
+    return _telemetry
+
+
+@contextmanager
+def labelled(**labels):
+    """
+    Attaches labels (e.g. stakeholder=...) to the LLM calls made inside the block.
+    """
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def traced(stage: str, count: Callable = None):
+    """
+    Records every call of the decorated function, sync or async, as a span of the given stage.
+    Args:
+        stage (str): The stage name.
+        count (callable, optional): Maps the result to the number of items the stage produced, stored as 'items'.
+    """
+    def decorator(function):
+        def finish(span, result):
+            if count is not None and result is not None:
+                span["attributes"]["items"] = count(result)
+            return result
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if _telemetry is None:
+                    return await function(*args, **kwargs)
+                with _telemetry.span(stage, stage=stage) as span:
+                    return finish(span, await function(*args, **kwargs))
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _telemetry is None:
+                return function(*args, **kwargs)
+            with _telemetry.span(stage, stage=stage) as span:
+                return finish(span, function(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import artifact_store
+from artifact_store import ArtifactStore, StoredMapping, load_artifact, save_artifact
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ArtifactStore(str(tmp_path / "nested" / "artifacts.sqlite"))
+    yield store
+    store.close()
+
+
+def test_records_round_trip_in_order(store):
+    data = {"https://example.org/b": {"text": "B", "links": ["x"]}, "https://example.org/a": {"text": "A", "links": []},
+            "caption": "a string record", "empty": {}}
+    store.replace("website_map", data)
+    mapping = store.mapping("website_map")
+    assert list(mapping) == list(data)
+    assert len(mapping) == 4
+    assert mapping.to_dict() == data
+    assert mapping["https://example.org/a"] == {"text": "A", "links": []}
+    assert "caption" in mapping and "missing" not in mapping
+    with pytest.raises(KeyError):
+        mapping["missing"]
+
+
+def test_missing_artifacts(store):
+    assert store.mapping("website_map") is None
+    assert not store.exists("website_map")
+
+
+def test_writes_go_through_and_keep_positions(store):
+    store.replace("audit", {"a": {"Staff": "1"}, "b": {"Staff": "2"}})
+    mapping = StoredMapping(store, "audit")
+    assert mapping["a"] == {"Staff": "1"}
+    mapping["a"] = {"Staff": "changed"}
+    mapping["c"] = {"Staff": "3"}
+    del mapping["b"]
+    assert StoredMapping(store, "audit").to_dict() == {"a": {"Staff": "changed"}, "c": {"Staff": "3"}}
+    with pytest.raises(KeyError):
+        del mapping["b"]
+
+
+def test_replacing_an_artifact_with_its_own_view_keeps_it(store):
+    store.replace("audit", {"a": {"Staff": "1"}})
+    store.replace("audit", store.mapping("audit"))
+    assert store.mapping("audit").to_dict() == {"a": {"Staff": "1"}}
+
+
+def test_json_import_and_export(store, tmp_path):
+    legacy = tmp_path / "captions.json"
+    legacy.write_text(json.dumps([{"https://example.org/a.png": "A"}, {"https://example.org/b.png": "B"}]))
+    store.import_json("captions", str(legacy))
+    exported = tmp_path / "exported.json"
+    store.export_json("captions", str(exported))
+    assert json.loads(exported.read_text()) == {"https://example.org/a.png": "A", "https://example.org/b.png": "B"}
+
+
+def test_load_and_save_artifact_use_the_configured_store(tmp_path, monkeypatch):
+    path = str(tmp_path / "website_audit.json")
+    monkeypatch.setattr(artifact_store, "_store", None)
+    save_artifact(path, {"a": {"Staff": "1"}})
+    assert load_artifact(path) == {"a": {"Staff": "1"}}
+    store = artifact_store.configure_artifact_store(str(tmp_path / "artifacts.sqlite"))
+    try:
+        # The JSON file written before the store existed is imported the first time it is loaded
+        assert load_artifact(path).to_dict() == {"a": {"Staff": "1"}}
+        save_artifact(path, {"b": {"Staff": "2"}})
+        assert load_artifact(path).to_dict() == {"b": {"Staff": "2"}}
+        assert load_artifact(str(tmp_path / "missing.json")) is None
+    finally:
+        store.close()
+        monkeypatch.setattr(artifact_store, "_store", None)
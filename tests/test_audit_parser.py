@@ -0,0 +1,36 @@
+from audit_parser import parse_audit_text
+
+
+def test_tagged_findings():
+    text = "<benefit>Clear mission</benefit>\n<drawback>No donation link</drawback>\n<benefit>Photos</benefit>"
+    assert parse_audit_text(text) == (["Clear mission", "Photos"], ["No donation link"])
+
+
+def test_plural_bracket_and_unclosed_tags():
+    text = "[Benefits]\n- Clear mission\n- Photos\n<drawbacks>\n1. No donation link\n   on the homepage"
+    assert parse_audit_text(text) == (["Clear mission", "Photos"], ["No donation link on the homepage"])
+
+
+def test_stakeholder_wrapper_tags_are_ignored():
+    text = "<Donors>\n<benefit>Clear mission</benefit>\n<drawback>No donation link</drawback>\n</Donors>"
+    assert parse_audit_text(text) == (["Clear mission"], ["No donation link"])
+
+
+def test_headings():
+    text = "## Benefits\n* **Clear** mission\n\nDrawbacks:\n- No donation link"
+    assert parse_audit_text(text) == (["Clear mission"], ["No donation link"])
+
+
+def test_repeated_findings_are_kept_once():
+    text = "<benefit>Photos</benefit><benefit>Photos</benefit>"
+    assert parse_audit_text(text) == (["Photos"], [])
+
+
+def test_empty_text_has_no_findings():
+    assert parse_audit_text("") == ([], [])
+    assert parse_audit_text("  \n") == ([], [])
+
+
+def test_unparseable_text():
+    assert parse_audit_text("The page looks fine overall.") is None
+    assert parse_audit_text("<benefit></benefit><drawback> </drawback>") is None
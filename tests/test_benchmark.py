@@ -0,0 +1,32 @@
+from benchmark import LLM_FREE_COMMANDS, check_cold_start, check_grouping, measure_cold_start
+
+
+def result(command, seconds, budget=1.0, llm_modules=()):
+    return {"command": command, "seconds": seconds, "budget": budget, "llm_modules": list(llm_modules)}
+
+
+def test_commands_within_budget_pass():
+    assert check_cold_start([result("crawl", 0.2), result("audit", 3.0, 4.0, ["langchain_core", "openai"])]) == []
+
+
+def test_slow_commands_fail():
+    assert check_cold_start([result("audit", 4.5, 4.0)]) == ["audit: started in 4.5s, budget 4.0s"]
+
+
+def test_llm_free_commands_must_not_load_the_llm_stack():
+    assert check_cold_start([result("pdf", 0.1, 0.5, ["langchain_core"])]) == ["pdf: imports langchain_core"]
+
+
+def test_the_llm_free_commands_start_without_the_llm_stack():
+    results = {entry["command"]: entry for entry in measure_cold_start(repeats=1)}
+    for command in LLM_FREE_COMMANDS:
+        assert results[command]["llm_modules"] == []
+
+
+def test_grouping_must_save_calls_for_the_same_cells():
+    single = [{"stage": "website audit", "units": 8, "llm_calls": 8}, {"stage": "crawl", "units": 2, "llm_calls": 0}]
+    assert check_grouping(single, [{"stage": "website audit", "units": 8, "llm_calls": 2},
+                                   {"stage": "crawl", "units": 2, "llm_calls": 0}]) == []
+    assert check_grouping(single, [{"stage": "website audit", "units": 6, "llm_calls": 8},
+                                   {"stage": "crawl", "units": 2, "llm_calls": 0}]) == [
+        "website audit: 6 cells grouped, 8 one by one", "website audit: 8 calls grouped, 8 one by one"]
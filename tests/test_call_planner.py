@@ -0,0 +1,29 @@
+from call_planner import CallPlanner
+
+
+def test_empty_inputs_are_answered_without_a_call():
+    planner = CallPlanner("test", empty_result="EMPTY")
+    slots = [planner.add("prompt", content) for content in ("a", "", "  \n", "b")]
+    assert slots == [0, 1, 2, 3]
+    assert planner.calls == [("prompt", "a"), ("prompt", "b")]
+    assert planner.empty_slots() == [1, 2]
+    assert planner.fan_out(["A", "B"]) == ["A", "EMPTY", "EMPTY", "B"]
+    assert (planner.requested, planner.skipped_empty, planner.deduplicated, planner.saved) == (4, 2, 0, 2)
+
+
+def test_duplicate_calls_are_sent_once():
+    planner = CallPlanner("test")
+    for prompt, content in [("p", "a"), ("q", "a"), ("p", "a"), ("p", "b"), ("p", "a")]:
+        planner.add(prompt, content)
+    assert planner.calls == [("p", "a"), ("q", "a"), ("p", "b")]
+    assert planner.slots_for(0) == [0, 2, 4]
+    assert planner.slots_for(1) == [1]
+    assert planner.fan_out(["PA", "QA", "PB"]) == ["PA", "QA", "PA", "PB", "PA"]
+    assert (planner.deduplicated, planner.saved) == (2, 2)
+
+
+def test_empty_plan():
+    planner = CallPlanner("test", empty_result="")
+    assert planner.calls == []
+    assert planner.fan_out([]) == []
+    assert planner.requested == 0
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+import chunking
+from chunking import count_tokens, pack_chunks, truncate_tokens
+from report_generator import amap_reduce
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # Counts tokens as about 4 characters each, whether or not the tokenizer's vocabulary is available here
+    monkeypatch.setattr(chunking, "_encoding", lambda: None)
+
+
+def test_blocks_are_packed_whole_and_in_order():
+    blocks = ["a" * 36, "b" * 36, "c" * 36, "d" * 8]
+    # 10 tokens per block, 1 per separator
+    assert pack_chunks(blocks, 21) == ["a" * 36 + "\n" + "b" * 36, "c" * 36 + "\n" + "d" * 8]
+    assert pack_chunks(blocks, 1000) == ["\n".join(blocks)]
+    assert pack_chunks([], 10) == []
+
+
+def test_a_block_larger_than_a_chunk_is_split():
+    chunks = pack_chunks(["x" * 100, "y"], 10)
+    assert len(chunks) == 3
+    assert "".join(chunks) == "x" * 100 + "\ny"
+    assert all(count_tokens(chunk) <= 10 for chunk in chunks)
+
+
+def test_truncate_tokens():
+    assert truncate_tokens("short", 10) == "short"
+    truncated = truncate_tokens("x" * 1000, 10)
+    assert count_tokens(truncated) <= 10
+    assert ("x" * 1000).startswith(truncated)
+
+
+class Model:
+    """
+    Answers every call with answer_tokens tokens of text and records the input tokens of each call.
+    """
+
+    def __init__(self, answer_tokens: int):
+        self.answer = "x" * (answer_tokens * 4 - 4)
+        self.calls = []
+
+    async def ainvoke(self, messages):
+        self.calls.append((messages[0].content, count_tokens(messages[1].content)))
+
+        class Response:
+            content = self.answer
+        return Response()
+
+
+def test_input_that_fits_is_answered_in_one_call():
+    model = Model(10)
+    assert asyncio.run(amap_reduce(["a" * 40, "b" * 40], "map", "merge", model, max_tokens=100)) == model.answer
+    assert [instructions for instructions, _ in model.calls] == ["map"]
+
+
+def test_partials_are_merged_in_packed_groups_until_one_is_left():
+    model = Model(10)
+    asyncio.run(amap_reduce(["w" * 396] * 16, "map", "merge", model, max_tokens=100))
+    maps = [tokens for instructions, tokens in model.calls if instructions == "map"]
+    merges = [tokens for instructions, tokens in model.calls if instructions == "merge"]
+    assert len(maps) == 16
+    # 16 answers of 10 tokens are packed 8 to a call: two merges, then one more
+    assert len(merges) == 3
+    assert max(tokens for _, tokens in model.calls) <= 100
+
+
+def test_partials_too_large_to_merge_are_truncated_to_fit():
+    model = Model(80)
+    asyncio.run(amap_reduce(["w" * 396] * 5, "map", "merge", model, max_tokens=100))
+    merges = [tokens for instructions, tokens in model.calls if instructions == "merge"]
+    # Every level halves the number of partials, and no call exceeds the budget
+    assert len(merges) == 3 + 2 + 1
+    assert max(tokens for _, tokens in model.calls) <= 100
@@ -0,0 +1,69 @@
+import pytest
+
+from discovery import BloomFilter, Frontier, in_scope, normalize_url, url_key
+
+
+@pytest.mark.parametrize("url, base, expected", [
+    ("HTTP://Example.ORG:80/About#team", None, "http://example.org/About"),
+    ("https://example.org:8443/", None, "https://example.org:8443/"),
+    ("../events/?utm_source=x&b=2&a=1&fbclid=y", "https://example.org/news/post/", "https://example.org/news/events/?a=1&b=2"),
+    ("https://example.org/a/./b/../c", None, "https://example.org/a/c"),
+    ("https://example.org", None, "https://example.org/"),
+    ("mailto:info@example.org", None, None),
+    ("javascript:void(0)", "https://example.org/", None),
+    ("https://example.org:notaport/", None, None),
+])
+def test_normalize_url(url, base, expected):
+    assert normalize_url(url, base) == expected
+
+
+def test_url_key_ignores_the_trailing_slash():
+    assert url_key("https://example.org/about/") == url_key("https://example.org/about")
+    assert url_key("https://example.org") == "https://example.org/"
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://example.org/org", True),
+    ("https://example.org/org/", True),
+    ("https://example.org/org/events?page=2", True),
+    ("https://example.org/organic", False),
+    ("https://example.org/", False),
+    ("http://example.org/org/events", False),
+    ("https://example.org.evil.com/org/events", False),
+    ("https://sub.example.org/org/events", False),
+])
+def test_in_scope_of_a_base_path(url, expected):
+    assert in_scope(url, "https://Example.org/org/") is expected
+
+
+def test_in_scope_of_a_site_root():
+    assert in_scope("https://example.org/anything", "https://example.org")
+    assert not in_scope("https://example.com/anything", "https://example.org")
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    added = [f"https://example.org/page/{i}" for i in range(5000)]
+    # A new item is taken for a seen one only on a false positive
+    new = sum(bloom.add(url) for url in added)
+    assert new > 5000 * 0.99
+    assert len(bloom) == new
+    assert all(url in bloom for url in added)
+    assert not bloom.add(added[0])
+    # The filter grew past its first capacity and keeps the overall error rate
+    false_positives = sum(f"https://example.org/other/{i}" in bloom for i in range(10000))
+    assert false_positives / 10000 < 0.01
+
+
+def test_frontier_queues_every_page_once_in_order():
+    frontier = Frontier()
+    assert frontier.add("https://example.org/a", 0)
+    assert frontier.add("https://example.org/b/", 1)
+    assert not frontier.add("https://example.org/a/", 2)
+    assert not frontier.add("https://example.org/b", 2)
+    assert len(frontier) == 2
+    assert frontier.take(1) == [("https://example.org/a", 0)]
+    assert frontier.take(5) == [("https://example.org/b/", 1)]
+    assert frontier.take(5) == []
+    # Taken pages stay seen
+    assert not frontier.add("https://example.org/a")
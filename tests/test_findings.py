@@ -0,0 +1,47 @@
+from findings import consolidate_findings, consolidate_report_findings, consolidated_blocks, normalize_finding
+
+
+def test_spellings_of_the_same_finding_are_merged():
+    findings = [("Clear mission statement.", "https://example.org/"), ("clear mission statement", "https://example.org/about"),
+                ("CLEAR MISSION STATEMENT!", "https://example.org/")]
+    assert consolidate_findings(findings) == [
+        {"finding": "Clear mission statement.", "urls": ["https://example.org/", "https://example.org/about"]}]
+
+
+def test_similar_wordings_are_clustered_and_different_ones_kept_apart():
+    findings = [
+        ("The donation page is hard to find", "a"),
+        ("The donation page is hard to find from the homepage", "b"),
+        ("Photos show volunteers at community events", "c"),
+        ("The donation page is hard to find", "d"),
+    ]
+    assert consolidate_findings(findings, threshold=0.5) == [
+        {"finding": "The donation page is hard to find", "urls": ["a", "b", "d"]},
+        {"finding": "Photos show volunteers at community events", "urls": ["c"]},
+    ]
+
+
+def test_a_high_threshold_keeps_variants_apart():
+    findings = [("The donation page is hard to find", "a"), ("The donation page is hard to find from the homepage", "b")]
+    assert len(consolidate_findings(findings, threshold=0.99)) == 2
+
+
+def test_empty_findings_are_dropped():
+    assert consolidate_findings([("", "a"), ("!!", "b")]) == []
+    assert normalize_finding("  Hello, World! ") == "hello world"
+
+
+def test_report_findings_and_their_blocks():
+    output_reports = {
+        "https://example.org/": {"Donors": {"benefits": ["Clear mission"], "drawbacks": ["No donate button"]}},
+        "https://example.org/events": {"Donors": {"benefits": ["clear mission"], "drawbacks": []}},
+    }
+    consolidated = consolidate_report_findings(output_reports, "Donors")
+    assert consolidated == {
+        "benefits": [{"finding": "Clear mission", "urls": ["https://example.org/", "https://example.org/events"]}],
+        "drawbacks": [{"finding": "No donate button", "urls": ["https://example.org/"]}],
+    }
+    assert consolidated_blocks(consolidated) == [
+        "Benefit (found on 2 pages): Clear mission\nPages on https://example.org: /, /events",
+        "Drawback (found on 1 page): No donate button\nPages on https://example.org: /",
+    ]
@@ -0,0 +1,149 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+
+from http_client import DisallowedByRobots, HostLimiter, HttpClient, parse_crawl_delay, parse_retry_after
+
+
+def test_the_limit_grows_on_healthy_responses_and_halves_on_throttling():
+    async def run():
+        limiter = HostLimiter(initial=4, maximum=6)
+        for _ in range(8):
+            await limiter.acquire()
+            await limiter.release(0.01, ok=True)
+        grown = limiter.limit
+        await limiter.acquire()
+        await limiter.release(0.01, ok=False, throttled=True)
+        halved = limiter.limit
+        # A second failure within the same round trip is the same congestion event
+        await limiter.acquire()
+        await limiter.release(0.01, ok=False)
+        return grown, halved, limiter.limit, limiter.throttled, limiter.errors
+
+    grown, halved, after, throttled, errors = asyncio.run(run())
+    assert 5.5 < grown <= 6
+    assert halved == pytest.approx(grown / 2)
+    assert after == halved
+    assert (throttled, errors) == (1, 1)
+
+
+def test_retry_after_pauses_every_request_to_the_host():
+    async def run():
+        limiter = HostLimiter(initial=2)
+        await limiter.acquire()
+        await limiter.release(0.01, ok=False, throttled=True, retry_after=0.2)
+        start = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.19
+
+
+def test_the_concurrency_limit_is_enforced():
+    async def run():
+        limiter = HostLimiter(initial=1)
+        await limiter.acquire()
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.05)
+        blocked = not second.done()
+        await limiter.release(0.01, ok=True)
+        await asyncio.wait_for(second, 1)
+        return blocked
+
+    assert asyncio.run(run())
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("100000") == 120.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_parse_crawl_delay():
+    lines = ["User-agent: *", "Crawl-delay: 2", "", "User-agent: MyApp", "Disallow: /private", "Crawl-delay: 0.5"]
+    assert parse_crawl_delay(lines, "MyApp") == 0.5
+    assert parse_crawl_delay(lines, "OtherBot") == 2.0
+    assert parse_crawl_delay(["User-agent: *", "Disallow:"], "MyApp") is None
+
+
+class Site:
+    """
+    A local site whose pages fail a given number of times with a given status before answering 200.
+    """
+
+    def __init__(self, failures: dict, robots: str = ""):
+        self.failures = failures
+        self.robots = robots
+        self.hits = {}
+
+    async def handle(self, request):
+        path = request.path
+        if path == "/robots.txt":
+            return web.Response(text=self.robots) if self.robots else web.Response(status=404)
+        self.hits.setdefault(path, []).append(time.monotonic())
+        status, count, headers = self.failures.get(path, (200, 0, {}))
+        if len(self.hits[path]) <= count:
+            return web.Response(status=status, headers=headers)
+        return web.Response(text=f"page {path}")
+
+    async def fetch(self, paths: list, **client_options):
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self.handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+        async def get(client, path):
+            async with client.get(base_url + path) as response:
+                return response.status, await response.text()
+
+        try:
+            async with HttpClient(**client_options) as client:
+                results = await asyncio.gather(*(get(client, path) for path in paths), return_exceptions=True)
+                return results, client.limiter(base_url.split("://")[1])
+        finally:
+            await runner.cleanup()
+
+
+def test_throttled_requests_are_retried_after_retry_after():
+    site = Site({"/busy": (429, 1, {"Retry-After": "0.3"})})
+    results, limiter = asyncio.run(site.fetch(["/busy"]))
+    assert results == [(200, "page /busy")]
+    first, second = site.hits["/busy"]
+    assert second - first >= 0.29
+    assert limiter.throttled == 1
+
+
+@pytest.fixture
+def short_backoff(monkeypatch):
+    monkeypatch.setattr(HttpClient, "_backoff", lambda self, attempt: 0.01)
+
+
+def test_server_errors_are_retried_without_pausing_the_host(short_backoff):
+    site = Site({"/broken": (500, 2, {})})
+    results, limiter = asyncio.run(site.fetch(["/broken", "/ok"]))
+    assert results == [(200, "page /broken"), (200, "page /ok")]
+    assert len(site.hits["/broken"]) == 3
+    assert limiter.errors >= 1
+    assert limiter.paused_until == 0.0
+
+
+def test_the_last_failure_is_returned_after_max_retries(short_backoff):
+    site = Site({"/down": (503, 10, {})})
+    results, _ = asyncio.run(site.fetch(["/down"], max_retries=1))
+    assert results[0][0] == 503
+    assert len(site.hits["/down"]) == 2
+
+
+def test_robots_txt_is_respected():
+    site = Site({}, robots="User-agent: *\nDisallow: /private\n")
+    results, _ = asyncio.run(site.fetch(["/private/page", "/public"]))
+    assert isinstance(results[0], DisallowedByRobots)
+    assert results[1] == (200, "page /public")
+    assert "/private/page" not in site.hits
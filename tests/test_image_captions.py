@@ -0,0 +1,22 @@
+from image_captions import pack_batches, parse_batch_captions
+
+
+def test_captions_are_keyed_by_their_position_in_the_batch():
+    text = "<image1>A choir on stage.</image1>\n<image_2> Volunteers packing boxes </image_2>"
+    assert parse_batch_captions(text, 2) == {0: "A choir on stage.", 1: "Volunteers packing boxes"}
+
+
+def test_missing_empty_and_out_of_range_captions_are_left_out():
+    text = "<image1></image1><image3>Extra</image3><image2>Second</image2><image2>Again</image2>"
+    assert parse_batch_captions(text, 2) == {1: "Second"}
+    assert parse_batch_captions("", 2) == {}
+    assert parse_batch_captions(None, 2) == {}
+
+
+def test_mismatched_tags_are_ignored():
+    assert parse_batch_captions("<image1>First</image2>", 2) == {}
+
+
+def test_batches_respect_the_image_count_and_the_byte_budget():
+    prepared = {name: (b"x" * size, "image/png") for name, size in [("a", 4), ("b", 4), ("c", 4), ("d", 20), ("e", 1)]}
+    assert pack_batches(prepared, batch_size=2, max_batch_bytes=10) == [["a", "b"], ["c"], ["d"], ["e"]]
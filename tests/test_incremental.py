@@ -0,0 +1,75 @@
+import json
+
+from incremental import IncrementalArtifact, content_hash, diff_pages, hashes_path
+
+
+def write(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def read(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def run(path, cells, compute):
+    """
+    Recomputes the stale cells of {(page, stakeholder): input} the way the audits do and returns the artifact.
+    """
+    artifact = IncrementalArtifact(str(path))
+    for (page, stakeholder), value in cells.items():
+        cell_hash = content_hash(value, stakeholder)
+        if artifact.is_fresh(page, stakeholder, cell_hash):
+            continue
+        artifact.reserve(page, stakeholder)
+        artifact.set(page, stakeholder, compute(value), cell_hash)
+    artifact.save()
+    return artifact
+
+
+def test_only_stale_cells_are_recomputed(tmp_path):
+    path = tmp_path / "audit.json"
+    run(path, {("a", "Staff"): "one", ("b", "Staff"): "two"}, str.upper)
+    computed = []
+    artifact = run(path, {("a", "Staff"): "one", ("b", "Staff"): "changed"}, lambda value: computed.append(value) or "new")
+    assert computed == ["changed"]
+    assert (artifact.reused, artifact.computed) == (1, 1)
+    assert read(path) == {"a": {"Staff": "ONE"}, "b": {"Staff": "new"}}
+
+
+def test_removed_pages_are_dropped(tmp_path):
+    path = tmp_path / "audit.json"
+    run(path, {("a", "Staff"): "one", ("b", "Staff"): "two"}, str.upper)
+    artifact = run(path, {("a", "Staff"): "one"}, str.upper)
+    assert artifact.removed_pages() == ["b"]
+    assert read(path) == {"a": {"Staff": "ONE"}}
+    assert read(hashes_path(str(path))) == {"a": {"Staff": content_hash("one", "Staff")}}
+
+
+def test_cells_stored_without_a_hash_are_retried(tmp_path):
+    path = tmp_path / "audit.json"
+    artifact = IncrementalArtifact(str(path))
+    artifact.set("a", "Staff", "")
+    artifact.save()
+    computed = []
+    run(path, {("a", "Staff"): "one"}, lambda value: computed.append(value) or "ONE")
+    assert computed == ["one"]
+
+
+def test_legacy_artifacts_without_hashes_are_adopted(tmp_path):
+    path = tmp_path / "audit.json"
+    write(path, {"a": {"Staff": "old"}})
+    artifact = run(path, {("a", "Staff"): "one", ("b", "Staff"): "two"}, str.upper)
+    assert artifact.legacy
+    assert read(path) == {"a": {"Staff": "old"}, "b": {"Staff": "TWO"}}
+    # The adopted cell has a hash from now on, so a change of its input is detected
+    artifact = run(path, {("a", "Staff"): "changed", ("b", "Staff"): "two"}, str.upper)
+    assert not artifact.legacy
+    assert read(path)["a"]["Staff"] == "CHANGED"
+
+
+def test_diff_pages():
+    old = {"a": {"text": "one"}, "b": {"text": "two"}, "c": {"text": "three"}}
+    new = {"a": {"text": "one"}, "b": {"text": "2"}, "d": {"text": "four"}}
+    assert diff_pages(old, new) == {"added": ["d"], "removed": ["c"], "changed": ["b"], "unchanged": ["a"]}
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import pytest
+
+import llm_executor
+from llm_executor import LLMExecutor, RateLimiter, TokenBucket
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+class FakeModel:
+    """
+    Answers each input with its upper-case text after a delay, failing the inputs listed in failures a number of times.
+    """
+
+    def __init__(self, delays=None, failures=None, error=RateLimited):
+        self.delays = delays or {}
+        self.failures = dict(failures or {})
+        self.error = error
+        self.attempts = []
+
+    async def ainvoke(self, value):
+        self.attempts.append(value)
+        await asyncio.sleep(self.delays.get(value, 0))
+        if self.failures.get(value):
+            self.failures[value] -= 1
+            raise self.error(value)
+        return value.upper()
+
+
+def executor(**kwargs):
+    return LLMExecutor(rate_limiter=RateLimiter(requests_per_minute=None), base_delay=0.01, **kwargs)
+
+
+def test_map_keeps_the_order_of_inputs():
+    model = FakeModel(delays={"a": 0.05, "b": 0.0, "c": 0.02})
+    assert asyncio.run(executor().map(model, ["a", "b", "c"])) == ["A", "B", "C"]
+
+
+def test_map_retries_rate_limits_with_exponential_backoff(monkeypatch):
+    bounds = []
+    monkeypatch.setattr(llm_executor.random, "uniform", lambda low, high: bounds.append(high) or 0.0)
+    model = FakeModel(failures={"a": 3})
+    runner = LLMExecutor(rate_limiter=RateLimiter(requests_per_minute=None), base_delay=0.5, max_delay=1.5)
+    assert asyncio.run(runner.map(model, ["a"])) == ["A"]
+    assert model.attempts == ["a"] * 4
+    assert runner.retries == 3
+    assert bounds == [0.5, 1.0, 1.5]
+
+
+def test_map_does_not_retry_other_errors():
+    model = FakeModel(failures={"a": 1}, error=ValueError)
+    with pytest.raises(ValueError):
+        asyncio.run(executor().map(model, ["a"]))
+    assert model.attempts == ["a"]
+
+
+def test_map_returns_exceptions_in_their_slot():
+    model = FakeModel(failures={"b": 10})
+    results = asyncio.run(executor(max_retries=1).map(model, ["a", "b", "c"], return_exceptions=True))
+    assert results[0] == "A" and results[2] == "C"
+    assert isinstance(results[1], RateLimited)
+    assert model.attempts.count("b") == 2
+
+
+def test_map_caps_the_calls_in_flight():
+    in_flight = peak = 0
+
+    class Model:
+        async def ainvoke(self, value):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return value
+
+    async def run():
+        return await executor(concurrency=3).map(Model(), list(range(10)))
+
+    assert asyncio.run(run()) == list(range(10))
+    assert peak == 3
+
+
+def test_token_bucket_waits_for_the_refill():
+    async def run():
+        bucket = TokenBucket(capacity=2, refill_per_second=20)
+        start = time.monotonic()
+        for _ in range(4):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # Two tokens are available at once, the other two take 1/20 s each
+    assert 0.08 <= asyncio.run(run()) < 0.5
+
+
+def test_token_bucket_clips_amounts_above_its_capacity():
+    async def run():
+        bucket = TokenBucket(capacity=5, refill_per_second=1000)
+        await bucket.acquire(50)
+        return bucket.tokens
+
+    assert asyncio.run(run()) == pytest.approx(0, abs=0.5)
+
+
+def test_token_bucket_does_not_hold_its_lock_while_waiting():
+    async def run():
+        bucket = TokenBucket(capacity=1, refill_per_second=10)
+        await bucket.acquire()
+        waiter = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0.01)
+        # The waiter sleeps outside the lock, so the bucket can still be inspected meanwhile
+        locked = bucket._lock.locked()
+        await waiter
+        return locked
+
+    assert asyncio.run(run()) is False
@@ -0,0 +1,88 @@
+import random
+
+import pytest
+
+from near_duplicates import BITS, NearDuplicateIndex, near_duplicate_representatives, simhash, similarity
+
+WORDS = [f"word{i}" for i in range(2000)]
+
+
+def text(seed: int, length: int = 300) -> str:
+    return " ".join(random.Random(seed).choices(WORDS, k=length))
+
+
+def edit(original: str, changes: int, seed: int) -> str:
+    words = original.split()
+    rng = random.Random(seed)
+    for _ in range(changes):
+        words[rng.randrange(len(words))] = f"edit{rng.random()}"
+    return " ".join(words)
+
+
+def test_simhash_is_stable_and_close_for_similar_texts():
+    page = text(1)
+    assert simhash(page) == simhash(page)
+    assert simhash("") == 0
+    assert similarity(simhash(page), simhash(edit(page, 2, 0))) > similarity(simhash(page), simhash(text(2)))
+
+
+def test_index_finds_near_duplicates_only():
+    index = NearDuplicateIndex(threshold=0.9)
+    page = text(1)
+    assert index.add("a", page) == []
+    assert index.add("b", text(2)) == []
+    assert index.add("c", page + " footer") == ["a"]
+    assert index.query(simhash(text(3))) == []
+
+
+def test_index_matches_every_fingerprint_within_the_distance():
+    index = NearDuplicateIndex(threshold=0.95)
+    assert index.max_distance == 3
+    index.add_fingerprint("a", 0)
+    assert index.query((1 << 0) | (1 << 20) | (1 << 63)) == ["a"]
+    assert index.query((1 << 0) | (1 << 20) | (1 << 40) | (1 << 63)) == []
+
+
+@pytest.mark.parametrize("threshold", [0.8, 0.85])
+def test_thresholds_with_narrow_bands_are_rejected(threshold):
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(threshold)
+
+
+def test_an_exact_threshold_uses_one_band():
+    index = NearDuplicateIndex(threshold=1.0)
+    index.add_fingerprint("a", (1 << BITS) - 1)
+    assert index.query((1 << BITS) - 1) == ["a"]
+    assert index.query((1 << BITS) - 2) == []
+
+
+def test_pages_join_the_cluster_of_their_representative():
+    page = text(1)
+    website_map = {
+        "https://example.org/a": {"text": page},
+        "https://example.org/b": {"text": text(2)},
+        "https://example.org/a?page=1": {"text": page},
+        "https://example.org/empty": {"text": " "},
+        "https://example.org/empty2": {"text": ""},
+    }
+    assert near_duplicate_representatives(website_map, 0.95) == {
+        "https://example.org/a": "https://example.org/a",
+        "https://example.org/b": "https://example.org/b",
+        "https://example.org/a?page=1": "https://example.org/a",
+        "https://example.org/empty": "https://example.org/empty",
+        "https://example.org/empty2": "https://example.org/empty2",
+    }
+
+
+def test_chains_of_small_edits_are_not_merged_transitively():
+    threshold = 0.95
+    website_map, page = {}, text(1)
+    for i in range(30):
+        website_map[f"page{i}"] = {"text": page}
+        page = edit(page, 6, i)
+    representatives = near_duplicate_representatives(website_map, threshold)
+    max_distance = int((1 - threshold) * BITS)
+    for url, representative in representatives.items():
+        distance = bin(simhash(website_map[url]["text"]) ^ simhash(website_map[representative]["text"])).count("1")
+        assert distance <= max_distance
+    assert len(set(representatives.values())) > 1
@@ -1,9 +1,19 @@
+import asyncio
 import time
+from urllib.parse import urljoin
 from bs4 import BeautifulSoup
-import re, requests, json
-from concurrent.futures import ThreadPoolExecutor
-from dotenv import load_dotenv
-load_dotenv()
+import re
+import aiohttp
+from incremental import add_page_hashes
+from artifact_store import save_artifact
+from boilerplate import chrome_path_for, strip_boilerplate
+from discovery import Frontier, discover_urls, in_scope, normalize_url, url_key
+from http_client import HEADERS, DisallowedByRobots, HttpClient
+from telemetry import traced
+
+ASSET_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.svg', '.ico', '.pdf', '.zip',
+                    '.mp3', '.mp4', '.mov', '.css', '.js', '.xml', '.doc', '.docx')
+
 
 def get_content(url):
     """
@@ -14,14 +24,35 @@ def get_content(url):
         str or None: The HTML content of the website if the request is successful (status code 200),
                      otherwise None.
     """
-    headers = {'User-Agent': 'MyApp/1.0'}
-    response = requests.get(url, headers=headers)
+    import requests  # Only this synchronous helper uses requests; the crawl uses aiohttp
+
+    response = requests.get(url, headers=HEADERS)
     if response.status_code != 200:
         return None
     html_content = response.text
     return html_content
 
 
+def _text_from_soup(soup: BeautifulSoup) -> str:
+    visible_text = soup.get_text()  # Extract all visible text
+    return re.sub(r'\n{3,}', '\n', visible_text)
+
+
+def _links_from_soup(soup: BeautifulSoup, base_url: str, page_url: str = None) -> list:
+    # Relative links are resolved against the page (or its <base href>) and every link is canonicalized,
+    # so spelling variants of a URL are one link
+    page_url = page_url or base_url
+    base_tag = soup.find('base', href=True)
+    if base_tag:
+        page_url = urljoin(page_url, base_tag['href'])
+    links = {}
+    for anchor in soup.find_all('a', href=True):
+        link = normalize_url(anchor['href'], page_url)
+        if link and in_scope(link, base_url):
+            links.setdefault(url_key(link), link)
+    return list(links.values())
+
+
 def get_text_from_html(html_content: str) -> str:
     """
     Extracts visible text from HTML content.
@@ -30,10 +61,22 @@ def get_text_from_html(html_content: str) -> str:
     Returns:
         str: The visible text extracted from the HTML content.
     """
+    return _text_from_soup(BeautifulSoup(html_content, 'html.parser'))
+
+
+def parse_html(html_content: str, base_url: str, page_url: str = None) -> tuple[str, list]:
+    """
+    Parses HTML content once and extracts both its visible text and its links.
+    Args:
+        html_content (str): The HTML content to parse.
+        base_url (str): Only links under this URL are kept.
+        page_url (str, optional): The URL of the page, which relative links are resolved against. Defaults to base_url.
+    Returns:
+        tuple: The visible text and the de-duplicated list of canonical links under base_url.
+    """
     soup = BeautifulSoup(html_content, 'html.parser')
-    visible_text = soup.get_text()  # Extract all visible text
-    visible_text = re.sub(r'\n{3,}', '\n', visible_text)
-    return visible_text
+    return _text_from_soup(soup), _links_from_soup(soup, base_url, page_url)
+
 
 def get_links_from_website(url:str) -> list:
     """
@@ -46,112 +89,156 @@ def get_links_from_website(url:str) -> list:
     html_content = get_content(url)
     if html_content is None:
         return []
-    soup = BeautifulSoup(html_content, 'html.parser')
-    links = soup.find_all('a', href=True)
-    soup = BeautifulSoup(get_content(url), 'html.parser')
-    links = soup.find_all('a', href=True)
-    return [link['href'] for link in links if link['href'].startswith(url)]
+    return _links_from_soup(BeautifulSoup(html_content, 'html.parser'), url)
+
+
+def is_page_link(link: str) -> bool:
+    """
+    Returns True if a link looks like an HTML page worth crawling rather than an asset such as an image.
+    """
+    path = link.split('#')[0].split('?')[0].lower()
+    return not path.endswith(ASSET_EXTENSIONS)
+
 
-def process_link(link:str, base_url:str, content_map:dict):
+async def fetch_page(client: HttpClient, url: str, base_url: str):
     """
-    Processes a given link by fetching its content, extracting text and sub-links, 
-    and updating the content map with the extracted information.
+    Fetches a single page and parses it for text and links.
     Args:
-        link (str): The URL of the link to process.
-        base_url (str): The base URL to filter sub-links.
-        content_map (dict): A dictionary to store the processed content and links.
+        client (HttpClient): The HTTP client used for every request of the crawl.
+        url (str): The URL of the page to fetch.
+        base_url (str): The base URL used to filter links.
     Returns:
-        dict or None: The updated content map if the link was processed successfully, 
-                      or None if the link was already in the content map or if the content could not be fetched.
+        tuple or None: The visible text and links of the page, or None if the page is not a 200 HTML response.
     """
-
-    if link in content_map:
+    try:
+        async with client.get(url) as response:
+            if response.status != 200:
+                return None
+            if 'html' not in response.headers.get('Content-Type', 'text/html'):
+                return None
+            html_content = await response.text()
+    except DisallowedByRobots:
         return None
-    html_content = get_content(link)
-    if html_content is None:
+    except (aiohttp.ClientError, asyncio.TimeoutError, UnicodeDecodeError) as e:
+        print(f"Error fetching {url}: {e}")
         return None
+    return parse_html(html_content, base_url, url)
+
 
-    text = get_text_from_html(html_content)
-    sub_links = get_links_from_website(link)
-    filtered_sub_links = [l for l in sub_links if l.startswith(base_url)]
+@traced("crawl", count=len)
+async def crawl_content_map(base_url: str, seed_urls: list = None, max_depth: int = 3, max_pages: int = 500,
+                            concurrency: int = 10, timeout: float = 30, on_page=None, discover: bool = True) -> dict:
+    """
+    Crawls a website breadth-first with a single pooled HTTP client, fetching each URL exactly once.
+    Links are canonicalized (see discovery.normalize_url), so relative links are followed and the spelling
+    variants of a URL (fragments, tracking parameters, a trailing slash) are crawled once.
+    Args:
+        base_url (str): The URL the crawl starts from. Only links under it are followed.
+        seed_urls (list, optional): Extra URLs crawled at depth 0 alongside base_url.
+        max_depth (int): The number of link hops followed from the seed URLs.
+        max_pages (int): The maximum number of pages kept in the content map.
+        concurrency (int): The maximum number of simultaneous connections.
+        timeout (float): The total timeout in seconds for a single request.
+        on_page (async callable, optional): Awaited with (url, page data) as soon as each page is fetched, so
+            later stages can start on it before the crawl ends; a slow callback slows the crawl down.
+        discover (bool): Also seed the crawl with the pages listed in the site's sitemaps and feeds,
+            which finds pages no link leads to.
+    Returns:
+        dict: A dictionary where keys are URLs and values are dictionaries containing 'text' and 'links' keys.
+    """
+    async def fetch(url):
+        page = await fetch_page(client, url, base_url)
+        if page is not None and on_page is not None:
+            await on_page(url, {'text': page[0], 'links': page[1]})
+        return page
 
-    content_map[link] = {
-        'text': text,
-        'links': filtered_sub_links
-    }
+    content_map = {}
+    frontier = Frontier(capacity=max(10_000, max_pages * 20))
+    frontier.add(base_url)
+    for url in seed_urls or []:
+        url = normalize_url(url)
+        if url:
+            frontier.add(url)
+    # The concurrency on the site starts low and adapts to how fast it answers and whether it throttles us
+    async with HttpClient(max_connections=concurrency, max_per_host=concurrency, initial_per_host=min(4, concurrency),
+                          timeout=timeout) as client:
+        if discover:
+            discovered = [url for url in await discover_urls(client, base_url, max_pages) if frontier.add(url)]
+            if discovered:
+                print(f"Found {len(discovered)} pages in the sitemaps and feeds of {base_url}")
+        while frontier and len(content_map) < max_pages:
+            batch = frontier.take(max_pages - len(content_map))
+            pages = await asyncio.gather(*(fetch(url) for url, _ in batch))
+            for (url, depth), page in zip(batch, pages):
+                if page is None:
+                    continue
+                text, links = page
+                content_map[url] = {'text': text, 'links': links}
+                if depth < max_depth:
+                    for link in links:
+                        if is_page_link(link):
+                            frontier.add(link, depth + 1)
     return content_map
 
-def create_content_map(links:list[str], base_url:str, base_text:str, base_links:list[str]) -> dict:
+
+def create_content_map(base_url: str, seed_urls: list = None, max_depth: int = 3, max_pages: int = 500,
+                       concurrency: int = 10, discover: bool = True) -> dict:
     """
-    Creates a content map by processing a list of links and associating them with their respective text and links.
+    Creates a content map by crawling the website breadth-first from the base URL.
     Args:
-        links (list): A list of URLs to process.
-        base_url (str): The base URL to initialize the content map.
-        base_text (str): The text content associated with the base URL.
-        base_links (list): A list of links associated with the base URL.
+        base_url (str): The base URL to start crawling from.
+        seed_urls (list, optional): Extra URLs crawled at depth 0 alongside base_url.
+        max_depth (int): The number of link hops followed from the seed URLs.
+        max_pages (int): The maximum number of pages kept in the content map.
+        concurrency (int): The maximum number of simultaneous connections.
+        discover (bool): Also seed the crawl with the pages listed in the site's sitemaps and feeds.
     Returns:
         dict: A dictionary where keys are URLs and values are dictionaries containing 'text' and 'links' keys.
     """
-    
-    # Initialize the content map with the base URL's data
-    content_map = {
-        base_url: {
-            'text': base_text,
-            'links': base_links
-        }
-    }
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(process_link, link, base_url, content_map)
-            for link in links
-        ]
-        for future in futures:
-            try:
-                future.result()  # Ensure all threads complete
-            except Exception as e:
-                print(f"Error processing a link: {e}")
-    return content_map
+    return asyncio.run(crawl_content_map(base_url, seed_urls, max_depth, max_pages, concurrency, discover=discover))
+
 
-def run_content_map_creation(base_url:str,output_file_path=None)-> dict:
+def run_content_map_creation(base_url:str,output_file_path=None, max_depth: int = 3, max_pages: int = 500,
+                             concurrency: int = 10, strip_chrome: bool = True, discover: bool = True)-> dict:
     """
-    Fetches the content from the base URL, extracts links, and creates a content map.
+    Crawls the website from the base URL and creates a content map.
     This function performs the following steps:
-    1. Fetches the HTML content from the base URL.
-    2. Extracts text and links from the base HTML content.
-    3. Filters the links to include only those that start with the base URL.
-    4. Uses a ThreadPoolExecutor to fetch the content of each link concurrently.
-    5. Filters the links to include only those with a status code of 200.
-    6. Creates a content map from the filtered links, base URL, base text, and base links.
-    7. Optionally writes the content map to a JSON file if an output file path is provided.
+    1. Crawls the site breadth-first from the base URL (and, with discover, the pages listed in its sitemaps
+       and feeds) up to max_depth link hops and max_pages pages.
+    2. Fetches every URL exactly once and parses it once for both its text and its links.
+    3. Keeps only pages that answer with a status code of 200 and an HTML body.
+    4. Optionally strips the header, nav menu and footer repeated across pages and keeps them once as the site chrome,
+       written to site_chrome.json next to the content map.
+    5. Stores the content hash of every page's text so later runs can detect changed pages.
+    6. Optionally writes the content map to a JSON file if an output file path is provided.
     Args:
         base_url (str): The base URL to fetch content from.
         output_file_path (str, optional): The file path to write the content map to. Defaults to None.
+        max_depth (int): The number of link hops followed from the base URL.
+        max_pages (int): The maximum number of pages to crawl.
+        concurrency (int): The maximum number of simultaneous connections.
+        strip_chrome (bool): Strip the blocks repeated across pages, recording the bytes removed from each page.
+        discover (bool): Also seed the crawl with the pages listed in the site's sitemaps and feeds.
     Returns:
         dict: The content map created from the base URL and its links.
     """
-    status_codes = {}
-    base_html_content = get_content(base_url)
-    if base_html_content is None:
-        print(f"Failed to fetch base URL: {base_url}")
-        return
-
-    base_text = get_text_from_html(base_html_content)
-    base_links = get_links_from_website(base_url)
-    base_links = [link for link in base_links if link.startswith(base_url)]
     start = time.time()
-    with ThreadPoolExecutor() as executor:
-        futures = {executor.submit(requests.get, link): link for link in base_links}
-        for future in futures:
-            link = futures[future]
-            response = future.result()
-            status_codes[link] = response.status_code
+    content_map = create_content_map(base_url, max_depth=max_depth, max_pages=max_pages, concurrency=concurrency,
+                                     discover=discover)
     end = time.time()
-    base_links = [link for link in base_links if status_codes[link] == 200]
-    content_map = create_content_map(base_links, base_url, base_text, base_links)
-    # Write the content map to a JSON file
+    if base_url not in content_map:
+        print(f"Failed to fetch base URL: {base_url}")
+        return
+    print(f"Crawled {len(content_map)} pages in {end - start:.2f}s")
+    chrome = ""
+    if strip_chrome:
+        removed, chrome = strip_boilerplate(content_map)
+        if removed:
+            print(f"Stripped {sum(removed.values())} bytes of site chrome from {len(removed)} pages "
+                  f"(max {max(removed.values())} bytes per page)")
+    add_page_hashes(content_map)
+    # Write the content map to its JSON file, or to the artifact store when one is configured
     if output_file_path:
-        with open(output_file_path, 'w', encoding='utf-8') as json_file:
-            json.dump(content_map, json_file, indent=4, ensure_ascii=False)
+        save_artifact(output_file_path, content_map)
+        save_artifact(chrome_path_for(output_file_path), {'text': chrome})
     return content_map
-
-